@@ -0,0 +1,62 @@
+# coding=utf-8
+"""Helpers shared by the pasta benchmarks."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+_FUNCTION_TEMPLATE = '''\
+# Helper number {i}.
+def func_{i}(a, b=1, *args):
+  """Docstring for func_{i}."""
+  total = a + b * {i}  # Trailing comment
+  if total > 10 and not args:
+    return [total, a,
+            b]
+  elif total:
+    values = {{a: b, b: total}}
+  else:
+    values = (a, b)
+  for x in values:
+    total += x
+  return total
+
+'''
+
+
+def generate_module(num_functions):
+  """Generate the source of a module with the given number of functions."""
+  header = 'import os\nimport sys\nfrom collections import defaultdict\n\n'
+  return header + ''.join(_FUNCTION_TEMPLATE.format(i=i)
+                          for i in range(num_functions)).rstrip() + '\n'
+
+
+def best_time(func, number=1, repeat=5):
+  """Get the best time in seconds out of several runs of a function."""
+  return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def report(name, seconds, baseline=None):
+  line = '%-40s %10.3f ms' % (name, seconds * 1000)
+  if baseline:
+    line += '  (%.1fx)' % (baseline / seconds)
+  print(line)
@@ -0,0 +1,56 @@
+# coding=utf-8
+"""Benchmark parsing with a cold and a warm AnnotationCache."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import shutil
+import tempfile
+
+import bench_utils
+
+import pasta
+from pasta.base import cache
+
+
+def main():
+  directory = tempfile.mkdtemp()
+  try:
+    c = cache.AnnotationCache(directory)
+    for num_functions in (10, 100, 1000):
+      src = bench_utils.generate_module(num_functions)
+
+      def miss():
+        c.clear()
+        pasta.parse(src, cache=c)
+
+      def hit():
+        pasta.parse(src, cache=c)
+
+      print('%d lines:' % src.count('\n'))
+      no_cache = bench_utils.best_time(lambda: pasta.parse(src))
+      bench_utils.report('  parse, no cache', no_cache)
+      bench_utils.report('  parse, cache miss', bench_utils.best_time(miss),
+                         no_cache)
+      bench_utils.report('  parse, cache hit', bench_utils.best_time(hit),
+                         no_cache)
+  finally:
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+  main()
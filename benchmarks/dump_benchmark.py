@@ -0,0 +1,51 @@
+# coding=utf-8
+"""Benchmark dumping a large module after renaming a single function."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import bench_utils
+
+import pasta
+from pasta.base import codegen
+
+
+def main():
+  for num_functions in (10, 100, 1000):
+    src = bench_utils.generate_module(num_functions)
+    spliced = pasta.parse(src, track_changes=True)
+    spliced.body[3].name = 'renamed'
+    pasta.mark_changed(spliced.body[3])
+    # Without tracking changes, every statement is printed
+    printed = pasta.parse(src)
+    printed.body[3].name = 'renamed'
+    assert pasta.dump(spliced) == pasta.dump(printed)
+    assert codegen.apply_edits(src, pasta.edits(spliced)) == pasta.dump(printed)
+
+    print('%d lines:' % src.count('\n'))
+    printed_time = bench_utils.best_time(lambda: pasta.dump(printed))
+    bench_utils.report('  dump, printing every statement', printed_time)
+    bench_utils.report('  dump, copying unchanged statements',
+                       bench_utils.best_time(lambda: pasta.dump(spliced)),
+                       printed_time)
+    bench_utils.report('  edits, copying unchanged statements',
+                       bench_utils.best_time(lambda: pasta.edits(spliced)),
+                       printed_time)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,46 @@
+# coding=utf-8
+"""Benchmark updating a large module after a small edit to its source."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import bench_utils
+
+import pasta
+from pasta.base import codegen
+
+
+def main():
+  for num_functions in (1000, 5000):
+    src = bench_utils.generate_module(num_functions)
+    middle = src.index('\n', len(src) // 2) + 1
+    edits = (('replace a character', codegen.Edit(middle, 1, src[middle])),
+             ('insert a line', codegen.Edit(middle, 0, '\n')))
+    print('%d lines:' % src.count('\n'))
+    full = bench_utils.best_time(lambda: pasta.parse(src), repeat=3)
+    bench_utils.report('  parse', full)
+    for name, edit in edits:
+      trees = [pasta.parse(src) for _ in range(3)]
+      bench_utils.report(
+          '  reparse, %s' % name,
+          bench_utils.best_time(lambda: pasta.reparse(trees.pop(), edit),
+                                repeat=3),
+          full)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,67 @@
+# coding=utf-8
+"""Benchmark an import-only refactoring with eager and lazy annotation."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+
+import bench_utils
+
+import pasta
+from pasta.augment import rename
+
+
+def main():
+  for num_functions in (10, 100, 1000):
+    src = bench_utils.generate_module(num_functions)
+
+    def refactor(lazy_annotation, annotate_only=None):
+      t = pasta.parse(src, lazy_annotation=lazy_annotation,
+                      annotate_only=annotate_only)
+      rename.rename_external(t, 'collections.defaultdict',
+                             'collections.OrderedDict')
+      return pasta.dump(t)
+
+    imports = (ast.Import, ast.ImportFrom)
+    assert refactor(False) == refactor(True) == refactor(False, imports)
+    print('%d lines:' % src.count('\n'))
+    eager_parse = bench_utils.best_time(lambda: pasta.parse(src))
+    bench_utils.report('  parse, eager', eager_parse)
+    bench_utils.report(
+        '  parse, lazy',
+        bench_utils.best_time(lambda: pasta.parse(src, lazy_annotation=True)),
+        eager_parse)
+    bench_utils.report(
+        '  parse, annotate imports only',
+        bench_utils.best_time(lambda: pasta.parse(src, annotate_only=imports)),
+        eager_parse)
+    bench_utils.report('  ast.parse',
+                       bench_utils.best_time(lambda: ast.parse(src)),
+                       eager_parse)
+    eager_refactor = bench_utils.best_time(lambda: refactor(False))
+    bench_utils.report('  parse + rename + dump, eager', eager_refactor)
+    bench_utils.report('  parse + rename + dump, lazy',
+                       bench_utils.best_time(lambda: refactor(True)),
+                       eager_refactor)
+    bench_utils.report('  parse + rename + dump, imports only',
+                       bench_utils.best_time(lambda: refactor(False, imports)),
+                       eager_refactor)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,89 @@
+# coding=utf-8
+"""Benchmark the memory used by the formatting stored on annotated trees.
+
+The formatting of every node is compared to the previous layout, which stored
+each node's formatting as a defaultdict holding its own copy of every string.
+"""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+import collections
+import pickle
+import sys
+
+import bench_utils
+
+import pasta
+from pasta.base import ast_utils
+
+
+def formatting_size(formatting):
+  """Get the memory used by a list of formatting objects, in bytes.
+
+  Every object is counted once, however many nodes share it. Nodes referred to
+  by the formatting are not counted, since they are part of the tree anyway.
+  """
+  seen = set()
+  size = 0
+  stack = list(formatting)
+  while stack:
+    value = stack.pop()
+    if id(value) in seen or isinstance(value, ast.AST) or value is None:
+      continue
+    seen.add(id(value))
+    size += sys.getsizeof(value)
+    if isinstance(value, ast_utils.Formatting):
+      # pylint: disable=protected-access
+      stack.append(value.ref)
+      stack.append(value._other)
+      stack.extend(v for _, v in value._raw_items())
+    elif isinstance(value, ast_utils.Source):
+      stack.append(value.text)
+    elif isinstance(value, dict):
+      stack.extend(value.values())
+  return size
+
+
+def main():
+  for num_functions in (10, 100, 1000):
+    src = bench_utils.generate_module(num_functions)
+    t = pasta.parse(src)
+    compact = [getattr(node, ast_utils.PASTA_DICT) for node in ast.walk(t)
+               if hasattr(node, ast_utils.PASTA_DICT)]
+    legacy = [collections.defaultdict(str, props.items()) for props in compact]
+    compact_data = pickle.dumps(compact, pickle.HIGHEST_PROTOCOL)
+    legacy_data = pickle.dumps(legacy, pickle.HIGHEST_PROTOCOL)
+
+    print('%d lines, %d nodes:' % (src.count('\n'), len(compact)))
+    legacy_size = formatting_size(legacy)
+    compact_size = formatting_size(compact)
+    print('  %-38s %10.1f KB' % ('in memory, defaultdict',
+                                 legacy_size / 1024))
+    print('  %-38s %10.1f KB  (%.1fx)' % ('in memory, compact',
+                                          compact_size / 1024,
+                                          legacy_size / compact_size))
+    print('  %-38s %10.1f KB' % ('pickled, defaultdict',
+                                 len(legacy_data) / 1024))
+    print('  %-38s %10.1f KB  (%.1fx)' % ('pickled, compact',
+                                          len(compact_data) / 1024,
+                                          len(legacy_data) / len(compact_data)))
+
+
+if __name__ == '__main__':
+  main()
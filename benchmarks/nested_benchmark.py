@@ -0,0 +1,74 @@
+# coding=utf-8
+"""Benchmark annotating deeply nested blocks and expressions."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+import sys
+
+import bench_utils
+
+import pasta
+
+
+def generate_module(num_functions, depth):
+  """Generate functions whose blocks are nested `depth` levels deep.
+
+  Every block ends with comments at its own indentation and at that of the
+  blocks around it, which end in turn.
+  """
+  lines = []
+  for i in range(num_functions):
+    lines.append('def func_%d(a):\n' % i)
+    for level in range(1, depth + 1):
+      lines.append('  ' * level + 'if a > %d:\n' % level)
+    for level in range(depth + 1, 0, -1):
+      lines.append('  ' * level + 'a -= %d\n' % level)
+      lines.append('  ' * level + '# End of level %d.\n' % level)
+      lines.append('  ' * (level - 1) + '# After level %d.\n' % level)
+    lines.append('\n')
+  return ''.join(lines)
+
+
+def generate_expression(depth):
+  """Generate a statement adding `depth` names, nested as deep in the tree."""
+  return 'x = ' + ' + '.join('a%d' % i for i in range(depth)) + '\n'
+
+
+def main():
+  for depth in (2, 8, 32):
+    src = generate_module(100, depth)
+    print('depth %d, %d lines:' % (depth, src.count('\n')))
+    bench_utils.report('  parse',
+                       bench_utils.best_time(lambda: pasta.parse(src)))
+
+  # Only ast.parse recurses for each level of nesting in an expression
+  sys.setrecursionlimit(100000)
+  for depth in (1000, 10000, 30000):
+    src = generate_expression(depth)
+    print('expression depth %d:' % depth)
+    bench_utils.report('  annotate', bench_utils.best_time(
+        lambda: pasta.annotate(ast.parse(src), src), repeat=3))
+    t = pasta.parse(src)
+    t.body[0].value.left.right.id = 'b'
+    bench_utils.report('  dump', bench_utils.best_time(
+        lambda: pasta.dump(t), repeat=3))
+
+
+if __name__ == '__main__':
+  main()
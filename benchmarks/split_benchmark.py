@@ -0,0 +1,43 @@
+# coding=utf-8
+"""Benchmark annotating a single large module in worker processes."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+
+import bench_utils
+
+import pasta
+
+
+def main():
+  for num_functions in (1000, 5000):
+    src = bench_utils.generate_module(num_functions)
+    print('%d lines:' % src.count('\n'))
+    sequential = bench_utils.best_time(lambda: pasta.parse(src), repeat=3)
+    bench_utils.report('  parse', sequential)
+    for processes in sorted(set((2, 4, multiprocessing.cpu_count()))):
+      bench_utils.report(
+          '  parse, %d processes' % processes,
+          bench_utils.best_time(lambda: pasta.parse(src, processes=processes),
+                                repeat=3),
+          sequential)
+
+
+if __name__ == '__main__':
+  main()
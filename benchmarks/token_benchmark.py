@@ -0,0 +1,96 @@
+# coding=utf-8
+"""Benchmark reading the tokens of a module, compared to a list of tuples."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import gc
+import tokenize
+
+import bench_utils
+from six import StringIO
+
+from pasta.base import token_generator
+from pasta.base import tokenizer
+
+try:
+  import tracemalloc  # pylint: disable=g-import-not-at-top
+except ImportError:
+  # Python 2 has no tracemalloc, so only the time taken is measured
+  tracemalloc = None
+
+
+def read_token_list(source):
+  """Read the tokens the way TokenGenerator used to, as a list of tuples."""
+  tokens = tokenize.generate_tokens(StringIO(source).readline)
+  return ([token_generator.Token(*tok) for tok in tokens],
+          source.splitlines(True))
+
+
+def memory_used(func):
+  """Get the memory held by the result of a function, and its peak, in bytes."""
+  gc.collect()
+  tracemalloc.start()
+  try:
+    result = func()
+    size, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  del result
+  return size, peak
+
+
+def read_all(source, window=None):
+  """Read every token of the source with a TokenGenerator."""
+  tokens = token_generator.TokenGenerator(
+      source, tokenizer=tokenizer.regex_tokens, window=window)
+  while tokens.next() is not None:
+    pass
+
+
+def main():
+  for num_functions in (10, 100, 1000):
+    src = bench_utils.generate_module(num_functions)
+    print('%d lines:' % src.count('\n'))
+
+    list_time = bench_utils.best_time(lambda: read_token_list(src))
+    bench_utils.report('  construct, list of tuples', list_time)
+    bench_utils.report(
+        '  construct, TokenGenerator',
+        bench_utils.best_time(lambda: token_generator.TokenGenerator(src)),
+        list_time)
+    if tracemalloc is None:
+      continue
+
+    list_size, list_peak = memory_used(lambda: read_token_list(src))
+    size, peak = memory_used(lambda: token_generator.TokenGenerator(src))
+    print('  %-38s %10.1f KB (peak %.1f KB)' % (
+        'memory, list of tuples', list_size / 1024, list_peak / 1024))
+    print('  %-38s %10.1f KB (peak %.1f KB)  (%.1fx)' % (
+        'memory, TokenGenerator', size / 1024, peak / 1024, list_size / size))
+
+    _, all_peak = memory_used(lambda: read_all(src))
+    _, window_peak = memory_used(lambda: read_all(src, window=16))
+    print('  %-38s %10.1f KB' % ('peak reading all, all kept',
+                                 all_peak / 1024))
+    print('  %-38s %10.1f KB  (%.1fx)' % ('peak reading all, window of 16',
+                                          window_peak / 1024,
+                                          all_peak / window_peak))
+
+
+if __name__ == '__main__':
+  main()
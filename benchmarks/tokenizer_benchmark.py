@@ -0,0 +1,48 @@
+# coding=utf-8
+"""Benchmark the tokenizer backends of the TokenGenerator."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import bench_utils
+
+from pasta.base import token_generator
+from pasta.base import tokenizer
+
+
+def main():
+  for num_functions in (10, 100, 1000):
+    src = bench_utils.generate_module(num_functions)
+    print('%d lines:' % src.count('\n'))
+
+    for name, func in (('tokenize', tokenizer.tokenize_tokens),
+                       ('regex', tokenizer.regex_tokens)):
+      bench_utils.report(
+          '  tokens, %s' % name,
+          bench_utils.best_time(lambda: list(func(src))))
+    baseline = bench_utils.best_time(
+        lambda: token_generator.TokenGenerator(src))
+    bench_utils.report('  TokenGenerator, tokenize', baseline)
+    bench_utils.report(
+        '  TokenGenerator, regex',
+        bench_utils.best_time(lambda: token_generator.TokenGenerator(
+            src, tokenizer=tokenizer.regex_tokens)),
+        baseline)
+
+
+if __name__ == '__main__':
+  main()
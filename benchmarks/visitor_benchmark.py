@@ -0,0 +1,67 @@
+# coding=utf-8
+"""Benchmark the number of nodes visited per second by each visitor."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+
+import bench_utils
+
+import pasta
+from pasta.base import annotate
+from pasta.base import ast_utils
+from pasta.base import codegen
+
+
+def annotate_tree(src):
+  tree = ast.parse(src)
+  annotate.AstAnnotator(src).visit(tree)
+  return tree
+
+
+def print_tree(tree):
+  printer = codegen.Printer()
+  printer.visit(tree)
+  return printer.code
+
+
+def report_rate(name, num_nodes, seconds):
+  print('  %-38s %10.0f nodes/s' % (name, num_nodes / seconds))
+
+
+def main():
+  for num_functions in (10, 100, 1000):
+    src = bench_utils.generate_module(num_functions)
+    # Print every statement, rather than copying unchanged ones from the source
+    tree = pasta.parse(src)
+    for node in ast.walk(tree):
+      if isinstance(node, ast.stmt):
+        ast_utils.setprop(node, 'span', '')
+    assert print_tree(tree) == src
+    num_nodes = sum(1 for _ in ast.walk(tree))
+    print('%d lines, %d nodes:' % (src.count('\n'), num_nodes))
+
+    parse_time = bench_utils.best_time(lambda: ast.parse(src))
+    report_rate('annotate', num_nodes,
+                bench_utils.best_time(lambda: annotate_tree(src)) - parse_time)
+    report_rate('print', num_nodes,
+                bench_utils.best_time(lambda: print_tree(tree)))
+
+
+if __name__ == '__main__':
+  main()
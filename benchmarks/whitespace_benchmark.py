@@ -0,0 +1,53 @@
+# coding=utf-8
+"""Benchmark annotating modules with large blocks of comments and whitespace.
+
+The time per line should stay about the same as the blocks get larger.
+"""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import bench_utils
+
+import pasta
+
+_BLOCKS = (
+    ('comments', '# Licensed under the Apache License, Version 2.0.\n'),
+    ('blank lines', '\n'),
+    ('continued lines', '    \\\n'),
+)
+
+
+def generate_module(block, num_lines):
+  """Generate a module with a large block between two statements."""
+  if block.endswith('\\\n'):
+    return 'x = (1 +\n' + block * num_lines + '     2)\n'
+  return 'x = 1\n' + block * num_lines + 'y = 2\n'
+
+
+def main():
+  for name, block in _BLOCKS:
+    print('%s:' % name)
+    for num_lines in (1000, 10000, 100000):
+      src = generate_module(block, num_lines)
+      seconds = bench_utils.best_time(lambda: pasta.parse(src), repeat=3)
+      print('  %-38s %10.3f ms  (%.2f us per line)' % (
+          '%d lines' % num_lines, seconds * 1000, seconds / num_lines * 1e6))
+
+
+if __name__ == '__main__':
+  main()
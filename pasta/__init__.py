@@ -14,17 +14,191 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from pasta.base import annotate
+__version__ = '0.1'
+
+import itertools
+import tokenize
+
+from pasta.base import annotate as annotate_lib
 from pasta.base import ast_utils
+from pasta.base import batch
 from pasta.base import codegen
+from pasta.base import incremental
+from pasta.base import lazy
+from pasta.base import token_generator
 
 
-def parse(src):
-  t = ast_utils.parse(src)
-  annotator = annotate.AstAnnotator(src)
-  annotator.visit(t)
+def parse(src, cache=None, lazy_annotation=False, track_changes=False,
+          tokenizer=None, token_window=None, annotate_only=None,
+          processes=None, budget=None, keep_tokens=False):
+  """Parse python source into an annotated syntax tree.
+
+  Arguments:
+    src: (string) Python source code.
+    cache: (optional cache.AnnotationCache) Cache to load the annotated tree
+      from, and to store it in if it was not already cached.
+    lazy_annotation: (bool) If True, defer annotating each top-level statement
+      until its formatting is first used. See pasta.base.lazy.
+    track_changes: (bool) If True, record which nodes of the tree are modified
+      so that they can be listed with changed_nodes, and so that unchanged
+      statements are copied from the source when printing.
+    tokenizer: (optional function) Tokenizer backend to read the tokens of the
+      source with, such as pasta.base.tokenizer.regex_tokens. Defaults to the
+      tokenize module.
+    token_window: (optional int) If given, read the tokens of the source as
+      they are needed, and only keep this many before the current one. This
+      bounds the memory used for tokens when annotating very large modules.
+      The tokens are then not kept, even with keep_tokens. Lazily annotated
+      statements are tokenized separately, and do not use a window.
+    annotate_only: (optional) Node type, tuple of node types or function
+      taking a node, which selects the nodes that need formatting, such as
+      (ast.Import, ast.ImportFrom). Only the top-level statements containing a
+      selected node are annotated; the rest are deferred as with
+      lazy_annotation, and printed back verbatim unless they are modified.
+    processes: (optional int) If given, split the module into chunks of
+      top-level statements and annotate them in this many worker processes.
+      The tree is annotated the same way, but very large modules are
+      annotated faster. See batch.parse_split. The tokens read in worker
+      processes are not kept, even with keep_tokens.
+    budget: (optional budget.Budget) Limit on the time and number of nodes
+      spent annotating, which may also be cancelled from another thread. Only
+      the statements annotated straight away count towards it. See
+      pasta.base.budget.
+    keep_tokens: (bool) If True, keep the tokens read while annotating the
+      whole source, so that pasta.tokens does not read them again. They take
+      about as much memory as the formatting of the tree, so by default
+      pasta.tokens tokenizes the source when it is first called.
+  Raises:
+    budget.BudgetExceeded: If the budget runs out before the source is
+      annotated. It tells how far annotation got.
+    ValueError: If both processes and budget are given, since annotation in
+      worker processes cannot be stopped.
+  """
+  if processes is not None and budget is not None:
+    raise ValueError('A budget cannot be used with processes')
+  t = cache.get(src) if cache is not None else None
+  if t is None:
+    if lazy_annotation or annotate_only is not None:
+      t = lazy.parse(src, tokenizer=tokenizer, annotate_only=annotate_only,
+                     budget=budget)
+    else:
+      if processes is not None:
+        t = batch.parse_split(src, processes=processes, tokenizer=tokenizer)
+      else:
+        t = ast_utils.parse(src)
+        annotator = annotate_lib.AstAnnotator(src, tokenizer=tokenizer,
+                                              token_window=token_window,
+                                              budget=budget)
+        annotator.visit(t)
+        if keep_tokens:
+          token_generator.set_module_tokens(t, annotator.tokens)
+      if cache is not None:
+        cache.put(src, t)
+  if track_changes:
+    ast_utils.track_changes(t)
   return t
 
 
-def dump(tree):
-  return codegen.to_str(tree)
+def annotate(tree, src, tokens=None, keep_tokens=False):
+  """Annotate a syntax tree already parsed from python source.
+
+  Unlike parse, the source is not parsed again, and is not tokenized again if
+  its tokens are given.
+
+  Arguments:
+    tree: (ast.Module) Syntax tree of the source, e.g. from ast.parse. It is
+      normalized in place (see ast_utils.normalize).
+    src: (string) Python source code the tree was parsed from.
+    tokens: (optional iterable) Tokens of the source, as generated by
+      tokenize.generate_tokens.
+    keep_tokens: (bool) If True, keep the tokens for pasta.tokens, as in parse.
+  Returns:
+    The annotated tree.
+  """
+  if tokens is not None:
+    # Tokens read from bytes start with the encoding of the source, except on
+    # python 2, which has no such token
+    encoding = getattr(tokenize, 'ENCODING', None)
+    tokens = itertools.dropwhile(lambda token: token[0] == encoding, tokens)
+  ast_utils.normalize(tree)
+  annotator = annotate_lib.AstAnnotator(src, tokens=tokens)
+  annotator.visit(tree)
+  if keep_tokens:
+    token_generator.set_module_tokens(tree, annotator.tokens)
+  return tree
+
+
+def dump(tree, budget=None):
+  return codegen.to_str(tree, budget=budget)
+
+
+def edits(tree, budget=None):
+  """Get the edits which turn the source a tree was parsed from into its code.
+
+  Applying the edits to the original source gives the same code as dump(tree),
+  but only the parts of the source which changed are included.
+
+  Returns:
+    A list of (offset, length, replacement) tuples, sorted by offset. Offsets
+    and lengths are in characters of the source given to parse.
+  """
+  return codegen.to_edits(tree, budget=budget)
+
+
+def reparse(tree, edit, budget=None):
+  """Update a tree parsed with parse after an edit to its source.
+
+  Only the top-level statements around the edit are parsed and annotated
+  again; the tree is updated in place to be the same as parsing the edited
+  source. Line numbers after the edit are only updated by
+  pasta.base.incremental.update_lines. See pasta.base.incremental.
+
+  Arguments:
+    tree: (ast.Module) A syntax tree parsed with parse, not modified since.
+    edit: (tuple) (offset, length, replacement) of the edit to the source.
+    budget: (optional budget.Budget) Limit on the time and number of nodes
+      spent annotating. If it runs out, the tree is left as it was.
+  Returns:
+    The updated tree.
+  """
+  return incremental.reparse(tree, edit, budget=budget)
+
+
+def tokens(tree):
+  """Get the tokens of the source a tree was parsed from.
+
+  The source is tokenized once, when this is first called for a tree, unless
+  the tokens read to annotate it were kept (see keep_tokens in parse). Other
+  tools can share them without tokenizing the source themselves.
+
+  Returns:
+    A TokenGenerator at the start of the source. Its tokens() method gives
+    every token of the source as a Token tuple.
+  """
+  return token_generator.module_tokens(tree)
+
+
+def changed_nodes(tree):
+  """Get the nodes modified in a tree, along with their ancestors.
+
+  The tree must have been parsed with `track_changes=True`.
+  """
+  return ast_utils.changed_nodes(tree)
+
+
+def mark_changed(node):
+  """Record that a node of a tree parsed with `track_changes=True` changed.
+
+  Changes to the fields of nodes are otherwise only found when the tree is
+  printed or its changed nodes are listed. Nodes of untracked trees are
+  ignored.
+  """
+  ast_utils.mark_changed(node)
+
+
+def parse_many(inputs, processes=None, chunksize=1):
+  return batch.parse_many(inputs, processes=processes, chunksize=chunksize)
+
+
+def dump_many(trees, processes=None, chunksize=1):
+  return batch.dump_many(trees, processes=processes, chunksize=chunksize)
@@ -53,8 +53,12 @@ def split_import(sc, node, alias_to_remove):
   new_import = copy.deepcopy(node)
   new_import.names = [alias_to_remove]
   node.names.remove(alias_to_remove)
+  ast_utils.mark_changed(node)
 
   parent_list.insert(idx + 1, new_import)
+  if ast_utils.is_tracked(parent):
+    ast_utils.track_changes(new_import, parent)
+  ast_utils.mark_changed(new_import)
   return new_import
 
 def get_unused_import_aliases(tree, sc=None):
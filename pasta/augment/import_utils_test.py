@@ -22,6 +22,8 @@ import ast
 import traceback
 import unittest
 
+import pasta
+
 from pasta.augment import import_utils
 from pasta.base import ast_utils
 from pasta.base import test_utils
@@ -42,6 +44,18 @@ class SplitImportTest(test_utils.TestCase):
     self.assertEqual([alias.name for alias in t.body[0].names], ['aaa', 'ccc'])
     self.assertEqual([alias.name for alias in t.body[1].names], ['bbb'])
 
+  def test_split_import_tracks_changes(self):
+    src = 'import aaa, bbb, ccc\nimport ddd\n'
+    t = pasta.parse(src, track_changes=True)
+    import_node = t.body[0]
+    sc = scope.analyze(t)
+    new_import = import_utils.split_import(sc, import_node,
+                                           import_node.names[1])
+
+    self.assertEqual(set([t, import_node, new_import]),
+                     pasta.changed_nodes(t))
+    self.assertFalse(ast_utils.is_changed(t.body[2]))
+
   def test_split_from_import(self):
     src = 'from aaa import bbb, ccc, ddd\n'
     t = ast.parse(src)
@@ -20,11 +20,17 @@ from __future__ import print_function
 
 import ast
 import copy
+import functools
 import itertools
+import os
+import tokenize
 import six
+from six import StringIO
 
+import pasta
 from pasta.augment import import_utils
 from pasta.base import ast_utils
+from pasta.base import batch
 from pasta.base import scope
 
 
@@ -78,6 +84,7 @@ def rename_external(t, old_name, new_name):
         already_changed.append(parent)
       else:
         node.name = new_name + node.name[len(old_name):]
+        ast_utils.mark_changed(node)
         if not node.asname:
           renames[old_name] = new_name
       has_changed = True
@@ -93,6 +100,94 @@ def rename_external(t, old_name, new_name):
   return has_changed
 
 
+def rename_external_in_dir(root, renames, processes=None, chunksize=1,
+                           write=True):
+  """Rename imported names in every python file under a directory.
+
+  Parsing and annotating a file is expensive, so files are first checked for
+  whether they could possibly reference any of the old names. A file can only
+  be affected if every part of an old dotted name appears as a name token in
+  it; files which fail a quick check of the raw text are never sent to a
+  worker, and workers check the token stream before parsing the rest.
+
+  Arguments:
+    root: (string) Directory to search for python files.
+    renames: (dict) Maps the fully-qualified old name to the new name, as in
+      rename_external.
+    processes: (int) Number of worker processes to use. Defaults to the number
+      of CPUs.
+    chunksize: (int) Number of files to send to a worker at a time.
+    write: (bool) Whether to write the updated source back to each file.
+
+  Yields:
+    batch.Result tuples for each file that was changed, with the new source as
+    the value, and for each file that could not be processed. Files are read
+    and written in the encoding they declare; see batch.read_source.
+  """
+  name_parts = [old_name.split('.') for old_name in renames]
+  unreadable = []
+
+  def candidates():
+    for dirpath, _, filenames in os.walk(root):
+      for filename in sorted(filenames):
+        if not filename.endswith('.py'):
+          continue
+        path = os.path.join(dirpath, filename)
+        try:
+          src, encoding = batch.read_source(path)
+        except (IOError, UnicodeDecodeError, LookupError) as e:
+          unreadable.append(batch.Result(path, None, e))
+          continue
+        if any(all(part in src for part in parts) for parts in name_parts):
+          yield path, src, encoding
+
+  rename_file = functools.partial(_rename_file, renames, write)
+  for result in batch.run(rename_file, candidates(), processes, chunksize):
+    if result.value is not None or result.error is not None:
+      yield result
+  # Files which could not be read are reported once the others are done
+  for result in unreadable:
+    yield result
+
+
+def _rename_file(renames, write, item):
+  """Rename names in a single file; returns a batch.Result."""
+  path, src, encoding = item
+  try:
+    names = _name_tokens(src)
+    renames = [(old_name, new_name)
+               for old_name, new_name in six.iteritems(renames)
+               if names.issuperset(old_name.split('.'))]
+    if not renames:
+      return batch.Result(path, None, None)
+
+    t = pasta.parse(src)
+    has_changed = False
+    for old_name, new_name in renames:
+      has_changed |= rename_external(t, old_name, new_name)
+    if not has_changed:
+      return batch.Result(path, None, None)
+
+    new_src = pasta.dump(t)
+    if write:
+      batch.write_source(path, new_src, encoding)
+    return batch.Result(path, new_src, None)
+  except Exception as e:  # pylint: disable=broad-except
+    return batch.Result(path, None, e)
+
+
+def _name_tokens(src):
+  """Get the set of all name tokens in some source code."""
+  names = set()
+  try:
+    for tok in tokenize.generate_tokens(StringIO(src).readline):
+      if tok[0] == tokenize.NAME:
+        names.add(tok[1])
+  except tokenize.TokenError:
+    pass
+  return names
+
+
 def _rename_name_in_importfrom(sc, node, old_name, new_name):
   if old_name == new_name:
     return False
@@ -104,6 +199,7 @@ def _rename_name_in_importfrom(sc, node, old_name, new_name):
   # If just the module is changing, rename it
   if module_parts[:len(old_parts)] == old_parts:
     node.module = '.'.join(new_parts + module_parts[len(old_parts):])
+    ast_utils.mark_changed(node)
     return True
     
   # Find the alias node to be changed
@@ -114,14 +210,17 @@ def _rename_name_in_importfrom(sc, node, old_name, new_name):
     return False
 
   alias_to_change.name = new_parts[-1]
+  ast_utils.mark_changed(alias_to_change)
 
   # Split the import if the package has changed
   if module_parts != new_parts[:-1]:
     if len(node.names) > 1:
       new_import = import_utils.split_import(sc, node, alias_to_change)
       new_import.module = '.'.join(new_parts[:-1])
+      ast_utils.mark_changed(new_import)
     else:
       node.module = '.'.join(new_parts[:-1])
+      ast_utils.mark_changed(node)
 
   return True
 
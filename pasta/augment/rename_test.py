@@ -19,8 +19,12 @@ from __future__ import division
 from __future__ import print_function
 
 import ast
+import os
+import shutil
+import tempfile
 import unittest
 
+import pasta
 from pasta.augment import rename
 from pasta.base import scope
 from pasta.base import test_utils
@@ -101,6 +105,16 @@ class RenameTest(test_utils.TestCase):
     rename._rename_reads(sc, t, 'aaa.bbb', 'xxx.yyy')
     self.checkAstsEqual(t, ast.parse('xxx.yyy.ccc()'))
 
+  def test_rename_external_tracks_changes(self):
+    src = 'import aaa\nimport bbb\nx = aaa.x\ny = bbb.y\n'
+    t = pasta.parse(src, track_changes=True)
+    rename.rename_external(t, 'aaa', 'ccc')
+    changed = pasta.changed_nodes(t)
+    self.assertIn(t.body[0], changed)
+    self.assertIn(t.body[2], changed)
+    self.assertNotIn(t.body[1], changed)
+    self.assertNotIn(t.body[3], changed)
+
   def test_rename_reads_noop(self):
     src = 'aaa.bbb.ccc()'
     t = ast.parse(src)
@@ -110,9 +124,82 @@ class RenameTest(test_utils.TestCase):
     self.checkAstsEqual(t, ast.parse(src))
 
 
+class RenameExternalInDirTest(test_utils.TestCase):
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.root)
+
+  def _write(self, filename, src):
+    path = os.path.join(self.root, filename)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+      f.write(src)
+    return path
+
+  def _read(self, path):
+    with open(path, 'r') as f:
+      return f.read()
+
+  def test_rename_external_in_dir(self):
+    changed = self._write('a.py', 'import aaa.bbb  # Comment\nx = 1\n')
+    changed_from = self._write('sub/b.py', 'from aaa import bbb\nbbb.y\n')
+    unrelated = self._write('c.py', 'import aaa\n# aaa.bbb is not used\n')
+    not_python = self._write('d.txt', 'import aaa.bbb\n')
+
+    results = list(rename.rename_external_in_dir(
+        self.root, {'aaa.bbb': 'xxx.yyy'}, processes=2))
+
+    self.assertItemsEqual([changed, changed_from], [r.key for r in results])
+    self.assertEqual('import xxx.yyy  # Comment\nx = 1\n',
+                     self._read(changed))
+    self.assertEqual('from xxx import yyy\nyyy.y\n', self._read(changed_from))
+    self.assertEqual('import aaa\n# aaa.bbb is not used\n',
+                     self._read(unrelated))
+    self.assertEqual('import aaa.bbb\n', self._read(not_python))
+
+  def test_rename_external_in_dir_no_write(self):
+    path = self._write('a.py', 'import aaa.bbb\n')
+    results = list(rename.rename_external_in_dir(
+        self.root, {'aaa.bbb': 'xxx.yyy'}, processes=1, write=False))
+    self.assertEqual([(path, 'import xxx.yyy\n', None)], results)
+    self.assertEqual('import aaa.bbb\n', self._read(path))
+
+  def test_rename_external_in_dir_reports_errors(self):
+    path = self._write('a.py', 'import aaa.bbb\ndef (:\n')
+    results = list(rename.rename_external_in_dir(
+        self.root, {'aaa.bbb': 'xxx.yyy'}, processes=1))
+    self.assertEqual(1, len(results))
+    self.assertEqual(path, results[0].key)
+    self.assertIsInstance(results[0].error, SyntaxError)
+
+  def test_rename_external_in_dir_encodings(self):
+    path = self._write('a.py', '')
+    with open(path, 'wb') as f:
+      f.write(b'# coding: latin-1\nimport aaa.bbb\nx = "\xe9"\n')
+    undecodable = self._write('b.py', '')
+    with open(undecodable, 'wb') as f:
+      f.write(b'\xff\xfeimport aaa.bbb\n')
+
+    results = {r.key: r for r in rename.rename_external_in_dir(
+        self.root, {'aaa.bbb': 'xxx.yyy'}, processes=1)}
+    self.assertItemsEqual([path, undecodable], results.keys())
+    self.assertIsNone(results[path].error)
+    self.assertIsInstance(results[undecodable].error, UnicodeDecodeError)
+    with open(path, 'rb') as f:
+      self.assertEqual(b'# coding: latin-1\nimport xxx.yyy\nx = "\xe9"\n',
+                       f.read())
+
+  def test_name_tokens(self):
+    self.assertEqual({'import', 'aaa', 'bbb'},
+                     rename._name_tokens('import aaa  # ccc\nbbb = "ddd"\n'))
+
+
 def suite():
   result = unittest.TestSuite()
   result.addTests(unittest.makeSuite(RenameTest))
+  result.addTests(unittest.makeSuite(RenameExternalInDirTest))
   return result
 
 if __name__ == '__main__':
@@ -26,8 +26,13 @@ from six.moves import zip
 
 from pasta.base import ast_constants
 from pasta.base import ast_utils
+from pasta.base import budget as budget_lib
+from pasta.base import grammar
 from pasta.base import token_generator
 
+# Formatting at least this long is stored as offsets into the source, which
+# takes less memory than a string of this length.
+_MIN_SLICE_LENGTH = 8
 
 # ==============================================================================
 # == Helper functions for decorating nodes with prefix + suffix               ==
@@ -35,20 +40,44 @@ from pasta.base import token_generator
 
 def _gen_wrapper(f, scope=True, prefix=True, suffix=True,
                  max_suffix_lines=None):
+  # Scopes are opened and closed directly rather than with a context manager,
+  # since this runs for most nodes in the tree.
+  def finish(self, node):
+    if suffix:
+      self.suffix(node, max_lines=max_suffix_lines)
+    if scope:
+      self.close_scope(node)
+
   @contextlib.wraps(f)
   def wrapped(self, node, *args, **kwargs):
-    with (self.scope(node) if scope else _noop_context()):
-      if prefix:
-        self.prefix(node)
-      f(self, node, *args, **kwargs)
-      if suffix:
-        self.suffix(node, max_lines=max_suffix_lines)
+    if scope:
+      self.open_scope(node)
+    if prefix:
+      self.prefix(node)
+    children = f(self, node, *args, **kwargs)
+    if children is not None:
+      self._unfinished.append(node)
+      return _then(children, finish, self, node)
+    finish(self, node)
+    return None
   return wrapped
 
 
-@contextlib.contextmanager
-def _noop_context():
-  yield
+def _then(children, finish, visitor, node):
+  """Yield the children from a visit method, then finish visiting the node."""
+  for child in children:
+    yield child
+  finish(visitor, node)
+  unfinished = visitor._unfinished.pop()
+  if unfinished is not node:
+    raise _unfinished_error(unfinished)
+
+
+def _unfinished_error(node):
+  """Error for a node whose children were returned but never visited."""
+  return TypeError('The children of a %s node were not visited. A visit method '
+                   'overriding another must return its result.' %
+                   node.__class__.__name__)
 
 
 def expression(f):
@@ -73,10 +102,7 @@ def statement(f):
 
 def block_statement(f):
   """Decorates a function where the node is a statement with children."""
-  @contextlib.wraps(f)
-  def wrapped(self, node, *args, **kwargs):
-    self.prefix(node)
-    f(self, node, *args, **kwargs)
+  def finish(self, node):
     if hasattr(self, 'block_suffix'):
       last_child = ast_utils.get_last_child(node)
       # Workaround for ast.Module which does not have a lineno
@@ -85,9 +111,42 @@ def block_statement(f):
         self.block_suffix(node, indent)
     else:
       self.suffix(node)
+
+  @contextlib.wraps(f)
+  def wrapped(self, node, *args, **kwargs):
+    self.prefix(node)
+    children = f(self, node, *args, **kwargs)
+    if children is not None:
+      self._unfinished.append(node)
+      return _then(children, finish, self, node)
+    finish(self, node)
+    return None
   return wrapped
 
 
+# Visit method for each node class, for each visitor class
+_visit_methods = {}
+
+# Marks the end of a generator run by BaseVisitor.visit
+_DONE = object()
+
+
+def install_syntax(visitor_class):
+  """Add visit methods compiled from grammar.SYNTAX to a visitor class.
+
+  Each attr in the syntax is compiled with the class' `_compile_attr`. Visit
+  methods which the class defines itself are kept.
+  """
+  decorators = {'expression': expression, 'space_around': space_around,
+                'statement': statement}
+  for node_type, (kind, items) in grammar.SYNTAX.items():
+    name = 'visit_' + node_type
+    if name not in visitor_class.__dict__:
+      visit = grammar.compile_syntax(items, visitor_class._compile_attr)
+      visit.__name__ = name
+      setattr(visitor_class, name, decorators[kind](visit))
+
+
 # ==============================================================================
 # == NodeVisitors for annotating an AST                                       ==
 # ==============================================================================
@@ -102,19 +161,116 @@ class BaseVisitor(ast.NodeVisitor):
   Each visit method in this class specifies the order in which both child nodes
   and syntax tokens appear, plus where to account for whitespace, commas,
   parentheses, etc.
+
+  Visit methods are generators, which yield each child node to visit in turn,
+  or another such generator to run before continuing. Nodes are visited with an
+  explicit stack of these generators rather than by recursion, so the depth of
+  nesting in the tree is not limited by python's recursion limit. A visit
+  method which visits no children may be a plain function. A subclass which
+  overrides a visit method must return what the overridden method returns, or
+  the node is never finished; visit raises a TypeError if that happens.
+
+  If a budget.Budget is given, each node visited is counted against it, and
+  budget.BudgetExceeded is raised if it runs out before the visit finishes.
   """
 
   __metaclass__ = abc.ABCMeta
 
-  def __init__(self):
+  def __init__(self, budget=None):
     self._stack = []
+    self._visit_methods = _visit_methods.setdefault(type(self), {})
+    self.budget = budget
+    # Nodes whose visit method returned children which were not all visited
+    self._unfinished = []
 
   def visit(self, node):
-    self._stack.append(node)
-    ast_utils.setup_props(node)
-    super(BaseVisitor, self).visit(node)
+    """Visit a node and all the nodes inside it."""
+    # Generators being run, and the node whose visit each one is, or None for
+    # generators run as part of the visit before them
+    routines = []
+    routine_nodes = []
+    stack = self._stack
+    visit_methods = self._visit_methods
+    unfinished = len(self._unfinished)
+    # Nodes visited since the budget was last checked, and when to check it
+    steps = 0
+    check_at = self.budget.next_check() if self.budget is not None else -1
+    item = node
+    while True:
+      if isinstance(item, ast.AST):
+        steps += 1
+        if steps == check_at:
+          self._check_budget(item, steps)
+          steps = 0
+          check_at = self.budget.next_check()
+        if self._enter_node(item):
+          stack.append(item)
+          ast_utils.setup_props(item)
+          try:
+            method = visit_methods[item.__class__]
+          except KeyError:
+            method = self._visit_method(item)
+          children = method(self, item)
+          if children is None:
+            self._leave_node(item)
+          else:
+            routines.append(children)
+            routine_nodes.append(item)
+      elif item is not None:
+        routines.append(item)
+        routine_nodes.append(None)
+
+      while routines:
+        item = next(routines[-1], _DONE)
+        if item is not _DONE:
+          break
+        routines.pop()
+        done = routine_nodes.pop()
+        if done is not None:
+          self._leave_node(done)
+      else:
+        if self.budget is not None:
+          self.budget.steps += steps
+        if len(self._unfinished) > unfinished:
+          node = self._unfinished[unfinished]
+          del self._unfinished[unfinished:]
+          raise _unfinished_error(node)
+        return
+
+  def _check_budget(self, node, steps):
+    """Count steps against the budget, and stop if it has run out."""
+    reason = self.budget.spend(steps)
+    if reason is not None:
+      raise budget_lib.BudgetExceeded(reason, self.budget.steps,
+                                      self.budget.elapsed(), node,
+                                      self._progress())
+
+  def _progress(self):
+    """Get how far the visit got, as an offset in the code."""
+    return None
+
+  def _visit_method(self, node):
+    """Look up the visit method of this visitor's class for a node."""
+    # Same as in ast.NodeVisitor.visit, but looked up once per visitor class
+    method = self._visit_methods[node.__class__] = getattr(
+        type(self), 'visit_' + node.__class__.__name__,
+        type(self).generic_visit)
+    return method
+
+  def _enter_node(self, node):
+    """Called before visiting a node. Returns False to skip the node."""
+    del node  # unused
+    return True
+
+  def _leave_node(self, node):
+    """Called after visiting a node and all the nodes inside it."""
     assert node is self._stack.pop()
 
+  def generic_visit(self, node):
+    """Visit each child of a node, in the order of its fields."""
+    for child in ast.iter_child_nodes(node):
+      yield child
+
   def prefix(self, node):
     """Account for some amount of whitespace as the prefix to a node."""
     self.attr(node, 'prefix', [self.ws])
@@ -123,15 +279,33 @@ class BaseVisitor(ast.NodeVisitor):
     """Account for some amount of whitespace as the suffix to a node."""
     self.attr(node, 'suffix', [lambda: self.ws(max_lines=max_lines)])
 
-  @contextlib.contextmanager
-  def scope(self, node, attr=None):
-    """Context manager to handle a parenthesized scope."""
+  def open_scope(self, node, attr=None):
+    """Account for the opening parentheses of a scope on a node."""
     if attr:
       self.attr(node, attr + '_prefix', [])
-    yield
+
+  def close_scope(self, node, attr=None):
+    """Account for the closing parentheses of a scope on a node."""
     if attr:
       self.attr(node, attr + '_suffix', [])
 
+  @contextlib.contextmanager
+  def scope(self, node, attr=None):
+    """Context manager to handle a parenthesized scope."""
+    self.open_scope(node, attr=attr)
+    yield
+    self.close_scope(node, attr=attr)
+
+  @staticmethod
+  def _compile_attr(attr, attr_name):
+    """Compile an attr of the syntax table into a function (visitor, node)."""
+    def visit_attr(self, node):
+      attr_vals = [self.ws if part is grammar.WS else part
+                   for part in attr.parts]
+      self.attr(node, attr_name, attr_vals, deps=attr.deps,
+                default=attr.default)
+    return visit_attr
+
   def token(self, token_val):
     """Account for a specific token."""
 
@@ -163,32 +337,32 @@ class BaseVisitor(ast.NodeVisitor):
 
   @block_statement
   def visit_Module(self, node):
-    self.generic_visit(node)
+    yield self.generic_visit(node)
     self.attr(node, 'suffix', [self.ws])
 
   @block_statement
   def visit_If(self, node):
     tok = 'elif' if ast_utils.prop(node, 'is_elif') else 'if'
     self.attr(node, 'open_if', [tok, self.ws], default=tok + ' ')
-    self.visit(node.test)
+    yield node.test
     self.attr(node, 'open_block', [self.ws, ':', self.ws_oneline],
               default=':\n')
 
     for stmt in node.body:
-      self.visit(stmt)
+      yield stmt
 
     if node.orelse:
       if (len(node.orelse) == 1 and isinstance(node.orelse[0], ast.If) and
           self.check_is_elif(node.orelse[0])):
         ast_utils.setprop(node.orelse[0], 'is_elif', True)
-        self.visit(node.orelse[0])
+        yield node.orelse[0]
       else:
         self.attr(node, 'elseprefix', [self.ws])
         self.token('else')
         self.attr(node, 'open_else', [self.ws, ':', self.ws_oneline],
                   default=':\n')
         for stmt in node.orelse:
-          self.visit(stmt)
+          yield stmt
 
   @abc.abstractmethod
   def check_is_elif(self, node):
@@ -214,56 +388,57 @@ class BaseVisitor(ast.NodeVisitor):
   @block_statement
   def visit_While(self, node):
     self.attr(node, 'while_keyword', ['while', self.ws], default='while ')
-    self.visit(node.test)
+    yield node.test
     self.attr(node, 'open_block', [self.ws, ':', self.ws_oneline],
               default=':\n')
     for stmt in node.body:
-      self.visit(stmt)
+      yield stmt
 
     if node.orelse:
       self.attr(node, 'else', [self.ws, 'else', self.ws, ':', self.ws_oneline],
                 default=':\n')
       for stmt in node.orelse:
-        self.visit(stmt)
+        yield stmt
 
   @block_statement
   def visit_For(self, node):
     self.attr(node, 'for_keyword', ['for', self.ws], default='for ')
-    self.visit(node.target)
+    yield node.target
     self.attr(node, 'for_in', [self.ws, 'in', self.ws], default=' in ')
-    self.visit(node.iter)
+    yield node.iter
     self.attr(node, 'open_block', [self.ws, ':', self.ws_oneline],
               default=':\n')
     for stmt in node.body:
-        self.visit(stmt)
+        yield stmt
 
     if node.orelse:
       self.attr(node, 'else', [self.ws, 'else', self.ws, ':', self.ws_oneline],
                 default=':\n')
 
       for stmt in node.orelse:
-        self.visit(stmt)
+        yield stmt
 
   @block_statement
   def visit_With(self, node):
     if hasattr(node, 'items'):
-      return self.visit_With_3(node)
+      yield self.visit_With_3(node)
+      return
     if not getattr(node, 'is_continued', False):
       self.attr(node, 'with', ['with', self.ws], default='with ')
-    self.visit(node.context_expr)
+    yield node.context_expr
     if node.optional_vars:
       self.attr(node, 'with_as', [self.ws, 'as', self.ws], default=' as ')
-      self.visit(node.optional_vars)
+      yield node.optional_vars
 
     if len(node.body) == 1 and self.check_is_continued_with(node.body[0]):
       node.body[0].is_continued = True
       self.attr(node, 'with_comma', [self.ws, ',', self.ws], default=', ')
-      self.visit(node.body[0])
+      yield node.body[0]
     else:
       self.attr(node, 'open_block', [self.ws, ':', self.ws_oneline],
                 default=':\n')
       for stmt in node.body:
-        self.visit(stmt)
+        yield stmt
 
   @abc.abstractmethod
   def check_is_continued_with(self, node):
@@ -288,26 +463,26 @@ class BaseVisitor(ast.NodeVisitor):
     self.token('with')
 
     for i, withitem in enumerate(node.items):
-      self.visit(withitem)
+      yield withitem
       if i != len(node.items) - 1:
         self.token(',')
 
     self.attr(node, 'with_body_open', [':', self.ws_oneline], default=':\n')
     for stmt in node.body:
-      self.visit(stmt)
+      yield stmt
 
   @space_around
   def visit_withitem(self, node):
-    self.visit(node.context_expr)
+    yield node.context_expr
     if node.optional_vars:
       self.attr(node, 'as', [self.ws, 'as', self.ws], default=' as ')
-      self.visit(node.optional_vars)
+      yield node.optional_vars
 
   @block_statement
   def visit_ClassDef(self, node):
     for i, decorator in enumerate(node.decorator_list):
       self.attr(node, 'decorator_prefix_%d' % i, [self.ws, '@'], default='@')
-      self.visit(decorator)
+      yield decorator
       self.attr(node, 'decorator_suffix_%d' % i, [self.ws], default='\n')
     self.attr(node, 'class_def', ['class', self.ws, node.name, self.ws],
               default='class %s' % node.name, deps=('name',))
@@ -316,7 +491,7 @@ class BaseVisitor(ast.NodeVisitor):
     else:
       self.optional_token(node, 'open_bases', '(')
     for i, base in enumerate(node.bases):
-      self.visit(base)
+      yield base
       self.attr(node, 'base_suffix_%d' % i, [self.ws])
       if base != node.bases[-1]:
         self.token(',')
@@ -328,31 +503,31 @@ class BaseVisitor(ast.NodeVisitor):
     self.attr(node, 'open_block', [self.ws, ':', self.ws_oneline],
               default=':\n')
     for stmt in node.body:
-      self.visit(stmt)
+      yield stmt
 
   @block_statement
   def visit_FunctionDef(self, node):
     for i, decorator in enumerate(node.decorator_list):
       self.attr(node, 'decorator_symbol_%d' % i, [self.ws, '@', self.ws],
                 default='@')
-      self.visit(decorator)
+      yield decorator
       self.attr(node, 'decorator_suffix_%d' % i, [self.ws_oneline],
                 default='\n')
     self.attr(node, 'function_def',
               [self.ws, 'def', self.ws, node.name, self.ws, '('],
               deps=('name',), default='def %s(' % node.name)
-    self.visit(node.args)
+    yield node.args
     self.attr(node, 'function_def_close', [self.ws, ')', self.ws], default=')')
 
     if getattr(node, 'returns', None):
       self.attr(node, 'returns_prefix', [self.ws, '->', self.ws],
                 deps=('returns',), default=' -> ')
-      self.visit(node.returns)
+      yield node.returns
 
     self.attr(node, 'open_block', [self.ws, ':', self.ws_oneline],
               default=':\n')
     for stmt in node.body:
-      self.visit(stmt)
+      yield stmt
 
   @block_statement
   def visit_TryFinally(self, node):
@@ -362,27 +537,27 @@ class BaseVisitor(ast.NodeVisitor):
       self.attr(node, 'open_try', ['try', self.ws, ':', self.ws_oneline],
                 default='try:\n')
     for stmt in node.body:
-      self.visit(stmt)
+      yield stmt
     self.attr(node, 'open_finally',
               [self.ws, 'finally', self.ws, ':', self.ws_oneline],
               default='finally:\n')
     for stmt in node.finalbody:
-      self.visit(stmt)
+      yield stmt
 
   @block_statement
   def visit_TryExcept(self, node):
     self.attr(node, 'open_try', ['try', self.ws, ':', self.ws_oneline],
               default='try:\n')
     for stmt in node.body:
-      self.visit(stmt)
+      yield stmt
     for handler in node.handlers:
-      self.visit(handler)
+      yield handler
     if node.orelse:
       self.attr(node, 'open_else',
                 [self.ws, 'else', self.ws, ':', self.ws_oneline],
                 default='else:\n')
       for stmt in node.orelse:
-        self.visit(stmt)
+        yield stmt
 
   @block_statement
   def visit_Try(self, node):
@@ -390,63 +565,64 @@ class BaseVisitor(ast.NodeVisitor):
     self.attr(node, 'open_try', [self.ws, 'try', self.ws, ':', self.ws_oneline],
               default='try:\n')
     for stmt in node.body:
-      self.visit(stmt)
+      yield stmt
     for handler in node.handlers:
-      self.visit(handler)
+      yield handler
     if node.orelse:
       self.attr(node, 'open_else',
                 [self.ws, 'else', self.ws, ':', self.ws_oneline],
                 default='else:\n')
       for stmt in node.orelse:
-        self.visit(stmt)
+        yield stmt
     if node.finalbody:
       self.attr(node, 'open_finally',
                 [self.ws, 'finally', self.ws, ':', self.ws_oneline],
                 default='finally:\n')
       for stmt in node.finalbody:
-        self.visit(stmt)
+        yield stmt
 
   @block_statement
   def visit_ExceptHandler(self, node):
     self.token('except')
     if node.type:
-      self.visit(node.type)
+      yield node.type
     if node.type and node.name:
       self.attr(node, 'as', [self.ws, self.one_of_symbols("as", ","), self.ws],
                 default=' as ')
     if node.name:
       if isinstance(node.name, ast.AST):
-        self.visit(node.name)
+        yield node.name
       else:
         self.token(node.name)
     self.attr(node, 'open_block', [self.ws, ':', self.ws_oneline],
               default=':\n')
     for stmt in node.body:
-      self.visit(stmt)
+      yield stmt
 
   @statement
   def visit_Raise(self, node):
     if hasattr(node, 'cause'):
-      return self.visit_Raise_3(node)
+      yield self.visit_Raise_3(node)
+      return
 
     self.token('raise')
     if node.type:
-      self.visit(node.type)
+      yield node.type
     if node.inst:
       self.attr(node, 'inst_prefix', [self.ws, ',', self.ws], default=', ')
-      self.visit(node.inst)
+      yield node.inst
     if node.tback:
       self.attr(node, 'tback_prefix', [self.ws, ',', self.ws], default=', ')
-      self.visit(node.tback)
+      yield node.tback
 
   def visit_Raise_3(self, node):
     if node.exc:
       self.attr(node, 'open_raise', ['raise', self.ws], default='raise ')
-      self.visit(node.exc)
+      yield node.exc
       if node.cause:
         self.attr(node, 'cause_prefix', [self.ws, 'from', self.ws],
                   default=' from ')
-        self.visit(node.cause)
+        yield node.cause
     else:
       self.token('raise')
 
@@ -454,61 +630,26 @@ class BaseVisitor(ast.NodeVisitor):
   # == STATEMENTS: Instructions without a return value                        ==
   # ============================================================================
 
-  @statement
-  def visit_Assert(self, node):
-    self.token('assert')
-    self.visit(node.test)
-    if node.msg:
-      self.token(',')
-      self.visit(node.msg)
-
-  @statement
-  def visit_Assign(self, node):
-    for i, target in enumerate(node.targets):
-      self.visit(target)
-      self.attr(node, 'equal_%d' % i, [self.ws, '=', self.ws], default=' = ')
-    self.visit(node.value)
-
   @statement
   def visit_AugAssign(self, node):
-    self.visit(node.target)
+    yield node.target
     op_token = '%s=' % ast_constants.NODE_TYPE_TO_TOKENS[type(node.op)][0]
     self.attr(node, 'operator', [self.ws, op_token, self.ws],
               default=' %s ' % op_token)
-    self.visit(node.value)
-
-  @statement
-  def visit_Break(self, node):
-    self.token('break')
-
-  @statement
-  def visit_Continue(self, node):
-    self.token('continue')
-
-  @statement
-  def visit_Delete(self, node):
-    self.attr(node, 'del', ['del', self.ws], default='del ')
-    for i, target in enumerate(node.targets):
-      self.visit(target)
-      if target is not node.targets[-1]:
-        self.attr(node, 'comma_%d' % i, [self.ws, ',', self.ws], default=', ')
+    yield node.value
 
   @statement
   def visit_Exec(self, node):
     self.attr(node, 'exec', ['exec', self.ws], default='exec ')
-    self.visit(node.body)
+    yield node.body
     if node.globals:
       self.attr(node, 'in_globals',
                 [self.ws, self.one_of_symbols('in', ','), self.ws],
                 default=' in ')
-      self.visit(node.globals)
+      yield node.globals
       if node.locals:
         self.attr(node, 'in_locals', [self.ws, ',', self.ws], default=', ')
-        self.visit(node.locals)
-
-  @statement
-  def visit_Expr(self, node):
-    self.visit(node.value)
+        yield node.locals
 
   @statement
   def visit_Global(self, node):
@@ -520,15 +661,6 @@ class BaseVisitor(ast.NodeVisitor):
       identifiers.extend([self.ws, ident])
     self.attr(node, 'names', identifiers)
 
-  @statement
-  def visit_Import(self, node):
-    self.attr(node, 'open_import', ['import', self.ws], default='import ')
-    for i, alias in enumerate(node.names):
-      self.visit(alias)
-      if alias != node.names[-1]:
-        self.attr(node, 'alias_sep_%d' % i, [self.ws, ',', self.ws],
-                  default=', ')
-
   @statement
   def visit_ImportFrom(self, node):
     self.token('from')
@@ -549,7 +681,7 @@ class BaseVisitor(ast.NodeVisitor):
     self.token('import')
     with self.scope(node, 'names'):
       for alias in node.names:
-        self.visit(alias)
+        yield alias
         if alias != node.names[-1]:
           self.token(',')
 
@@ -564,75 +696,47 @@ class BaseVisitor(ast.NodeVisitor):
       identifiers.extend([self.ws, ident])
     self.attr(node, 'names', identifiers)
 
-  @statement
-  def visit_Pass(self, node):
-    self.token('pass')
-
   @statement
   def visit_Print(self, node):
     self.attr(node, 'print_open', ['print', self.ws], default='print ')
     if node.dest:
       self.attr(node, 'redirection', ['>>', self.ws], default='>>')
-      self.visit(node.dest)
+      yield node.dest
       if node.values:
         self.attr(node, 'values_prefix', [self.ws, ',', self.ws], default=', ')
       elif not node.nl:
         self.attr(node, 'trailing_comma', [self.ws, ','], default=',')
 
     for i, value in enumerate(node.values):
-      self.visit(value)
+      yield value
       if value is not node.values[-1]:
         self.attr(node, 'comma_%d' % i, [self.ws, ',', self.ws], default=', ')
       elif not node.nl:
         self.attr(node, 'trailing_comma', [self.ws, ','], default=',')
 
-  @statement
-  def visit_Return(self, node):
-    self.token('return')
-    if node.value:
-      self.visit(node.value)
-
-  @statement
-  def visit_Yield(self, node):
-    self.token('yield')
-    if node.value:
-      self.visit(node.value)
-
   # ============================================================================
   # == EXPRESSIONS: Anything that evaluates and can be in parens              ==
   # ============================================================================
 
-  @expression
-  def visit_Attribute(self, node):
-    self.visit(node.value)
-    self.attr(node, 'dot', [self.ws, '.', self.ws], default='.')
-    self.token(node.attr)
-
-  @expression
-  def visit_BinOp(self, node):
-    self.visit(node.left)
-    self.visit(node.op)
-    self.visit(node.right)
-
   @expression
   def visit_BoolOp(self, node):
     op_symbol = ast_constants.NODE_TYPE_TO_TOKENS[type(node.op)][0]
     for i, value in enumerate(node.values):
-      self.visit(value)
+      yield value
       if value is not node.values[-1]:
         self.attr(node, 'op_%d' % i, [self.ws, op_symbol, self.ws],
                   default=' %s ' % op_symbol, deps=('op',))
 
   @expression
   def visit_Call(self, node):
-    self.visit(node.func)
+    yield node.func
     self.attr(node, 'open_call', [self.ws, '(', self.ws], default='(')
     num_items = (len(node.args) + len(node.keywords) +
                  (1 if node.starargs else 0) + (1 if node.kwargs else 0))
 
     i = 0
     for arg in node.args:
-      self.visit(arg)
+      yield arg
       if i < num_items - 1:
         self.attr(node, 'comma_%d' % i, [self.ws, ',', self.ws], default=', ')
       i += 1
@@ -643,9 +747,9 @@ class BaseVisitor(ast.NodeVisitor):
     while i < kw_end:
       if i == starargs_idx:
         self.attr(node, 'starargs_prefix', [self.ws, '*'], default='*')
-        self.visit(node.starargs)
+        yield node.starargs
       else:
-        self.visit(node.keywords[kw_idx])
+        yield node.keywords[kw_idx]
         kw_idx += 1
       if i < num_items - 1:
         self.attr(node, 'comma_%d' % i, [self.ws, ',', self.ws], default=', ')
@@ -653,7 +757,7 @@ class BaseVisitor(ast.NodeVisitor):
 
     if node.kwargs:
       self.attr(node, 'kwargs_prefix', [self.ws, '**', self.ws], default='**')
-      self.visit(node.kwargs)
+      yield node.kwargs
 
     self.attr(node, 'arguments_suffix', [self.ws], default='')
     if num_items > 0:
@@ -663,20 +767,20 @@ class BaseVisitor(ast.NodeVisitor):
 
   @expression
   def visit_Compare(self, node):
-    self.visit(node.left)
+    yield node.left
     for op, comparator in zip(node.ops, node.comparators):
-      self.visit(op)
-      self.visit(comparator)
+      yield op
+      yield comparator
 
   @expression
   def visit_Dict(self, node):
     self.token('{')
 
     for i, key, value in zip(range(len(node.keys)), node.keys, node.values):
-      self.visit(key)
+      yield key
       self.attr(node, 'key_val_sep_%d' % i, [self.ws, ':', self.ws],
                 default=': ')
-      self.visit(value)
+      yield value
       if value is not node.values[-1]:
         self.attr(node, 'comma_%d' % i, [self.ws, ',', self.ws], default=', ')
     self.optional_token(node, 'extracomma', ',')
@@ -685,222 +789,40 @@ class BaseVisitor(ast.NodeVisitor):
   @expression
   def visit_DictComp(self, node):
     self.attr(node, 'open_dict', ['{', self.ws], default='{')
-    self.visit(node.key)
+    yield node.key
     self.attr(node, 'key_val_sep', [self.ws, ':', self.ws], default=': ')
-    self.visit(node.value)
+    yield node.value
     for i, comp in enumerate(node.generators):
       self.attr(node, 'for_%d' % i, [self.ws, 'for', self.ws], default=' for ')
-      self.visit(comp)
+      yield comp
     self.attr(node, 'close_dict', [self.ws, '}'], default='}')
 
   @expression
   def visit_GeneratorExp(self, node):
-    self._comp_exp(node)
-
-  @expression
-  def visit_IfExp(self, node):
-    self.visit(node.body)
-    self.attr(node, 'if', [self.ws, 'if', self.ws], default=' if ')
-    self.visit(node.test)
-    self.attr(node, 'else', [self.ws, 'else', self.ws], default=' else ')
-    self.visit(node.orelse)
-
-  @expression
-  def visit_Lambda(self, node):
-    self.attr(node, 'lambda_def', ['lambda', self.ws], default='lambda ')
-    self.visit(node.args)
-    self.attr(node, 'open_lambda', [self.ws, ':', self.ws], default=': ')
-    self.visit(node.body)
-
-  @expression
-  def visit_List(self, node):
-    self.attr(node, 'list_open', ['[', self.ws], default='[')
-
-    for i, elt in enumerate(node.elts):
-      self.visit(elt)
-      if elt is not node.elts[-1]:
-        self.attr(node, 'comma_%d' % i, [self.ws, ',', self.ws], default=', ')
-    if node.elts:
-      self.optional_token(node, 'extracomma', ',')
-
-    self.attr(node, 'list_close', [self.ws, ']'], default=']')
+    yield self._comp_exp(node)
 
   @expression
   def visit_ListComp(self, node):
-    self._comp_exp(node, open_brace='[', close_brace=']')
+    yield self._comp_exp(node, open_brace='[', close_brace=']')
 
   def _comp_exp(self, node, open_brace=None, close_brace=None):
     if open_brace:
       self.attr(node, 'compexp_open', [open_brace, self.ws], default=open_brace)
-    self.visit(node.elt)
+    yield node.elt
     for i, comp in enumerate(node.generators):
       self.attr(node, 'for_%d' % i, [self.ws, 'for', self.ws], default=' for ')
-      self.visit(comp)
+      yield comp
     if close_brace:
       self.attr(node, 'compexp_close', [self.ws, close_brace],
                 default=close_brace)
 
-  @expression
-  def visit_Name(self, node):
-    self.token(node.id)
-
   @expression
   def visit_NameConstant(self, node):
     self.token(str(node.value))
 
-  @expression
-  def visit_Repr(self, node):
-    self.attr(node, 'repr_open', ['repr', self.ws, '('], default='repr(')
-    self.visit(node.value)
-    self.attr(node, 'repr_close', [self.ws, ')'], default=')')
-
-  @expression
-  def visit_Set(self, node):
-    self.attr(node, 'set_open', ['{', self.ws], default='{')
-
-    for i, elt in enumerate(node.elts):
-      self.visit(elt)
-      if elt is not node.elts[-1]:
-        self.attr(node, 'comma_%d' % i, [self.ws, ',', self.ws], default=', ')
-    if node.elts:
-      self.optional_token(node, 'extracomma', ',')
-
-    self.attr(node, 'set_close', [self.ws, '}'], default='}')
-
   @expression
   def visit_SetComp(self, node):
-    self._comp_exp(node, open_brace='{', close_brace='}')
-
-  @expression
-  def visit_Subscript(self, node):
-    self.visit(node.value)
-    self.visit(node.slice)
-
-  @expression
-  def visit_Tuple(self, node):
-    for i, elt in enumerate(node.elts):
-      self.visit(elt)
-      if elt is not node.elts[-1]:
-        self.attr(node, 'comma_%d' % i, [self.ws, ',', self.ws], default=', ')
-    if node.elts:
-      self.optional_token(node, 'extracomma', ',')
-
-  @expression
-  def visit_UnaryOp(self, node):
-    self.visit(node.op)
-    self.visit(node.operand)
-
-  # ============================================================================
-  # == OPERATORS AND TOKENS: Anything that's just whitespace and tokens       ==
-  # ============================================================================
-
-  @space_around
-  def visit_Ellipsis(self, node):
-    self.token('...')
-
-  @space_around
-  def visit_Add(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_Sub(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_Mult(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_Div(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_Mod(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_Pow(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_LShift(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_RShift(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_BitAnd(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_BitOr(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_BitXor(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_FloorDiv(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_Invert(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_Not(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_UAdd(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_USub(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_Eq(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_NotEq(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_Lt(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_LtE(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_Gt(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_GtE(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_Is(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_IsNot(self, node):
-    self.attr(node, 'content', ['is', self.ws, 'not'], default='is not')
-
-  @space_around
-  def visit_In(self, node):
-    self.token(ast_constants.NODE_TYPE_TO_TOKENS[type(node)][0])
-
-  @space_around
-  def visit_NotIn(self, node):
-    self.attr(node, 'content', ['not', self.ws, 'in'], default='not in')
+    yield self._comp_exp(node, open_brace='{', close_brace='}')
 
   # ============================================================================
   # == MISC NODES: Nodes which are neither statements nor expressions         ==
@@ -920,14 +842,6 @@ class BaseVisitor(ast.NodeVisitor):
       self.attr(node, 'asname', [self.ws, 'as', self.ws], default=' as ')
       self.token(node.asname)
 
-  @space_around
-  def visit_arg(self, node):
-    self.token(node.arg)
-    if node.annotation is not None:
-      self.attr(node, 'annotation_prefix', [self.ws, ':', self.ws],
-                default=': ')
-      self.visit(node.annotation)
-
   @space_around
   def visit_arguments(self, node):
     total_args = (len(node.args) +
@@ -939,17 +853,17 @@ class BaseVisitor(ast.NodeVisitor):
     keyword = node.args[-len(node.defaults):] if node.defaults else node.args
 
     for arg in positional:
-      self.visit(arg)
+      yield arg
       arg_i += 1
       if arg_i < total_args:
         self.attr(node, 'comma_%d' % arg_i, [self.ws, ',', self.ws],
                   default=', ')
 
     for i, arg, default in zip(range(len(keyword)), keyword, node.defaults):
-      self.visit(arg)
+      yield arg
       self.attr(node, 'default_%d' % i, [self.ws, '=', self.ws],
                 default='=')
-      self.visit(default)
+      yield default
       arg_i += 1
       if arg_i < total_args:
         self.attr(node, 'comma_%d' % arg_i, [self.ws, ',', self.ws],
@@ -958,7 +872,7 @@ class BaseVisitor(ast.NodeVisitor):
     if node.vararg:
       self.attr(node, 'vararg_prefix', [self.ws, '*', self.ws], default='*')
       if isinstance(node.vararg, ast.AST):
-        self.visit(node.vararg)
+        yield node.vararg
       else:
         self.token(node.vararg)
         self.attr(node, 'vararg_suffix', [self.ws])
@@ -969,7 +883,7 @@ class BaseVisitor(ast.NodeVisitor):
     if node.kwarg:
       self.attr(node, 'kwarg_prefix', [self.ws, '**', self.ws], default='**')
       if isinstance(node.kwarg, ast.AST):
-        self.visit(node.kwarg)
+        yield node.kwarg
       else:
         self.token(node.kwarg)
         self.attr(node, 'kwarg_suffix', [self.ws])
@@ -979,24 +893,18 @@ class BaseVisitor(ast.NodeVisitor):
 
   @space_around
   def visit_comprehension(self, node):
-    self.visit(node.target)
+    yield node.target
     self.attr(node, 'in', [self.ws, 'in', self.ws], default=' in ')
-    self.visit(node.iter)
+    yield node.iter
     for i, if_expr in enumerate(node.ifs):
       self.attr(node, 'if_%d' % i, [self.ws, 'if', self.ws], default=' if ')
-      self.visit(if_expr)
-
-  @space_around
-  def visit_keyword(self, node):
-    self.token(node.arg)
-    self.attr(node, 'eq', [self.ws, '='], default='=')
-    self.visit(node.value)
+      yield if_expr
 
   @space_left
   def visit_Index(self, node, in_ext=False):
     if len(self._stack) > 1 and not isinstance(self._stack[-2], ast.ExtSlice):
       self.attr(node, 'index_open', ['[', self.ws], default='[')
-    self.visit(node.value)
+    yield node.value
     if len(self._stack) > 1 and not isinstance(self._stack[-2], ast.ExtSlice):
       self.attr(node, 'index_close', [self.ws, ']'], default=']')
 
@@ -1004,7 +912,7 @@ class BaseVisitor(ast.NodeVisitor):
   def visit_ExtSlice(self, node):
     self.token('[')
     for i, dim in enumerate(node.dims):
-      self.visit(dim)
+      yield dim
       if dim is not node.dims[-1]:
         self.attr(node, 'dim_sep_%d' % i, [self.ws, ',', self.ws], default=', ')
 
@@ -1016,30 +924,42 @@ class BaseVisitor(ast.NodeVisitor):
       self.attr(node, 'index_open', ['[', self.ws], default='[')
 
     if node.lower:
-      self.visit(node.lower)
+      yield node.lower
 
     self.attr(node, 'lowerspace', [self.ws, ':', self.ws])
 
     if node.upper:
-      self.visit(node.upper)
+      yield node.upper
 
     if node.step:
       self.attr(node, 'stepspace', [self.ws, ':', self.ws])
-      self.visit(node.step)
+      yield node.step
 
     if len(self._stack) > 1 and not isinstance(self._stack[-2], ast.ExtSlice):
       self.attr(node, 'index_close', [self.ws, ']'], default=']')
 
 
+install_syntax(BaseVisitor)
+
+
 class AnnotationError(Exception):
   """An exception for when we failed to annotate the tree."""
 
 
 class AstAnnotator(BaseVisitor):
 
-  def __init__(self, source):
-    super(AstAnnotator, self).__init__()
-    self.tokens = token_generator.TokenGenerator(source)
+  def __init__(self, source, tokenizer=None, tokens=None, token_window=None,
+               budget=None):
+    super(AstAnnotator, self).__init__(budget=budget)
+    self.tokens = token_generator.TokenGenerator(
+        source, tokenizer=tokenizer, tokens=tokens, window=token_window)
+    self._strings = {}
+    # Offset in the source at which each node being visited starts
+    self._starts = []
+    # The formatting of each top-level statement refers to the source through
+    # a Source of its own, so that the statement can be moved by itself
+    self._module_source = ast_utils.Source(self.tokens.source())
+    self._source = self._module_source
 
   def visit(self, node):
     try:
@@ -1047,6 +967,30 @@ class AstAnnotator(BaseVisitor):
     except (TypeError, ValueError, IndexError, KeyError) as e:
       raise AnnotationError(e)
 
+  def _enter_node(self, node):
+    self._starts.append(self.tokens.offset())
+    if isinstance(node, ast.stmt) and self._at_top_level():
+      self._source = self._module_source.derive(0)
+    return True
+
+  def _at_top_level(self):
+    return not self._stack or isinstance(self._stack[-1], ast.Module)
+
+  def _progress(self):
+    return self.tokens.offset()
+
+  def _leave_node(self, node):
+    super(AstAnnotator, self)._leave_node(node)
+    start = self._starts.pop()
+    # Record the source of each statement so that, if it has not changed, it
+    # can be copied verbatim when printing. The span of a module keeps a
+    # reference to the whole source it was parsed from.
+    if isinstance(node, (ast.stmt, ast.Module)):
+      ast_utils.setprop_from_source(node, 'span', self._source, start,
+                                    self.tokens.offset())
+      if self._at_top_level():
+        self._source = self._module_source
+
   @expression
   def visit_Num(self, node):
     """Annotate a Num node with the exact number format."""
@@ -1085,8 +1029,9 @@ class AstAnnotator(BaseVisitor):
     return self.tokens.whitespace(max_lines=max_lines)
 
   def block_suffix(self, node, indent_level):
-    ast_utils.setprop(node, 'suffix',
-                      self.tokens.block_whitespace(indent_level))
+    start = self.tokens.offset()
+    self._set_from_source(node, 'suffix',
+                          self.tokens.block_whitespace(indent_level), start)
 
   def token(self, token_val):
     """Parse a single token with exactly the given value."""
@@ -1157,17 +1102,89 @@ class AstAnnotator(BaseVisitor):
     if deps:
       for dep in deps:
         ast_utils.setprop(node, dep + '__src', getattr(node, dep, None))
+    start = self.tokens.offset()
     attr_parts = []
     for attr_val in attr_vals:
       if isinstance(attr_val, six.string_types):
         attr_parts.append(self.token(attr_val))
       else:
         attr_parts.append(attr_val())
-    ast_utils.setprop(node, attr_name, ''.join(attr_parts))
+    self._set_from_source(node, attr_name, ''.join(attr_parts), start)
 
-  def scope(self, node, attr=None):
-    """Return a context manager to handle a parenthesized scope."""
-    return self.tokens.scope(node, attr=attr)
+  def _set_from_source(self, node, attr_name, value, start):
+    """Store formatting which was parsed from the source at offset `start`.
+
+    Long values copied verbatim from the source are stored as offsets into it.
+    Other values are shared between all nodes with the same formatting.
+    """
+    if len(value) >= _MIN_SLICE_LENGTH:
+      end = self.tokens.offset()
+      if (end - start == len(value) and
+          self.tokens.source().startswith(value, start)):
+        ast_utils.setprop_from_source(node, attr_name, self._source, start,
+                                      end)
+        return
+    ast_utils.setprop(node, attr_name, self._strings.setdefault(value, value))
+
+  def open_scope(self, node, attr=None):
+    """Parse the opening parentheses of a scope on a node."""
+    del attr  # unused
+    self.tokens.open_scope(node)
+
+  def close_scope(self, node, attr=None):
+    """Parse the closing parentheses of a scope on a node."""
+    if attr:
+      self.tokens.close_scope(node, prefix_attr=attr + '_prefix',
+                              suffix_attr=attr + '_suffix')
+    else:
+      self.tokens.close_scope(node)
+
+  def prefix(self, node):
+    """Parse the whitespace prefix of a node."""
+    start = self.tokens.offset()
+    self._set_from_source(node, 'prefix', self.tokens.whitespace(), start)
+
+  def suffix(self, node, max_lines=None):
+    """Parse the whitespace suffix of a node."""
+    start = self.tokens.offset()
+    self._set_from_source(node, 'suffix',
+                          self.tokens.whitespace(max_lines=max_lines), start)
+
+  @staticmethod
+  def _compile_attr(attr, attr_name):
+    """Compile an attr of the syntax table into a function (visitor, node).
+
+    The usual forms of attr, a token with whitespace on one or both sides, are
+    parsed directly rather than by passing a list of their parts to `attr`.
+    """
+    is_ws = tuple(part is grammar.WS for part in attr.parts)
+    if attr.deps or is_ws not in ((True, False, True), (True, False),
+                                  (False, True)):
+      return BaseVisitor._compile_attr(attr, attr_name)
+    token = attr.parts[is_ws.index(False)]
+
+    if len(is_ws) == 3:
+
+      def parse_attr(self, node):
+        tokens = self.tokens
+        start = tokens.offset()
+        value = tokens.whitespace() + self.token(token) + tokens.whitespace()
+        self._set_from_source(node, attr_name, value, start)
+    elif is_ws[0]:
+
+      def parse_attr(self, node):
+        tokens = self.tokens
+        start = tokens.offset()
+        value = tokens.whitespace() + self.token(token)
+        self._set_from_source(node, attr_name, value, start)
+    else:
+
+      def parse_attr(self, node):
+        tokens = self.tokens
+        start = tokens.offset()
+        value = self.token(token) + tokens.whitespace()
+        self._set_from_source(node, attr_name, value, start)
+    return parse_attr
 
   def _optional_token(self, token_type, token_val):
     token = self.tokens.peek()
@@ -1176,3 +1193,6 @@ class AstAnnotator(BaseVisitor):
     else:
       self.tokens.next()
       return token.src + self.ws()
+
+
+install_syntax(AstAnnotator)
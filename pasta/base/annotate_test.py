@@ -20,10 +20,13 @@ from __future__ import print_function
 
 import ast
 import difflib
+import io
 import os.path
+from six import StringIO
 from six import with_metaclass
 import sys
 import textwrap
+import tokenize
 import unittest
 
 import pasta
@@ -105,6 +108,120 @@ class PrefixSuffixTest(test_utils.TestCase):
     self.assertEqual('\n', ast_utils.prop(t.body[1], 'prefix'))
     self.assertEqual('', ast_utils.prop(t.body[1], 'suffix'))
 
+  def test_visit_methods_per_class(self):
+    names = []
+
+    class NameAnnotator(annotate.AstAnnotator):
+
+      def visit_Name(self, node):
+        names.append(node.id)
+        super(NameAnnotator, self).visit_Name(node)
+
+    src = 'a = (b)  # c\n'
+    t = ast.parse(src)
+    annotate.AstAnnotator(src).visit(t)
+    expected = pasta.dump(t)
+    NameAnnotator(src).visit(ast.parse(src))
+    annotate.AstAnnotator(src).visit(t)
+    self.assertEqual(['a', 'b'], names)
+    self.assertEqual(expected, pasta.dump(t))
+
+  def test_override_without_children(self):
+
+    class AssignAnnotator(annotate.AstAnnotator):
+
+      def visit_Assign(self, node):
+        # Drops the children to visit, which the method must return
+        super(AssignAnnotator, self).visit_Assign(node)
+
+    class ModuleAnnotator(annotate.AstAnnotator):
+
+      def visit_Module(self, node):
+        super(ModuleAnnotator, self).visit_Module(node)
+
+    src = 'a = b\n'
+    with self.assertRaisesRegexp(annotate.AnnotationError, 'Assign'):
+      AssignAnnotator(src).visit(ast.parse(src))
+    with self.assertRaisesRegexp(annotate.AnnotationError, 'Module'):
+      ModuleAnnotator(src).visit(ast.parse(src))
+
+
+class AnnotateTreeTest(test_utils.TestCase):
+
+  src = 'def foo(a):  # one\n  return (a +\n          1)\n\nb = foo\n'
+
+  def assertAnnotatedLikeParse(self, t):
+    expected = pasta.parse(self.src)
+    for node, expected_node in zip(ast.walk(t), ast.walk(expected)):
+      self.assertEqual(ast_utils.prop(expected_node, 'prefix'),
+                       ast_utils.prop(node, 'prefix'))
+      self.assertEqual(ast_utils.prop(expected_node, 'suffix'),
+                       ast_utils.prop(node, 'suffix'))
+    self.assertEqual(self.src, pasta.dump(t))
+
+  def test_annotate(self):
+    t = ast.parse(self.src)
+    self.assertIs(t, pasta.annotate(t, self.src))
+    self.assertAnnotatedLikeParse(t)
+
+  def test_annotate_with_tokens(self):
+    t = ast.parse(self.src)
+    tokens = list(tokenize.generate_tokens(StringIO(self.src).readline))
+    pasta.annotate(t, self.src, tokens=tokens, keep_tokens=True)
+    self.assertAnnotatedLikeParse(t)
+    self.assertEqual([tok[:4] for tok in tokens],
+                     [tok[:4] for tok in pasta.tokens(t).tokens()])
+
+  @unittest.skipIf(not hasattr(tokenize, 'ENCODING'),
+                   'tokenize cannot read bytes in this version of python.')
+  def test_annotate_with_tokens_from_bytes(self):
+    t = ast.parse(self.src)
+    tokens = tokenize.tokenize(io.BytesIO(self.src.encode('utf-8')).readline)
+    pasta.annotate(t, self.src, tokens=tokens)
+    self.assertAnnotatedLikeParse(t)
+
+
+class DeepNestingTest(test_utils.TestCase):
+  """Checks that annotating and printing do not recurse for each nested node."""
+
+  depth = 10000
+
+  def parse_deep(self, src):
+    # Only ast.parse needs a higher recursion limit for this much nesting
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 10 * self.depth))
+    try:
+      return ast.parse(src)
+    finally:
+      sys.setrecursionlimit(limit)
+
+  def assertAnnotatesAndPrints(self, src):
+    t = self.parse_deep(src)
+    pasta.annotate(t, src)
+    # The tree is not tracked, so every node is printed
+    self.assertEqual(src, pasta.dump(t))
+
+  def test_binary_operations(self):
+    self.assertAnnotatesAndPrints(
+        'x = ' + ' + '.join('a%d' % i for i in range(self.depth)) + '\n')
+
+  def test_attributes(self):
+    self.assertAnnotatesAndPrints('x = a' + ' . b' * self.depth + '\n')
+
+  def test_parenthesized_binary_operations(self):
+    self.assertAnnotatesAndPrints(
+        'x = (a0) + ' + ' + '.join('a%d' % i for i in range(1, self.depth)) +
+        '\n')
+
+  def test_parenthesized_attributes(self):
+    self.assertAnnotatesAndPrints('x = ( a )' + '.b' * self.depth + '\n')
+
+  def test_calls(self):
+    t = ast.parse('f(a)\n')
+    if not hasattr(t.body[0].value, 'starargs'):
+      self.skipTest('Calls are not annotated in this version of python.')
+    self.assertAnnotatesAndPrints('x = f' + '(a)' * self.depth + '\n')
+
 
 def _is_syntax_valid(filepath):
   with open(filepath, 'r') as f:
@@ -236,6 +353,8 @@ def suite():
   result = unittest.TestSuite()
   result.addTests(unittest.makeSuite(SymmetricTest))
   result.addTests(unittest.makeSuite(PrefixSuffixTest))
+  result.addTests(unittest.makeSuite(AnnotateTreeTest))
+  result.addTests(unittest.makeSuite(DeepNestingTest))
   result.addTests(unittest.makeSuite(PrefixSuffixGoldenTest))
   return result
 
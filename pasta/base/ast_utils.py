@@ -18,8 +18,9 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import __future__
 import ast
-import collections
+import copy
 import itertools
 import re
 
@@ -28,6 +29,10 @@ from pasta.augment import errors
 # From PEP-0263 -- https://www.python.org/dev/peps/pep-0263/
 _CODING_PATTERN = re.compile('^[ \t\v]*#.*?coding[:=][ \t]*([-_.a-zA-Z0-9]+)')
 
+# Lines as python counts them; unlike str.splitlines, this does not break lines
+# on characters such as form feeds.
+_LINE_PATTERN = re.compile(r'[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+$')
+
 PASTA_DICT = '__pasta__'
 
 
@@ -60,18 +65,31 @@ _AST_OP_NODES = (
 ) 
 
 
-class _TreeNormalizer(ast.NodeTransformer):
+def normalize(tree):
   """Replaces all op nodes with unique instances."""
-
-  def visit(self, node):
-    if isinstance(node, _AST_OP_NODES):
-      return node.__class__()
-    return super(_TreeNormalizer, self).visit(node)
+  for _ in walk_and_normalize(tree):
+    pass
+  return tree
 
 
-def normalize(tree):
-  _TreeNormalizer().visit(tree)
-  return tree
+def walk_and_normalize(tree):
+  """Normalize a tree while walking it; yields every node but op nodes."""
+  stack = [tree]
+  while stack:
+    node = stack.pop()
+    yield node
+    for field in node._fields:
+      value = getattr(node, field, None)
+      if type(value) is list:
+        for i, item in enumerate(value):
+          if isinstance(item, _AST_OP_NODES):
+            value[i] = item.__class__()
+          elif isinstance(item, ast.AST):
+            stack.append(item)
+      elif isinstance(value, _AST_OP_NODES):
+        setattr(node, field, value.__class__())
+      elif isinstance(value, ast.AST):
+        stack.append(value)
 
 
 def parse(src):
@@ -83,11 +101,57 @@ def sanitize_source(src):
 
   This is a workaround for https://bugs.python.org/issue18960. Also see PEP-0263.
   """
-  src_lines = src.splitlines(True)
+  # The directive can only be on the first two lines, so the rest of the source
+  # is not split into lines, and is not copied if there is no directive
+  end = src.find('\n', src.find('\n') + 1) + 1 or len(src)
+  src_lines = src[:end].splitlines(True)
+  sanitized = False
   for i, line in enumerate(src_lines[:2]):
     if _CODING_PATTERN.match(line):
       src_lines[i] = re.sub('#.*$', '# (removed coding)', line)
-  return ''.join(src_lines)
+      sanitized = True
+  if not sanitized:
+    return src
+  return ''.join(src_lines) + src[end:]
+
+
+def splitlines(src):
+  """Split source code into lines, keeping line endings.
+
+  Line i of the result (counting from 1) is the line with `lineno` i in the
+  syntax tree of the source.
+  """
+  return _LINE_PATTERN.findall(src)
+
+
+def future_flags(tree):
+  """Get the compiler flags for the __future__ imports in a module."""
+  flags = 0
+  for stmt in tree.body:
+    if isinstance(stmt, ast.ImportFrom) and stmt.module == '__future__':
+      for alias in stmt.names:
+        feature = getattr(__future__, alias.name, None)
+        flags |= getattr(feature, 'compiler_flag', 0)
+  return flags
+
+
+def nodes_equal(a, b):
+  """Compare two syntax trees, ignoring formatting and positions."""
+  stack = [(a, b)]
+  while stack:
+    a, b = stack.pop()
+    if type(a) is not type(b):
+      return False
+    if isinstance(a, ast.AST):
+      for field in a._fields:
+        stack.append((getattr(a, field, None), getattr(b, field, None)))
+    elif isinstance(a, list):
+      if len(a) != len(b):
+        return False
+      stack.extend(zip(a, b))
+    elif a != b:
+      return False
+  return True
 
 
 def space_between(from_loc, to_loc, line, lines):
@@ -104,41 +168,519 @@ def space_between(from_loc, to_loc, line, lines):
   if from_loc[0] == to_loc[0]:
     return line[from_loc[1]:to_loc[1]]
 
-  result = lines[from_loc[0] - 1][from_loc[1]:]
-  for line in lines[from_loc[0]:to_loc[0] - 1]:
-    result += line
-  else:
-    line = to_loc
-  if to_loc[1]:
-    result += lines[to_loc[0] - 1][:to_loc[1]]
+  return ''.join([lines[from_loc[0] - 1][from_loc[1]:]] +
+                 lines[from_loc[0]:to_loc[0] - 1] +
+                 [lines[to_loc[0] - 1][:to_loc[1]] if to_loc[1] else ''])
+
+
+class Formatting(object):
+  """Formatting information stored on a node, keyed by attribute name.
+
+  This behaves like a dict in which missing values read as empty strings. The
+  values every node has are kept in slots, and any others in a dict which is
+  only created when needed.
+
+  Values copied verbatim from the source can be stored as their offsets in the
+  source (see setprop_from_source), and are only turned back into strings when
+  read.
+
+  Attributes:
+    ref: (Source) The source which values stored as offsets refer to, or None.
+  """
+  __slots__ = ('ref', 'prefix', 'suffix', 'span', '_other')
+  _SLOTS = frozenset(('prefix', 'suffix', 'span'))
+
+  def __init__(self, items=()):
+    self.ref = None
+    self._other = None
+    for key, value in items:
+      self[key] = value
+
+  def __getitem__(self, key):
+    # This is read very often, so _raw and _text are inlined
+    if key in self._SLOTS:
+      value = getattr(self, key, '')
+    elif self._other is None:
+      return ''
+    else:
+      value = self._other.get(key, '')
+    if type(value) is _SourceSlice:
+      ref = self.ref
+      start = (value >> _SLICE_BITS) + ref.offset
+      return ref.root._text[start:start + (value & _SLICE_MASK)]
+    return value
+
+  def __setitem__(self, key, value):
+    if key in self._SLOTS:
+      setattr(self, key, value)
+    elif self._other is None:
+      self._other = {key: value}
+    else:
+      self._other[key] = value
+
+  def __delitem__(self, key):
+    try:
+      if key in self._SLOTS:
+        delattr(self, key)
+      else:
+        del self._other[key]
+    except (AttributeError, KeyError, TypeError):
+      raise KeyError(key)
+
+  def __contains__(self, key):
+    return self._raw(key, _MISSING) is not _MISSING
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def __len__(self):
+    return len(self.keys())
+
+  def keys(self):
+    result = [key for key in ('prefix', 'suffix', 'span') if hasattr(self, key)]
+    if self._other:
+      result.extend(self._other)
+    return result
+
+  def get(self, key, default=None):
+    return self._text(self._raw(key, default))
+
+  def pop(self, key, *args):
+    value = self._raw(key, _MISSING)
+    if value is _MISSING:
+      if args:
+        return args[0]
+      raise KeyError(key)
+    del self[key]
+    return self._text(value)
+
+  def setdefault(self, key, default=None):
+    value = self._raw(key, _MISSING)
+    if value is _MISSING:
+      self[key] = value = default
+    return self._text(value)
+
+  def items(self):
+    return [(key, self[key]) for key in self.keys()]
+
+  def values(self):
+    return [self[key] for key in self.keys()]
+
+  @property
+  def source(self):
+    """The source code which values stored as offsets are part of, or None."""
+    return self.ref.text if self.ref is not None else None
+
+  def copy(self):
+    result = Formatting(self._raw_items())
+    result.ref = self.ref
+    return result
+
+  def __eq__(self, other):
+    if isinstance(other, Formatting):
+      other = dict(other.items())
+    return dict(self.items()) == other
+
+  def __ne__(self, other):
+    return not self == other
+
+  __hash__ = None
+
+  def __repr__(self):
+    return 'Formatting(%r)' % dict(self.items())
+
+  def __reduce__(self):
+    # Offsets are pickled as plain ints, which take much less space
+    items = []
+    slices = []
+    for key, value in self._raw_items():
+      if type(value) is _SourceSlice:
+        slices.extend((key, int(value)))
+      else:
+        items.extend((key, value))
+    return _restore_formatting, (self.ref, tuple(items), tuple(slices))
+
+  def set_from_source(self, key, source, start, end):
+    """Set a value to the text of the source between two offsets.
+
+    Arguments:
+      key: (string) Name of the value.
+      source: (Source or string) The source, or its text.
+      start: (int) Offset in the text where the value starts.
+      end: (int) Offset in the text where the value ends.
+    """
+    text = source.text if isinstance(source, Source) else source
+    if self.ref is None:
+      self.ref = source if isinstance(source, Source) else Source(source)
+    if self.ref.text is text:
+      # Offsets are stored relative to those of the Source
+      value = _SourceSlice(((start - self.ref.offset) << _SLICE_BITS) |
+                           (end - start))
+    else:
+      value = text[start:end]
+    if key != 'span' and 'span' in self:
+      del self['span']
+    self[key] = value
+
+  def source_range(self, key):
+    """Get the (start, end) offsets of a value stored as offsets, else None."""
+    value = self._raw(key, None)
+    if type(value) is not _SourceSlice:
+      return None
+    start = (value >> _SLICE_BITS) + self.ref.offset
+    return start, start + (value & _SLICE_MASK)
+
+  def _raw(self, key, default):
+    if key in self._SLOTS:
+      return getattr(self, key, default)
+    if self._other is None:
+      return default
+    return self._other.get(key, default)
+
+  def _raw_items(self):
+    return [(key, self._raw(key, None)) for key in self.keys()]
+
+  def _text(self, value):
+    if type(value) is _SourceSlice:
+      start = (value >> _SLICE_BITS) + self.ref.offset
+      return self.ref.text[start:start + (value & _SLICE_MASK)]
+    return value
+
+
+_MISSING = object()
+
+
+def _restore_formatting(ref, items, slices):
+  """Rebuild a Formatting from the flat sequences it was pickled as."""
+  result = Formatting()
+  result.ref = ref
+  for i in range(0, len(items), 2):
+    result[items[i]] = items[i + 1]
+  for i in range(0, len(slices), 2):
+    result[slices[i]] = _SourceSlice(slices[i + 1])
+  return result
+
+
+_SLICE_BITS = 32
+_SLICE_MASK = (1 << _SLICE_BITS) - 1
+
+
+class _SourceSlice(int):
+  """Start offset and length of a value in the source, packed into an int."""
+  __slots__ = ()
+
+
+class Source(object):
+  """Source code which formatting values are stored as offsets into.
+
+  The formatting of each top-level statement of a module refers to the
+  module's source through a Source of its own, derived from the module's. They
+  all share the same text, which can be replaced for all of them at once, and
+  each has an offset which moves its statement within the text, without
+  visiting the nodes of the statement. See pasta.base.incremental.
+
+  Attributes:
+    root: (Source) The Source holding the text, which may be this one.
+    offset: (int) Offset in the text which the offsets stored into this Source
+      are relative to.
+    lines: (int) Number of lines by which the statement was moved, which are
+      not yet added to the line numbers of its nodes.
+  """
+  __slots__ = ('root', 'offset', 'lines', '_text')
+
+  def __init__(self, text, offset=0):
+    self.root = self
+    self.offset = offset
+    self.lines = 0
+    self._text = text
+
+  @property
+  def text(self):
+    """The source code, shared by all Sources with the same root."""
+    return self.root._text
+
+  @text.setter
+  def text(self, text):
+    self.root._text = text
+
+  def derive(self, offset):
+    """Get a new Source sharing the text of this one, at another offset."""
+    result = Source(None, offset)
+    result.root = self.root
+    return result
+
+  def __copy__(self):
+    return self
+
+  # Deep copies of a tree get Sources of their own, sharing the same text, so
+  # that moving the statements of one tree does not move those of its copies
+  def __reduce__(self):
+    if self.root is self:
+      return Source, (self._text, self.offset)
+    return _derived_source, (self.root, self.offset, self.lines)
+
+
+def _derived_source(root, offset, lines=0):
+  result = root.derive(offset)
+  result.lines = lines
   return result
 
 
 def setup_props(node):
   if not hasattr(node, PASTA_DICT):
     try:
-      setattr(node, PASTA_DICT, collections.defaultdict(lambda: ''))
+      setattr(node, PASTA_DICT, Formatting())
     except AttributeError:
       pass
 
 
+def _props(node):
+  """Get the formatting dict of a node, computing it first if deferred.
+
+  The formatting of nodes parsed lazily (see pasta.base.lazy) is a placeholder
+  with a `materialize` method, which annotates the statement it belongs to.
+  """
+  props = getattr(node, PASTA_DICT)
+  if not isinstance(props, Formatting):
+    props.materialize()
+    props = getattr(node, PASTA_DICT, None)
+    if not isinstance(props, Formatting):
+      # The node was detached from its statement before it was annotated
+      delattr(node, PASTA_DICT)
+      setup_props(node)
+      props = getattr(node, PASTA_DICT)
+  return props
+
+
 def prop(node, name):
   if hasattr(node, PASTA_DICT):
-    return getattr(node, PASTA_DICT)[name]
+    return _props(node)[name]
   return None
 
 
 def setprop(node, name, value):
   setup_props(node)
-  getattr(node, PASTA_DICT)[name] = value
+  _update_prop(node, _props(node), name, value)
+
+
+def setprop_from_source(node, name, source, start, end):
+  """Set a formatting value to the text of the source between two offsets.
+
+  Unlike setprop, the value is not copied but kept as offsets into `source`,
+  which is a Source or its text.
+  """
+  setup_props(node)
+  _props(node).set_from_source(name, source, start, end)
+
+
+def rebase(tree, source, offset):
+  """Make formatting stored as offsets refer to a source containing its own.
+
+  Arguments:
+    tree: (ast.AST) Syntax tree annotated from part of `source`.
+    source: (Source) The new source.
+    offset: (int) Offset in the text of `source` where the tree's source starts.
+  """
+  moved = {}
+  stack = [tree]
+  while stack:
+    node = stack.pop()
+    props = getattr(node, PASTA_DICT, None)
+    ref = getattr(props, 'ref', None)
+    if ref is not None:
+      if ref not in moved:
+        moved[ref] = source.derive(ref.offset + offset)
+      props.ref = moved[ref]
+    for field in node._fields:
+      value = getattr(node, field, None)
+      if type(value) is list:
+        stack.extend(item for item in value if isinstance(item, ast.AST))
+      elif isinstance(value, ast.AST):
+        stack.append(value)
 
 
 def appendprop(node, name, value):
-  getattr(node, PASTA_DICT)[name] += value
+  props = _props(node)
+  _update_prop(node, props, name, props[name] + value)
 
 
 def prependprop(node, name, value):
-  getattr(node, PASTA_DICT)[name] = value + getattr(node, PASTA_DICT)[name]
+  props = _props(node)
+  _update_prop(node, props, name, value + props[name])
+
+
+def _update_prop(node, props, name, value):
+  """Set a formatting value, forgetting the node's span if it changed.
+
+  Once its formatting has changed, the source of a node can no longer be copied
+  verbatim from the span it was parsed from, and the change is recorded if the
+  node's tree is tracked.
+  """
+  if name == 'span' or props.get(name) == value:
+    props[name] = value
+    return
+  if hasattr(props, 'span'):
+    del props.span
+  props[name] = value
+  mark_changed(node)
+
+
+_TRACKING = '__pasta_tracking__'
+
+
+class _Tracking(object):
+  """Changes recorded for a node of a tracked tree.
+
+  Attributes:
+    parent: (ast.AST) The node's parent, or None for the root of the tree.
+    changed: (bool) Whether the node or any node inside it was modified.
+    modified: (set) For the root only, the nodes which were modified.
+    fields: (tuple) Values of the node's fields when they were last checked,
+      with lists of child nodes as tuples. Child nodes are compared by
+      identity, so this is not a copy of the tree.
+  """
+  __slots__ = ('parent', 'changed', 'modified', 'fields')
+
+  def __init__(self, parent, fields):
+    self.parent = parent
+    self.changed = False
+    self.modified = set() if parent is None else None
+    self.fields = fields
+
+  def __deepcopy__(self, memo):
+    # Copying a node must not copy the tree it was in, only the copied nodes
+    return _Tracking(memo.get(id(self.parent), self.parent),
+                     copy.deepcopy(self.fields, memo))
+
+  def __getstate__(self):
+    return self.parent, self.changed, self.modified, self.fields
+
+  def __setstate__(self, state):
+    self.parent, self.changed, self.modified, self.fields = state
+
+
+def _field_values(node):
+  return tuple([tuple(value) if type(value) is list else value
+                for value in [getattr(node, field, None)
+                              for field in node._fields]])
+
+
+def track_changes(tree, parent=None):
+  """Start recording which nodes of an annotated tree are modified.
+
+  pasta's helpers which modify a tree, e.g. remove_child, replace_child and
+  those of pasta.augment, record their changes as they make them. Any other
+  change to a node, such as a field assignment like `node.id = 'x'`, is found
+  by comparing the node's fields with those it had before, which is done for
+  the whole tree by changed_nodes and when printing it, and for a node's
+  subtree by is_changed. Calling mark_changed records such a change at once.
+
+  Arguments:
+    tree: (ast.AST) Annotated syntax tree, usually a module.
+    parent: (ast.AST) Parent of `tree`, if it is part of a larger tree.
+  """
+  stack = [(tree, parent)]
+  while stack:
+    node, parent = stack.pop()
+    setattr(node, _TRACKING, _Tracking(parent, _field_values(node)))
+    for child in ast.iter_child_nodes(node):
+      if not isinstance(child, ast.expr_context):
+        stack.append((child, node))
+
+
+def is_tracked(node):
+  """Return True iff the node belongs to a tree whose changes are tracked."""
+  return hasattr(node, _TRACKING)
+
+
+def mark_changed(node):
+  """Record that a node of a tracked tree was modified in place.
+
+  The node and all of its ancestors are marked as changed, and the node is
+  added to the modified nodes of the tree's root. Nodes of untracked trees are
+  ignored.
+
+  Arguments:
+    node: (ast.AST) The modified node. If a child node was added, removed or
+      replaced, this is its parent.
+  """
+  tracking = getattr(node, _TRACKING, None)
+  if tracking is None:
+    return
+  modified = node
+  while tracking.parent is not None:
+    tracking.changed = True
+    tracking = getattr(tracking.parent, _TRACKING, None)
+    if tracking is None:
+      return
+  tracking.changed = True
+  tracking.modified.add(modified)
+
+
+def detect_changes(tree):
+  """Record the changes to a tracked tree which were not marked as made.
+
+  Each node whose fields differ from those it had when last checked is marked
+  as changed, and any node added to it starts being tracked.
+  """
+  stack = [tree]
+  while stack:
+    node = stack.pop()
+    tracking = getattr(node, _TRACKING, None)
+    if tracking is None:
+      continue
+    fields = _field_values(node)
+    if fields != tracking.fields:
+      tracking.fields = fields
+      for child in ast.iter_child_nodes(node):
+        child_tracking = getattr(child, _TRACKING, None)
+        if child_tracking is None:
+          if not isinstance(child, ast.expr_context):
+            track_changes(child, node)
+            mark_changed(child)
+        else:
+          child_tracking.parent = node
+      mark_changed(node)
+    for value in fields:
+      if type(value) is tuple:
+        stack.extend(value)
+      elif isinstance(value, ast.AST):
+        stack.append(value)
+
+
+def forget_changes(node):
+  """Take the current fields of a tracked node as unmodified."""
+  tracking = getattr(node, _TRACKING, None)
+  if tracking is not None:
+    tracking.fields = _field_values(node)
+
+
+def is_changed(node, detect=True):
+  """Return True iff the node or any node inside it was modified.
+
+  Arguments:
+    node: (ast.AST) A node of a tracked tree.
+    detect: (bool) If False, only consider the changes recorded so far, without
+      looking for others inside the node (see detect_changes).
+  """
+  if detect:
+    detect_changes(node)
+  tracking = getattr(node, _TRACKING, None)
+  return tracking is not None and tracking.changed
+
+
+def changed_nodes(tree):
+  """Get the nodes modified in a tracked tree, along with their ancestors."""
+  tracking = getattr(tree, _TRACKING, None)
+  if tracking is None or tracking.modified is None:
+    return set()
+  detect_changes(tree)
+  result = set()
+  for node in tracking.modified:
+    while node is not None and node not in result:
+      result.add(node)
+      node = getattr(node, _TRACKING).parent
+  return result
 
 
 def find_nodes_by_type(node, accept_types):
@@ -213,6 +755,7 @@ def remove_child(parent, child):
   for _, field_value in ast.iter_fields(parent):
     if isinstance(field_value, list) and child in field_value:
       field_value.remove(child)
+      mark_changed(parent)
       return
   raise errors.InvalidAstError('Unable to find list containing child %r on '
                                'parent node %r' % (child, parent))
@@ -234,11 +777,16 @@ def replace_child(parent, node, replace_with):
     field_val = getattr(parent, field, None)
     if field_val == node:
       setattr(parent, field, replace_with)
-      return
+      break
     elif isinstance(field_val, list):
       try:
         field_val[field_val.index(node)] = replace_with
-        return
-      except IndexError:
+        break
+      except ValueError:
         pass
-  raise errors.InvalidAstError('Node %r is not a child of %r' % (child, parent))
+  else:
+    raise errors.InvalidAstError('Node %r is not a child of %r' % (node,
+                                                                   parent))
+  if is_tracked(parent):
+    track_changes(replace_with, parent)
+  mark_changed(parent)
@@ -19,9 +19,12 @@ from __future__ import division
 from __future__ import print_function
 
 import ast
+import copy
 import traceback
 import unittest
 
+from six.moves import cPickle as pickle
+
 import pasta
 from pasta.base import ast_utils
 from pasta.base import test_utils
@@ -53,6 +56,15 @@ class UtilsTest(test_utils.TestCase):
       self.assertEqual(src_prefix + src,
                        ast_utils.sanitize_source(src_prefix + src))
 
+  def test_space_between(self):
+    lines = ['a = 1  # one\n', '# two\n', '\n', '  b = 2\n']
+    self.assertEqual('  ', ast_utils.space_between((1, 5), (1, 7), lines[0],
+                                                   lines))
+    self.assertEqual('  # one\n# two\n\n  ',
+                     ast_utils.space_between((1, 5), (4, 2), lines[0], lines))
+    self.assertEqual('\n# two\n\n',
+                     ast_utils.space_between((1, 12), (4, 0), lines[0], lines))
+
 
 class RemoveChildTest(test_utils.TestCase):
 
@@ -103,3 +115,138 @@ if a:
   x = 1
 """
     self.assertEqual(pasta.dump(tree), expected)
+
+
+class ChangeTrackingTest(test_utils.TestCase):
+
+  def setUp(self):
+    self.src = 'import a\n\ndef foo(x):\n  y = x\n  return y\n\nz = a\n'
+
+  def test_unchanged(self):
+    t = pasta.parse(self.src, track_changes=True)
+    self.assertEqual(set(), pasta.changed_nodes(t))
+    self.assertFalse(ast_utils.is_changed(t))
+
+  def test_field_assignment(self):
+    t = pasta.parse(self.src, track_changes=True)
+    foo = t.body[1]
+    assign = foo.body[0]
+    assign.value.id = 'w'
+    ast_utils.mark_changed(assign.value)
+    self.assertEqual(set([t, foo, assign, assign.value]),
+                     pasta.changed_nodes(t))
+    self.assertTrue(ast_utils.is_changed(foo))
+    self.assertFalse(ast_utils.is_changed(foo.body[1]))
+    self.assertFalse(ast_utils.is_changed(t.body[2]))
+
+  def test_assignment_detected(self):
+    t = pasta.parse(self.src, track_changes=True)
+    assign = t.body[2]
+    assign.value.id = 'b'
+    self.assertEqual(set([t, assign, assign.value]), pasta.changed_nodes(t))
+    self.assertNotIn('__setattr__', vars(ast.Name))
+
+  def test_assigned_node_detected(self):
+    t = pasta.parse(self.src, track_changes=True)
+    assign = t.body[2]
+    new_value = ast.Name(id='b', ctx=ast.Load())
+    assign.value = new_value
+    self.assertTrue(ast_utils.is_changed(assign))
+    self.assertEqual(set([t, assign, new_value]), pasta.changed_nodes(t))
+    new_value.id = 'c'
+    del t.body[1].body[0]
+    self.assertEqual(set([t, assign, new_value, t.body[1]]),
+                     pasta.changed_nodes(t))
+
+  def test_remove_child(self):
+    t = pasta.parse(self.src, track_changes=True)
+    foo = t.body[1]
+    ast_utils.remove_child(foo, foo.body[0])
+    self.assertEqual(set([t, foo]), pasta.changed_nodes(t))
+
+  def test_replace_child(self):
+    t = pasta.parse(self.src, track_changes=True)
+    foo = t.body[1]
+    new_stmt = ast.Expr(value=ast.Name(id='a', ctx=ast.Load()))
+    ast_utils.replace_child(foo, foo.body[1], new_stmt)
+    self.assertEqual(set([t, foo]), pasta.changed_nodes(t))
+    new_stmt.value = ast.Name(id='b', ctx=ast.Load())
+    ast_utils.mark_changed(new_stmt)
+    self.assertIn(new_stmt, pasta.changed_nodes(t))
+
+  def test_replace_field(self):
+    t = pasta.parse(self.src, track_changes=True)
+    assign = t.body[2]
+    ast_utils.replace_child(assign, assign.value,
+                            ast.Name(id='b', ctx=ast.Load()))
+    self.assertEqual(set([t, assign]), pasta.changed_nodes(t))
+    self.assertEqual('import a\n\ndef foo(x):\n  y = x\n  return y\n\nz = b\n',
+                     pasta.dump(t))
+
+  def test_lazy(self):
+    t = pasta.parse(self.src, lazy_annotation=True,
+                    track_changes=True)
+    foo = t.body[1]
+    name = foo.body[1].value
+    name.id = 'x'
+    ast_utils.mark_changed(name)
+    self.assertEqual(set([t, foo, foo.body[1], name]), pasta.changed_nodes(t))
+    self.assertTrue(ast_utils.is_changed(foo))
+    # Annotating the statement keeps the changes
+    ast_utils.prop(foo, 'prefix')
+    self.assertEqual(set([t, foo, foo.body[1], name]), pasta.changed_nodes(t))
+    self.assertTrue(ast_utils.is_changed(foo.body[1]))
+    self.assertFalse(ast_utils.is_changed(foo.body[0]))
+
+  def test_untracked(self):
+    t = ast_utils.parse(self.src)
+    pasta.base.annotate.AstAnnotator(self.src).visit(t)
+    t.body[2].value.id = 'b'
+    ast_utils.mark_changed(t.body[2].value)
+    self.assertEqual(set(), pasta.changed_nodes(t))
+    self.assertFalse(ast_utils.is_changed(t.body[2]))
+
+
+class FormattingTest(test_utils.TestCase):
+
+  def test_missing_value(self):
+    props = ast_utils.Formatting()
+    self.assertEqual('', props['prefix'])
+    self.assertNotIn('prefix', props)
+
+  def test_value_from_source(self):
+    src = 'x = 1  # A comment about x\n'
+    node = ast.Name(id='x', ctx=ast.Load())
+    ast_utils.setprop_from_source(node, 'suffix', src, 5, 26)
+    self.assertEqual('  # A comment about x', ast_utils.prop(node, 'suffix'))
+    ast_utils.appendprop(node, 'suffix', '\n')
+    self.assertEqual('  # A comment about x\n',
+                     ast_utils.prop(node, 'suffix'))
+
+  def test_annotated_values_refer_to_source(self):
+    src = 'def foo():\n  return 1  # A comment about the result\n'
+    t = pasta.parse(src)
+    value = t.body[0].body[0].value
+    props = getattr(value, ast_utils.PASTA_DICT)
+    self.assertIs(src, props.source)
+    self.assertNotIsInstance(props.suffix, str)
+    self.assertEqual('  # A comment about the result',
+                     ast_utils.prop(value, 'suffix'))
+
+  def test_pickle(self):
+    src = 'x = 1  # A comment about x\n'
+    t = pasta.parse(src)
+    copied = pickle.loads(pickle.dumps(t, pickle.HIGHEST_PROTOCOL))
+    self.assertEqual(getattr(t.body[0], ast_utils.PASTA_DICT),
+                     getattr(copied.body[0], ast_utils.PASTA_DICT))
+    self.assertEqual(src, pasta.dump(copied))
+
+  def test_deepcopy_shares_source(self):
+    src = 'x = 1  # A comment about x\n'
+    t = pasta.parse(src)
+    copied = copy.deepcopy(t.body[0])
+    props = getattr(t.body[0], ast_utils.PASTA_DICT)
+    copied_props = getattr(copied, ast_utils.PASTA_DICT)
+    self.assertIs(props.source, copied_props.source)
+    self.assertIsNot(props.ref, copied_props.ref)
+    self.assertEqual(src, pasta.dump(copied))
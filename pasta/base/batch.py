@@ -0,0 +1,260 @@
+# coding=utf-8
+"""Run pasta over many source files in parallel."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+import bisect
+import codecs
+import collections
+import functools
+import multiprocessing
+import re
+
+import six
+
+import pasta
+from pasta.base import ast_utils
+from pasta.base import lazy
+
+# The outcome of processing one input. Exactly one of `value` and `error` is
+# set: `value` holds the result (a tree or source code) and `error` holds the
+# exception raised while processing the input, e.g. annotate.AnnotationError.
+Result = collections.namedtuple('Result', ('key', 'value', 'error'))
+
+# Declaration of the encoding of a source file; see PEP 263
+_CODING = re.compile(br'^[ \t\f]*#.*?coding[:=][ \t]*([-\w.]+)')
+
+
+def parse_many(inputs, processes=None, chunksize=1):
+  """Parse and annotate many sources in parallel.
+
+  Arguments:
+    inputs: (iterable) Each item is either a path to a python file or a
+      (key, source) pair.
+    processes: (int) Number of worker processes to use. Defaults to the number
+      of CPUs. If 1, the inputs are processed in this process.
+    chunksize: (int) Number of inputs to send to a worker at a time.
+
+  Yields:
+    Result tuples with the annotated syntax tree as `value`, in the order they
+    complete. The key is the path or the key given with the source.
+  """
+  return run(_parse, inputs, processes, chunksize)
+
+
+def dump_many(trees, processes=None, chunksize=1):
+  """Generate source code for many annotated syntax trees in parallel.
+
+  Arguments:
+    trees: (iterable) (key, tree) pairs.
+    processes: (int) Number of worker processes to use. Defaults to the number
+      of CPUs. If 1, the trees are processed in this process.
+    chunksize: (int) Number of trees to send to a worker at a time.
+
+  Yields:
+    Result tuples with the source code as `value`, in the order they complete.
+  """
+  return run(_dump, trees, processes, chunksize)
+
+
+def transform_many(inputs, transform, processes=None, chunksize=1):
+  """Parse, transform and dump many sources in parallel.
+
+  Unlike chaining parse_many and dump_many, the syntax trees never leave the
+  worker processes, so only source code is sent between processes.
+
+  Arguments:
+    inputs: (iterable) Each item is either a path to a python file or a
+      (key, source) pair.
+    transform: (function) Called with each annotated syntax tree to modify it
+      in place. This must be picklable, e.g. a module-level function or a
+      functools.partial of one.
+    processes: (int) Number of worker processes to use. Defaults to the number
+      of CPUs. If 1, the inputs are processed in this process.
+    chunksize: (int) Number of inputs to send to a worker at a time.
+
+  Yields:
+    Result tuples with the transformed source code as `value`, in the order
+    they complete.
+  """
+  return run(functools.partial(_transform, transform), inputs, processes,
+             chunksize)
+
+
+def parse_split(src, processes=None, chunks=None, tokenizer=None):
+  """Parse and annotate a single large module in parallel.
+
+  The module is split into chunks of consecutive top-level statements, which
+  are annotated in worker processes, and their formatting is merged back into
+  one syntax tree. The tree is annotated exactly as by pasta.parse.
+
+  Falls back to annotating the whole module in this process if its statements
+  cannot be split by line, e.g. if several statements share a line.
+
+  Arguments:
+    src: (string) Python source code.
+    processes: (int) Number of worker processes to use. Defaults to the number
+      of CPUs. If 1, the chunks are annotated in this process.
+    chunks: (int) Number of chunks to split the module into, of roughly equal
+      length. Defaults to four per process, so that chunks annotated early are
+      merged while the others are being annotated.
+    tokenizer: (optional function) Tokenizer backend to annotate the source
+      with. This must be picklable, e.g. a module-level function.
+
+  Returns:
+    The annotated syntax tree.
+  """
+  t = ast.parse(ast_utils.sanitize_source(src))
+  offsets = lazy.statement_offsets(t, src)
+  if chunks is None:
+    chunks = 4 * (processes or multiprocessing.cpu_count())
+  if offsets is None or chunks < 2 or len(offsets) < 2:
+    return pasta.parse(src, tokenizer=tokenizer)
+
+  # Index of the first statement of each chunk, after the first one
+  firsts = sorted(set(
+      max(1, bisect.bisect_left(offsets, len(src) * i // chunks))
+      for i in range(1, chunks)) - set([len(offsets)]))
+  bounds = [0] + [offsets[i] for i in firsts] + [len(src)]
+  lines = [1] + [lazy.first_line(t.body[i]) for i in firsts]
+  flags = ast_utils.future_flags(t)
+  items = [(i, src[bounds[i]:bounds[i + 1]], lines[i], flags, tokenizer)
+           for i in range(len(lines))]
+  trees = [None] * len(items)
+  source = ast_utils.Source(src)
+  for i, tree in run(_annotate_chunk, items, processes):
+    ast_utils.rebase(tree, source, bounds[i])
+    trees[i] = tree
+
+  t = trees[0]
+  for tree in trees[1:]:
+    lazy.join_statements(t.body[-1], tree.body[0], src)
+    t.body.extend(tree.body)
+  suffix = ast_utils.prop(trees[-1], 'suffix')
+  ast_utils.setprop_from_source(t, 'suffix', src, len(src) - len(suffix),
+                                len(src))
+  ast_utils.setprop_from_source(t, 'span', src, 0, len(src))
+  return t
+
+
+def run(func, inputs, processes=None, chunksize=1):
+  """Apply a function to every input, in worker processes if requested.
+
+  Arguments:
+    func: (function) Function to call with each input. This must be
+      picklable, e.g. a module-level function or a functools.partial of one.
+    inputs: (iterable) Inputs to process.
+    processes: (int) Number of worker processes to use. Defaults to the number
+      of CPUs. If 1, the inputs are processed in this process.
+    chunksize: (int) Number of inputs to send to a worker at a time.
+
+  Yields:
+    The return value of `func` for each input, in the order they complete.
+  """
+  if processes == 1:
+    for item in inputs:
+      yield func(item)
+    return
+
+  pool = multiprocessing.Pool(processes)
+  try:
+    for result in pool.imap_unordered(func, inputs, chunksize):
+      yield result
+  finally:
+    pool.terminate()
+    pool.join()
+
+
+def read_source(path):
+  """Read a python source file in the encoding it declares.
+
+  The encoding is given by a byte order mark or a coding comment on one of the
+  first two lines (see PEP 263), and is utf-8 otherwise.
+
+  Returns:
+    A (source, encoding) tuple. On python 2 the source is kept as bytes, as
+    pasta parses it, once it is checked to decode.
+  Raises:
+    IOError: If the file cannot be read.
+    UnicodeDecodeError: If the file is not valid in its encoding.
+    LookupError: If the declared encoding is unknown.
+  """
+  with open(path, 'rb') as f:
+    data = f.read()
+  encoding = 'utf-8'
+  if data.startswith(codecs.BOM_UTF8):
+    encoding = 'utf-8-sig'
+  else:
+    for line in data.split(b'\n', 2)[:2]:
+      match = _CODING.match(line)
+      if match:
+        encoding = match.group(1).decode('ascii')
+        break
+      # The declaration may only follow a blank or comment line
+      if line.strip() and not line.lstrip().startswith(b'#'):
+        break
+  src = data.decode(encoding)
+  return (src if six.PY3 else data), encoding
+
+
+def write_source(path, src, encoding):
+  """Write python source read with read_source back to a file."""
+  if isinstance(src, six.text_type):
+    src = src.encode(encoding)
+  with open(path, 'wb') as f:
+    f.write(src)
+
+
+def _read(item):
+  if isinstance(item, tuple):
+    return item
+  return item, read_source(item)[0]
+
+
+def _parse(item):
+  key = item[0] if isinstance(item, tuple) else item
+  try:
+    key, src = _read(item)
+    return Result(key, pasta.parse(src), None)
+  except Exception as e:  # pylint: disable=broad-except
+    return Result(key, None, e)
+
+
+def _dump(item):
+  key, tree = item
+  try:
+    return Result(key, pasta.dump(tree), None)
+  except Exception as e:  # pylint: disable=broad-except
+    return Result(key, None, e)
+
+
+def _transform(transform, item):
+  key = item[0] if isinstance(item, tuple) else item
+  try:
+    key, src = _read(item)
+    tree = pasta.parse(src)
+    transform(tree)
+    return Result(key, pasta.dump(tree), None)
+  except Exception as e:  # pylint: disable=broad-except
+    return Result(key, None, e)
+
+
+def _annotate_chunk(item):
+  index, src, lineno, flags, tokenizer = item
+  return index, lazy.annotate_statements(src, flags, lineno, tokenizer)
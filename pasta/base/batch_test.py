@@ -0,0 +1,152 @@
+# coding=utf-8
+"""Tests for batch."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+import os
+import shutil
+import tempfile
+import unittest
+
+import pasta
+from pasta.base import ast_utils
+from pasta.base import batch
+from pasta.base import test_utils
+
+
+def _rename_first_import(tree):
+  tree.body[0].names[0].name = 'bbb'
+
+
+class BatchTest(test_utils.TestCase):
+
+  def setUp(self):
+    self.sources = [
+        ('a', 'import aaa\n'),
+        ('b', 'x = 1  # comment\n\ny = x\n'),
+        ('c', 'def foo(a, b):\n  return a + b\n'),
+    ]
+
+  def test_parse_many(self):
+    for processes in (1, 2):
+      results = {r.key: r for r in pasta.parse_many(self.sources,
+                                                    processes=processes)}
+      self.assertItemsEqual(['a', 'b', 'c'], results.keys())
+      for key, src in self.sources:
+        self.assertIsNone(results[key].error)
+        self.assertEqual(src, pasta.dump(results[key].value))
+      self.assertEqual('\n',
+                       ast_utils.prop(results['b'].value.body[1], 'prefix'))
+
+  def test_parse_many_reports_errors(self):
+    sources = self.sources + [('bad', 'def foo(:\n')]
+    results = {r.key: r for r in pasta.parse_many(sources, processes=2)}
+    self.assertIsInstance(results['bad'].error, SyntaxError)
+    self.assertIsNone(results['bad'].value)
+    self.assertIsNone(results['a'].error)
+
+  def test_parse_many_from_files(self):
+    tmpdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, tmpdir)
+    paths = []
+    for key, src in self.sources:
+      path = os.path.join(tmpdir, key + '.py')
+      with open(path, 'w') as f:
+        f.write(src)
+      paths.append(path)
+    paths.append(os.path.join(tmpdir, 'missing.py'))
+
+    results = {r.key: r for r in pasta.parse_many(paths, processes=2,
+                                                  chunksize=2)}
+    self.assertItemsEqual(paths, results.keys())
+    self.assertIsInstance(results[paths[-1]].error, IOError)
+    for path, (_, src) in zip(paths, self.sources):
+      self.assertEqual(src, pasta.dump(results[path].value))
+
+  def test_dump_many(self):
+    trees = [(key, pasta.parse(src)) for key, src in self.sources]
+    results = {r.key: r.value for r in pasta.dump_many(trees, processes=2)}
+    self.assertEqual(dict(self.sources), results)
+
+  def test_transform_many(self):
+    sources = [('a', 'import aaa  # comment\n'), ('b', 'import ccc, ddd\n')]
+    results = {r.key: r.value for r in batch.transform_many(
+        sources, _rename_first_import, processes=2)}
+    self.assertEqual({'a': 'import bbb  # comment\n',
+                      'b': 'import bbb, ddd\n'}, results)
+
+
+class ParseSplitTest(test_utils.TestCase):
+
+  src = ('# Leading comment\n'
+         'import aaa\n'
+         '\n'
+         '# Comment before foo\n'
+         '@bar\n'
+         'def foo(a,  b):\n'
+         '  c = a  # Comment\n'
+         '  return c\n'
+         '  # Trailing comment\n'
+         '\n'
+         '\n'
+         'x = y\n'
+         'class Baz(object): pass\n')
+
+  def assertAnnotatedLikeParse(self, t):
+    expected = pasta.parse(self.src)
+    for node, expected_node in zip(ast.walk(t), ast.walk(expected)):
+      self.assertIs(type(expected_node), type(node))
+      self.assertEqual(getattr(expected_node, 'lineno', None),
+                       getattr(node, 'lineno', None))
+      for key in ('prefix', 'suffix', 'span'):
+        self.assertEqual(ast_utils.prop(expected_node, key),
+                         ast_utils.prop(node, key))
+    self.assertMultiLineEqual(self.src, pasta.dump(t))
+
+  def test_parse_split(self):
+    for chunks in range(2, 6):
+      self.assertAnnotatedLikeParse(
+          batch.parse_split(self.src, processes=1, chunks=chunks))
+
+  def test_parse_split_in_processes(self):
+    t = pasta.parse(self.src, processes=2)
+    self.assertAnnotatedLikeParse(t)
+    self.assertIs(self.src, getattr(t, ast_utils.PASTA_DICT).source)
+
+  def test_modify_after_split(self):
+    t = batch.parse_split(self.src, processes=1, chunks=3)
+    t.body[2].targets[0].id = 'z'
+    self.assertMultiLineEqual(self.src.replace('x = y', 'z = y'),
+                              pasta.dump(t))
+
+  def test_too_few_statements(self):
+    for src in ('# Just a comment\n', 'x = y  # comment\n'):
+      t = batch.parse_split(src, processes=1, chunks=2)
+      self.assertEqual(src, pasta.dump(t))
+
+
+def suite():
+  result = unittest.TestSuite()
+  result.addTests(unittest.makeSuite(BatchTest))
+  result.addTests(unittest.makeSuite(ParseSplitTest))
+  return result
+
+
+if __name__ == '__main__':
+  unittest.main()
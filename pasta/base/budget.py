@@ -0,0 +1,128 @@
+# coding=utf-8
+"""Limits on the time and work spent annotating or printing a syntax tree.
+
+Interactive tools need to bound how long parsing or printing a module may
+take. A Budget is given to the visitor doing the work, which counts each node
+it visits against it and checks every so often whether the budget has run out:
+whether it was cancelled, from any thread, whether its deadline has passed or
+whether too many nodes were visited. If so, the visitor stops by raising
+BudgetExceeded, which tells how far it got.
+"""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import timeit
+
+# Reasons for a budget to run out
+CANCELLED = 'cancelled'
+DEADLINE = 'deadline'
+STEPS = 'steps'
+
+
+class BudgetExceeded(Exception):
+  """Raised when a visitor runs out of budget before finishing.
+
+  Attributes:
+    reason: (string) CANCELLED, DEADLINE or STEPS.
+    steps: (int) Number of nodes visited with the budget so far.
+    elapsed: (float) Seconds since the budget was created.
+    node: (ast.AST) The node about to be visited when the visitor stopped.
+    offset: (int) How far the visitor got: the offset in the source being
+      annotated, or the length of the code printed so far.
+  """
+
+  def __init__(self, reason, steps, elapsed, node=None, offset=None):
+    super(BudgetExceeded, self).__init__(
+        'Budget exceeded (%s) after %d steps, %.3fs, at offset %s' % (
+            reason, steps, elapsed, offset))
+    self.reason = reason
+    self.steps = steps
+    self.elapsed = elapsed
+    self.node = node
+    self.offset = offset
+
+
+class Budget(object):
+  """Time and number of steps which a visitor may spend, and a way to cancel.
+
+  One budget may be shared by several visits in turn, e.g. parsing a module
+  and printing it back, and is then spent by all of them together.
+
+  Attributes:
+    deadline: (float or None) Time after which the budget has run out, as
+      given by `timer`.
+    max_steps: (int or None) Number of nodes which may be visited.
+    steps: (int) Number of nodes visited so far. Visitors count their steps
+      in batches, so this is only up to date when checked.
+    check_interval: (int) Number of nodes visited between checks of whether
+      the budget has run out. Reading the time is relatively expensive, so it
+      is not done for every node.
+  """
+
+  timer = staticmethod(timeit.default_timer)
+
+  def __init__(self, seconds=None, steps=None, check_interval=100):
+    """Create a budget starting now.
+
+    Arguments:
+      seconds: (optional float) Time after which the budget runs out.
+      steps: (optional int) Number of nodes which may be visited.
+      check_interval: (int) Number of nodes to visit between checks.
+    """
+    self.start = self.timer()
+    self.deadline = None if seconds is None else self.start + seconds
+    self.max_steps = steps
+    self.steps = 0
+    self.check_interval = check_interval
+    self._cancelled = False
+
+  def cancel(self):
+    """Make the budget run out at the next check, from any thread."""
+    self._cancelled = True
+
+  @property
+  def cancelled(self):
+    return self._cancelled
+
+  def elapsed(self):
+    """Get the number of seconds since the budget was created."""
+    return self.timer() - self.start
+
+  def spend(self, steps):
+    """Count steps taken, and check whether the budget has run out.
+
+    Arguments:
+      steps: (int) Number of nodes visited since the last call.
+    Returns:
+      The reason the budget ran out (see BudgetExceeded), or None.
+    """
+    self.steps += steps
+    if self._cancelled:
+      return CANCELLED
+    if self.max_steps is not None and self.steps > self.max_steps:
+      return STEPS
+    if self.deadline is not None and self.timer() > self.deadline:
+      return DEADLINE
+    return None
+
+  def next_check(self):
+    """Get the number of steps to take before calling spend again."""
+    if self.max_steps is None:
+      return self.check_interval
+    # Stop on the first step beyond the maximum
+    return max(1, min(self.check_interval, self.max_steps - self.steps + 1))
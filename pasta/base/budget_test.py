@@ -0,0 +1,138 @@
+# coding=utf-8
+"""Tests for budget."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+import threading
+import unittest
+
+import pasta
+from pasta.base import budget
+from pasta.base import codegen
+from pasta.base import lazy
+from pasta.base import test_utils
+
+
+class BudgetTest(test_utils.TestCase):
+
+  src = ''.join('a%d = b  # comment\n' % i for i in range(50))
+
+  def count_steps(self, func):
+    """Get the number of steps a function spends from a budget given to it."""
+    b = budget.Budget()
+    func(b)
+    return b.steps
+
+  def test_steps(self):
+    steps = self.count_steps(lambda b: pasta.parse(self.src, budget=b))
+    # The module, and each assignment and its two names
+    self.assertEqual(1 + 3 * 50, steps)
+    t = pasta.parse(self.src, budget=budget.Budget(steps=steps))
+    self.assertEqual(self.src, pasta.dump(t))
+
+    with self.assertRaises(budget.BudgetExceeded) as cm:
+      pasta.parse(self.src, budget=budget.Budget(steps=steps - 1))
+    self.assertEqual(budget.STEPS, cm.exception.reason)
+    self.assertEqual(steps, cm.exception.steps)
+    self.assertIsInstance(cm.exception.node, ast.Name)
+    self.assertEqual(self.src.rindex('b'), cm.exception.offset)
+
+  def test_progress(self):
+    with self.assertRaises(budget.BudgetExceeded) as cm:
+      pasta.parse(self.src, budget=budget.Budget(steps=30, check_interval=7))
+    self.assertEqual(31, cm.exception.steps)
+    # The 31st node is the value of the 10th assignment
+    self.assertEqual(self.src.index('b', self.src.index('a9')),
+                     cm.exception.offset)
+
+  def test_deadline(self):
+    with self.assertRaises(budget.BudgetExceeded) as cm:
+      pasta.parse(self.src, budget=budget.Budget(seconds=-1, check_interval=1))
+    self.assertEqual(budget.DEADLINE, cm.exception.reason)
+    self.assertEqual(1, cm.exception.steps)
+    self.assertIsInstance(cm.exception.node, ast.Module)
+
+  def test_cancel(self):
+    b = budget.Budget(check_interval=10)
+    thread = threading.Thread(target=b.cancel)
+    thread.start()
+    thread.join()
+    self.assertTrue(b.cancelled)
+    with self.assertRaises(budget.BudgetExceeded) as cm:
+      pasta.parse(self.src, budget=b)
+    self.assertEqual(budget.CANCELLED, cm.exception.reason)
+    self.assertEqual(10, cm.exception.steps)
+
+  def test_print(self):
+    t = pasta.parse(self.src)
+    for stmt in t.body:
+      stmt.targets[0].id = 'c'
+    expected = pasta.dump(t)
+    steps = self.count_steps(lambda b: pasta.dump(t, budget=b))
+
+    with self.assertRaises(budget.BudgetExceeded) as cm:
+      codegen.to_str(t, budget=budget.Budget(steps=steps - 1))
+    self.assertEqual(budget.STEPS, cm.exception.reason)
+    self.assertEqual(expected.rindex('b'), cm.exception.offset)
+    for node in ast.walk(t):
+      self.assertFalse(hasattr(node, '_printer_info'))
+    self.assertEqual(expected,
+                     pasta.dump(t, budget=budget.Budget(steps=steps)))
+
+  def test_shared_budget(self):
+    b = budget.Budget()
+    t = pasta.parse(self.src, budget=b)
+    parse_steps = b.steps
+    t.body[0].targets[0].id = 'c'
+    pasta.dump(t, budget=b)
+    self.assertGreater(b.steps, parse_steps)
+
+  def test_annotate_only(self):
+    with self.assertRaises(budget.BudgetExceeded):
+      pasta.parse(self.src, annotate_only=ast.Assign,
+                  budget=budget.Budget(steps=10))
+    t = pasta.parse(self.src, annotate_only=ast.Assign,
+                    budget=budget.Budget(steps=3 * 50))
+    self.assertIsNone(lazy.get_unannotated(t.body[-1]))
+
+  def test_reparse_left_unchanged(self):
+    t = pasta.parse(self.src)
+    kept = list(t.body)
+    edit = codegen.Edit(self.src.index('a10'), 3, 'c')
+    with self.assertRaises(budget.BudgetExceeded):
+      pasta.reparse(t, edit, budget=budget.Budget(steps=1))
+    self.assertEqual(kept, t.body)
+    self.assertEqual(self.src, pasta.dump(t))
+
+    pasta.reparse(t, edit, budget=budget.Budget(steps=20))
+    self.assertEqual(self.src.replace('a10', 'c'), pasta.dump(t))
+
+  def test_processes(self):
+    with self.assertRaises(ValueError):
+      pasta.parse(self.src, processes=2, budget=budget.Budget())
+
+
+def suite():
+  result = unittest.TestSuite()
+  result.addTests(unittest.makeSuite(BudgetTest))
+  return result
+
+
+if __name__ == '__main__':
+  unittest.main()
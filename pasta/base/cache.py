@@ -0,0 +1,139 @@
+# coding=utf-8
+"""Persistent on-disk cache of annotated syntax trees."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import os
+import sys
+import tempfile
+import zlib
+
+import six
+from six.moves import cPickle as pickle
+
+import pasta
+
+# Bump this whenever the layout of the cached data changes
+_FORMAT_VERSION = 3
+_SUFFIX = '.pasta'
+# Fraction of the maximum size which eviction brings the cache down to, so that
+# the following entries can be stored without evicting again
+_EVICT_TO = 0.9
+
+
+class AnnotationCache(object):
+  """Stores annotated syntax trees on disk, keyed by the source they came from.
+
+  Entries are keyed by a hash of the source code together with the versions of
+  pasta and python, since both the syntax tree and the formatting stored on it
+  can differ between versions. Each entry holds the pickled tree, including the
+  formatting data, compressed with zlib.
+
+  When the total size of the entries exceeds `max_size` bytes, the least
+  recently used entries are removed until it is below 90% of `max_size`. The
+  cache keeps a running total of the size of the entries it stores, and only
+  lists the directory to find the entries to remove when that total exceeds
+  `max_size`; entries stored by other processes are only counted then.
+  """
+
+  def __init__(self, directory, max_size=256 * 1024 * 1024):
+    self.directory = directory
+    self.max_size = max_size
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    # Total size of the entries, or None until the directory is listed
+    self._size = None
+
+  def get(self, src):
+    """Get the cached syntax tree for the given source, or None if missing."""
+    path = self._path(src)
+    try:
+      with open(path, 'rb') as f:
+        data = f.read()
+      tree = pickle.loads(zlib.decompress(data))
+    except (IOError, OSError, EOFError, zlib.error, pickle.UnpicklingError):
+      return None
+    try:
+      os.utime(path, None)
+    except OSError:
+      pass
+    return tree
+
+  def put(self, src, tree):
+    """Store the syntax tree for the given source in the cache."""
+    data = zlib.compress(pickle.dumps(tree, pickle.HIGHEST_PROTOCOL))
+    path = self._path(src)
+    try:
+      replaced_size = os.path.getsize(path)
+    except OSError:
+      replaced_size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+    try:
+      with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+      os.rename(tmp_path, path)
+    except OSError:
+      os.remove(tmp_path)
+      raise
+    if self._size is not None:
+      self._size += len(data) - replaced_size
+    if self._size is None or self._size > self.max_size:
+      self._evict()
+
+  def clear(self):
+    """Remove all entries from the cache."""
+    for path, _ in self._entries():
+      os.remove(path)
+    self._size = 0
+
+  def _path(self, src):
+    if isinstance(src, six.text_type):
+      src = src.encode('utf-8')
+    key = hashlib.sha1(src)
+    key.update(('%s:%s:%d' % (pasta.__version__, sys.version,
+                               _FORMAT_VERSION)).encode('utf-8'))
+    return os.path.join(self.directory, key.hexdigest() + _SUFFIX)
+
+  def _entries(self):
+    """Get (path, os.stat result) for each entry, least recently used first."""
+    entries = []
+    for filename in os.listdir(self.directory):
+      if filename.endswith(_SUFFIX):
+        path = os.path.join(self.directory, filename)
+        try:
+          entries.append((path, os.stat(path)))
+        except OSError:
+          pass
+    entries.sort(key=lambda entry: entry[1].st_mtime)
+    return entries
+
+  def _evict(self):
+    """Count the size of the entries, and remove entries if it is too large."""
+    entries = self._entries()
+    total_size = sum(stat.st_size for _, stat in entries)
+    if total_size > self.max_size:
+      for path, stat in entries:
+        if total_size <= self.max_size * _EVICT_TO:
+          break
+        try:
+          os.remove(path)
+        except OSError:
+          pass
+        total_size -= stat.st_size
+    self._size = total_size
@@ -0,0 +1,123 @@
+# coding=utf-8
+"""Tests for cache."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import pasta
+from pasta.base import ast_utils
+from pasta.base import cache
+from pasta.base import test_utils
+
+
+class AnnotationCacheTest(test_utils.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory)
+
+  def test_parse_with_cache(self):
+    c = cache.AnnotationCache(self.directory)
+    src = 'def foo(a, b):  # Comment\n  return (a +\n          b)\n'
+    self.assertIsNone(c.get(src))
+
+    t = pasta.parse(src, cache=c)
+    self.checkAstsEqual(t, c.get(src))
+
+    cached = pasta.parse(src, cache=c)
+    self.assertIsNot(t, cached)
+    self.assertEqual(src, pasta.dump(cached))
+    self.assertEqual(':  # Comment\n',
+                     ast_utils.prop(cached.body[0], 'open_block'))
+
+  def test_different_sources(self):
+    c = cache.AnnotationCache(self.directory)
+    pasta.parse('a = 1\n', cache=c)
+    self.assertIsNone(c.get('a = 2\n'))
+    self.assertEqual('a = 2\n', pasta.dump(pasta.parse('a = 2\n', cache=c)))
+    self.assertEqual('a = 1\n', pasta.dump(c.get('a = 1\n')))
+
+  def test_corrupt_entry_is_a_miss(self):
+    c = cache.AnnotationCache(self.directory)
+    pasta.parse('a = 1\n', cache=c)
+    for filename in os.listdir(self.directory):
+      with open(os.path.join(self.directory, filename), 'wb') as f:
+        f.write(b'garbage')
+    self.assertIsNone(c.get('a = 1\n'))
+
+  def test_eviction(self):
+    c = cache.AnnotationCache(self.directory)
+    pasta.parse('a = 0\n', cache=c)
+    entry_size = os.path.getsize(c._path('a = 0\n'))
+    c.clear()
+
+    c = cache.AnnotationCache(self.directory, max_size=entry_size * 5 // 2)
+    for i in range(1, 6):
+      src = 'a = %d\n' % i
+      pasta.parse(src, cache=c)
+      # Make sure the entries have distinct access times
+      os.utime(c._path(src), (i, i))
+
+    self.assertEqual(2, len(os.listdir(self.directory)))
+    self.assertIsNone(c.get('a = 1\n'))
+    self.assertIsNone(c.get('a = 3\n'))
+    self.assertIsNotNone(c.get('a = 4\n'))
+    self.assertIsNotNone(c.get('a = 5\n'))
+
+  def test_directory_listed_on_eviction(self):
+    listings = []
+
+    class CountingCache(cache.AnnotationCache):
+
+      def _entries(self):
+        listings.append(None)
+        return super(CountingCache, self)._entries()
+
+    c = CountingCache(self.directory)
+    c.put('a = 0\n', pasta.parse('a = 0\n'))
+    entry_size = os.path.getsize(c._path('a = 0\n'))
+    c.max_size = entry_size * 50
+    del listings[:]
+    tree = pasta.parse('a = 0\n')
+    for i in range(1, 200):
+      c.put('a = %d\n' % i, tree)
+      os.utime(c._path('a = %d\n' % i), (i, i))
+
+    # Each eviction leaves room for several more entries
+    self.assertLessEqual(len(listings), 40)
+    self.assertLessEqual(len(os.listdir(self.directory)), 50)
+
+  def test_clear(self):
+    c = cache.AnnotationCache(self.directory)
+    pasta.parse('a = 1\n', cache=c)
+    c.clear()
+    self.assertEqual([], os.listdir(self.directory))
+
+
+def suite():
+  result = unittest.TestSuite()
+  result.addTests(unittest.makeSuite(AnnotationCacheTest))
+  return result
+
+
+if __name__ == '__main__':
+  unittest.main()
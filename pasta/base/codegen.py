@@ -18,14 +18,25 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import ast
 import collections
+import difflib
 
 from pasta.base import annotate
 from pasta.base import ast_utils
+from pasta.base import lazy
 
 # TODO: Handle indentation correctly on inserted nodes
 
 
+# A change to source code: replace `length` characters at `offset` with
+# `replacement`. Offsets refer to the original source, before any edits.
+Edit = collections.namedtuple('Edit', ('offset', 'length', 'replacement'))
+
+# Below this many characters, strings are compared one character at a time.
+_COMPARE_CHUNK = 64
+
+
 class PrintError(Exception):
   """An exception for when we failed to print the tree."""
 
@@ -40,18 +51,55 @@ class Printer(annotate.BaseVisitor):
   default formatting is used.
   """
 
-  def __init__(self):
-    super(Printer, self).__init__()
+  def __init__(self, budget=None):
+    super(Printer, self).__init__(budget=budget)
     self.code = ''
+    # (offset in code, source, start, end) for each piece of code copied from
+    # the source, in order
+    self.copied = []
 
   def visit(self, node):
-    node._printer_info = collections.defaultdict(lambda: False)
+    # Statements are copied unless they changed, so all changes must be known
+    ast_utils.detect_changes(node)
     try:
       super(Printer, self).visit(node)
     except (TypeError, ValueError, IndexError, KeyError) as e:
       raise PrintError(e)
+    finally:
+      # If printing was interrupted, e.g. by budget.BudgetExceeded, the nodes
+      # being visited are left on the stack
+      while self._stack:
+        del self._stack.pop()._printer_info
+
+  def _enter_node(self, node):
+    # Statements which were never annotated can be copied from the source
+    unannotated = lazy.get_unannotated(node)
+    if unannotated is not None and (
+        not ast_utils.is_changed(node, detect=False)
+        if ast_utils.is_tracked(node) else unannotated.unchanged()):
+      self._copy(unannotated.src, unannotated.module_source.text,
+                 unannotated.offset)
+      return False
+
+    # So can statements of a tracked tree which were not modified since they
+    # were annotated
+    span = self._unchanged_span(node)
+    if span is not None:
+      props = getattr(node, ast_utils.PASTA_DICT)
+      source_range = props.source_range('span')
+      self._copy(span, props.source, source_range and source_range[0])
+      return False
+
+    node._printer_info = collections.defaultdict(lambda: False)
+    return True
+
+  def _leave_node(self, node):
+    super(Printer, self)._leave_node(node)
     del node._printer_info
 
+  def _progress(self):
+    return len(self.code)
+
   def visit_Num(self, node):
     self.prefix(node)
     content = ast_utils.prop(node, 'content')
@@ -64,6 +112,41 @@ class Printer(annotate.BaseVisitor):
     self.code += content if content is not None else repr(node.s)
     self.suffix(node)
 
+  def _copy(self, code, source, start):
+    """Output code copied from the source at offset `start`, if known."""
+    if start is not None:
+      self.copied.append((len(self.code), source, start, start + len(code)))
+    self.code += code
+
+  def _unchanged_span(self, node):
+    """Get the source a statement was parsed from, if it is unchanged.
+
+    Only changes to tracked trees are known (see ast_utils.track_changes), so
+    the statements of untracked trees are always printed. A statement whose own
+    formatting changed has no span any more.
+    """
+    if (not isinstance(node, ast.stmt) or not ast_utils.is_tracked(node) or
+        ast_utils.is_changed(node, detect=False)):
+      return None
+    span = ast_utils.prop(node, 'span')
+    if not span or ast_utils.prop(node, 'is_elif'):
+      return None
+    return span
+
+  def prefix(self, node):
+    self.attr(node, 'prefix', ())
+
+  def suffix(self, node, max_lines=None):
+    del max_lines  # unused
+    self.attr(node, 'suffix', ())
+
+  @staticmethod
+  def _compile_attr(attr, attr_name):
+    deps = attr.deps
+    default = attr.default
+    return lambda self, node: self.attr(node, attr_name, (), deps=deps,
+                                        default=default)
+
   def token(self, value):
     self.code += value
 
@@ -111,8 +194,135 @@ class Printer(annotate.BaseVisitor):
     return getattr(node, 'is_continued', False)
 
 
-def to_str(tree):
-  """Convenient function to get the python source for an AST."""
-  p = Printer()
+annotate.install_syntax(Printer)
+
+
+def to_str(tree, budget=None):
+  """Convenient function to get the python source for an AST.
+
+  Arguments:
+    tree: (ast.AST) The syntax tree to print.
+    budget: (optional budget.Budget) Limit on the time and steps spent.
+  Raises:
+    budget.BudgetExceeded: If the budget runs out before the tree is printed.
+  """
+  p = Printer(budget=budget)
   p.visit(tree)
   return p.code
+
+
+def to_edits(tree, budget=None):
+  """Get the edits which turn the source a tree was parsed from into its code.
+
+  Code copied from the original source when printing (see Printer) is left
+  untouched, and the rest is compared to the source it replaces, line by line
+  and then character by character, so that only the characters which differ
+  are edited.
+
+  Arguments:
+    tree: (ast.Module) A syntax tree parsed with pasta.parse.
+    budget: (optional budget.Budget) Limit on the time and steps spent.
+  Returns:
+    A list of Edit tuples, sorted by offset and not overlapping.
+  Raises:
+    ValueError: If the tree was not parsed from source.
+    budget.BudgetExceeded: If the budget runs out before the tree is printed.
+  """
+  props = getattr(tree, ast_utils.PASTA_DICT, None)
+  source = getattr(props, 'source', None)
+  if source is None:
+    raise ValueError('The tree was not parsed from source code')
+
+  p = Printer(budget=budget)
+  p.visit(tree)
+  edits = []
+  source_pos = code_pos = 0
+  for code_start, copied_source, start, end in p.copied:
+    # Code moved from later in the source is treated as new code
+    if copied_source is not source or start < source_pos:
+      continue
+    _add_edits(edits, source, source_pos, start, p.code[code_pos:code_start])
+    source_pos = end
+    code_pos = code_start + end - start
+  _add_edits(edits, source, source_pos, len(source), p.code[code_pos:])
+  return edits
+
+
+def apply_edits(source, edits):
+  """Apply edits, such as those from to_edits, to source code."""
+  parts = []
+  pos = 0
+  for offset, length, replacement in edits:
+    parts.append(source[pos:offset])
+    parts.append(replacement)
+    pos = offset + length
+  parts.append(source[pos:])
+  return ''.join(parts)
+
+
+def _add_edits(edits, source, start, end, replacement):
+  """Add the edits replacing source[start:end], by the lines which differ."""
+  original = source[start:end]
+  if original == replacement:
+    return
+  # Unchanged lines at either end are skipped before matching the rest
+  prefix = _common_prefix_length(original, replacement)
+  prefix = original.rfind('\n', 0, prefix) + 1
+  suffix = _common_prefix_length(original[prefix:][::-1],
+                                 replacement[prefix:][::-1])
+  suffix_start = original.find(
+      '\n', max(prefix, len(original) - suffix - 1)) + 1 or len(original)
+  suffix = len(original) - suffix_start
+  old_lines = ast_utils.splitlines(original[prefix:len(original) - suffix])
+  new_lines = ast_utils.splitlines(
+      replacement[prefix:len(replacement) - suffix])
+  if len(old_lines) <= 1 or len(new_lines) <= 1:
+    _add_edit(edits, source, start + prefix, end - suffix,
+              replacement[prefix:len(replacement) - suffix])
+    return
+
+  old_offsets = _line_offsets(old_lines, start + prefix)
+  new_offsets = _line_offsets(new_lines, prefix)
+  matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+  for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+    if tag == 'equal':
+      continue
+    if tag == 'replace' and i2 - i1 == j2 - j1:
+      # Lines changed in place are edited one at a time
+      for i, j in zip(range(i1, i2), range(j1, j2)):
+        _add_edit(edits, source, old_offsets[i], old_offsets[i + 1],
+                  new_lines[j])
+    else:
+      _add_edit(edits, source, old_offsets[i1], old_offsets[i2],
+                replacement[new_offsets[j1]:new_offsets[j2]])
+
+
+def _line_offsets(lines, start):
+  """Get the offset of each line, and of the end of the last one."""
+  offsets = [start]
+  for line in lines:
+    offsets.append(offsets[-1] + len(line))
+  return offsets
+
+
+def _add_edit(edits, source, start, end, replacement):
+  """Add the edit replacing source[start:end], without any unchanged ends."""
+  original = source[start:end]
+  if original == replacement:
+    return
+  prefix = _common_prefix_length(original, replacement)
+  suffix = _common_prefix_length(original[prefix:][::-1],
+                                 replacement[prefix:][::-1])
+  edits.append(Edit(start + prefix, len(original) - prefix - suffix,
+                    replacement[prefix:len(replacement) - suffix]))
+
+
+def _common_prefix_length(a, b):
+  length = min(len(a), len(b))
+  i = 0
+  while i < length and a[i:i + _COMPARE_CHUNK] == b[i:i + _COMPARE_CHUNK]:
+    i += _COMPARE_CHUNK
+  i = min(i, length)
+  while i < length and a[i] == b[i]:
+    i += 1
+  return i
@@ -0,0 +1,220 @@
+# coding=utf-8
+"""Tests for codegen."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+import textwrap
+import unittest
+
+import pasta
+from pasta.base import ast_utils
+from pasta.base import codegen
+from pasta.base import test_utils
+
+
+def _tamper(node):
+  """Change a node's formatting without recording it as a change.
+
+  Printing the node would then show the change, so the change only shows up in
+  the output if the node was printed rather than copied from the source.
+  """
+  getattr(node, ast_utils.PASTA_DICT)['prefix'] += '#X\n'
+
+
+class SpliceTest(test_utils.TestCase):
+
+  def setUp(self):
+    self.src = textwrap.dedent('''\
+        x  =   1   # comment
+
+        def foo(a,   b):
+          y = a  +  b
+          if y:
+            return   y
+          elif a:
+            pass
+          return   a
+        ''')
+
+  def test_unchanged_statements_copied(self):
+    t = pasta.parse(self.src, track_changes=True)
+    for stmt in t.body:
+      _tamper(stmt)
+    self.assertEqual(self.src, pasta.dump(t))
+
+  def test_changed_statement_printed(self):
+    t = pasta.parse(self.src, track_changes=True)
+    t.body[0].targets[0].id = 'z'
+    pasta.mark_changed(t.body[0].targets[0])
+    _tamper(t.body[1])
+    self.assertEqual(self.src.replace('x  =', 'z  ='), pasta.dump(t))
+
+  def test_unchanged_nested_statements_copied(self):
+    t = pasta.parse(self.src, track_changes=True)
+    foo = t.body[1]
+    foo.body[-1].value.id = 'b'
+    pasta.mark_changed(foo.body[-1].value)
+    _tamper(foo.body[0])
+    self.assertEqual(self.src.replace('return   a', 'return   b'),
+                     pasta.dump(t))
+
+  def test_modified_formatting_printed(self):
+    t = pasta.parse(self.src, track_changes=True)
+    ast_utils.setprop(t.body[1].body[0].value.left, 'suffix', ' ')
+    self.assertEqual(self.src.replace('a  +', 'a +'), pasta.dump(t))
+
+  def test_modified_formatting_printed_again(self):
+    t = pasta.parse(self.src, track_changes=True)
+    ast_utils.setprop(t.body[1].body[0], 'prefix', '  # new\n  ')
+    expected = self.src.replace('  y =', '  # new\n  y =')
+    self.assertEqual(expected, pasta.dump(t))
+    self.assertEqual(expected, pasta.dump(t))
+
+  def test_elif_printed(self):
+    t = pasta.parse(self.src, track_changes=True)
+    elif_stmt = t.body[1].body[1].orelse[0]
+    elif_stmt.test.id = 'b'
+    pasta.mark_changed(elif_stmt.test)
+    self.assertEqual(self.src.replace('elif a', 'elif b'), pasta.dump(t))
+
+  def test_single_line_block(self):
+    src = 'if a: x = 1\nif b:  y = 2\n'
+    t = pasta.parse(src, track_changes=True)
+    t.body[0].test.id = 'c'
+    pasta.mark_changed(t.body[0].test)
+    self.assertEqual('if c: x = 1\nif b:  y = 2\n', pasta.dump(t))
+
+  def test_untracked_statements_printed(self):
+    t = pasta.parse(self.src)
+    _tamper(t.body[0])
+    self.assertEqual('#X\n' + self.src, pasta.dump(t))
+
+  def test_lazy_statements_copied(self):
+    t = pasta.parse(self.src, lazy_annotation=True, track_changes=True)
+    foo = t.body[1]
+    foo.body[-1].value.id = 'b'
+    pasta.mark_changed(foo.body[-1].value)
+    ast_utils.prop(foo, 'prefix')
+    _tamper(foo.body[0])
+    self.assertEqual(self.src.replace('return   a', 'return   b'),
+                     pasta.dump(t))
+
+
+class EditsTest(test_utils.TestCase):
+
+  def setUp(self):
+    self.src = textwrap.dedent('''\
+        import aaa
+
+        def foo(a,   b):
+          y = a  +  b
+          return   y
+
+        z = aaa.z
+        ''')
+
+  def assertEditsMatchDump(self, t):
+    edits = pasta.edits(t)
+    self.assertEqual(pasta.dump(t), codegen.apply_edits(self.src, edits))
+    return edits
+
+  def test_no_edits_if_unchanged(self):
+    t = pasta.parse(self.src, track_changes=True)
+    self.assertEqual([], self.assertEditsMatchDump(t))
+
+  def test_only_changed_text_edited(self):
+    t = pasta.parse(self.src, track_changes=True)
+    t.body[1].body[0].targets[0].id = 'x'
+    pasta.mark_changed(t.body[1].body[0].targets[0])
+    t.body[2].targets[0].id = 'w'
+    pasta.mark_changed(t.body[2].targets[0])
+    self.assertEqual(
+        [(self.src.index('y ='), 1, 'x'), (self.src.index('z ='), 1, 'w')],
+        self.assertEditsMatchDump(t))
+
+  def test_removed_statement(self):
+    t = pasta.parse(self.src, track_changes=True)
+    del t.body[0]
+    self.assertEqual([(0, len('import aaa\n'), '')],
+                     self.assertEditsMatchDump(t))
+
+  def test_reordered_statements(self):
+    t = pasta.parse(self.src, track_changes=True)
+    t.body[0], t.body[2] = t.body[2], t.body[0]
+    self.assertEditsMatchDump(t)
+
+  def test_lazy(self):
+    t = pasta.parse(self.src, lazy_annotation=True, track_changes=True)
+    t.body[2].targets[0].id = 'w'
+    pasta.mark_changed(t.body[2].targets[0])
+    self.assertEqual([(self.src.index('z ='), 1, 'w')],
+                     self.assertEditsMatchDump(t))
+
+  def test_unmarked_assignment(self):
+    t = pasta.parse(self.src, track_changes=True)
+    t.body[2].value.value.id = 'bbb'
+    self.assertEqual([(self.src.index('aaa.z'), 3, 'bbb')],
+                     self.assertEditsMatchDump(t))
+
+  def test_untracked(self):
+    t = pasta.parse(self.src)
+    t.body[2].targets[0].id = 'w'
+    self.assertEqual([(self.src.index('z ='), 1, 'w')],
+                     self.assertEditsMatchDump(t))
+
+  def test_untracked_changes_far_apart(self):
+    self.src = ''.join('x%d = y%d + 1\n' % (i, i) for i in range(1000))
+    t = pasta.parse(self.src)
+    t.body[0].targets[0].id = 'first'
+    t.body[-1].targets[0].id = 'last'
+    self.assertEqual([(0, 2, 'first'), (self.src.index('x999'), 4, 'last')],
+                     self.assertEditsMatchDump(t))
+
+  def test_adjacent_lines_changed(self):
+    self.src = ''.join('x%d = y%d + 1\n' % (i, i) for i in range(100))
+    t = pasta.parse(self.src)
+    for stmt in t.body[10:20]:
+      stmt.targets[0].id = 'w'
+    self.assertEqual(
+        [(self.src.index('x%d ' % i), 3, 'w') for i in range(10, 20)],
+        self.assertEditsMatchDump(t))
+
+  def test_lines_added(self):
+    self.src = ''.join('x%d = y%d + 1\n' % (i, i) for i in range(100))
+    t = pasta.parse(self.src, track_changes=True)
+    t.body[10:10] = pasta.parse('added = 1\n').body
+    t.body[0].targets[0].id = 'z'
+    self.assertEqual(
+        [(0, 2, 'z'), (self.src.index('x10 '), 0, 'added = 1\n')],
+        self.assertEditsMatchDump(t))
+
+  def test_not_parsed(self):
+    with self.assertRaises(ValueError):
+      pasta.edits(ast.parse(self.src))
+
+
+def suite():
+  result = unittest.TestSuite()
+  result.addTests(unittest.makeSuite(SpliceTest))
+  result.addTests(unittest.makeSuite(EditsTest))
+  return result
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,297 @@
+# coding=utf-8
+"""Declarative syntax of node types, compiled into visit methods.
+
+The syntax of a node type is a sequence of items, in the order they appear in
+the source:
+
+  Token('return')                   a token with exactly this value
+  FieldToken('id')                  a token whose value is a field of the node
+  Child('value')                    a child node, if it is set
+  Attr('dot', (WS, '.', WS), '.')   formatting stored on the node under a name;
+                                    made of the given tokens and whitespace
+  Children('elts', Attr('comma_', (WS, ',', WS), ', '))
+                                    each node in a list field, with formatting
+                                    between them stored under the attr's name
+                                    followed by the index of the node before it
+  Optional('msg', (Token(','), Child('msg')))
+                                    items which are only present if a field of
+                                    the node is set
+
+Each visitor compiles the items once, into a function which visits a node of
+that type. See `compile_syntax`.
+"""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+import collections
+
+from pasta.base import ast_constants
+
+
+class _Whitespace(object):
+  """Marks whitespace among the tokens of an Attr."""
+
+  def __repr__(self):
+    return 'WS'
+
+
+WS = _Whitespace()
+
+Token = collections.namedtuple('Token', ('value',))
+FieldToken = collections.namedtuple('FieldToken', ('field',))
+Child = collections.namedtuple('Child', ('field',))
+Optional = collections.namedtuple('Optional', ('field', 'items'))
+
+
+class Attr(collections.namedtuple(
+    'Attr', ('name', 'parts', 'default', 'deps'))):
+  """Formatting made of tokens and whitespace, stored on the node."""
+
+  def __new__(cls, name, parts, default=None, deps=None):
+    return super(Attr, cls).__new__(cls, name, tuple(parts), default, deps)
+
+
+class Children(collections.namedtuple(
+    'Children', ('field', 'sep', 'after_last', 'extracomma'))):
+  """Each node in a list field, with formatting between them.
+
+  Attributes:
+    field: (string) Name of the list field.
+    sep: (Attr) Formatting between two nodes. Its name is a prefix, followed
+      by the index of the node before it.
+    after_last: (bool) Whether the formatting also follows the last node.
+    extracomma: (bool) Whether an optional trailing comma follows a non-empty
+      list, stored under 'extracomma'.
+  """
+
+  def __new__(cls, field, sep, after_last=False, extracomma=False):
+    return super(Children, cls).__new__(cls, field, sep, after_last,
+                                        extracomma)
+
+
+# Formatting between the elements of a list
+COMMA = Attr('comma_', (WS, ',', WS), default=', ')
+
+# Kind and syntax items of each node type. The kind is the name of the
+# decorator in pasta.base.annotate which handles the node's prefix, suffix and
+# parentheses.
+SYNTAX = {
+    # Statements
+    'Assert': ('statement', (
+        Token('assert'), Child('test'),
+        Optional('msg', (Token(','), Child('msg'))))),
+    'Assign': ('statement', (
+        Children('targets', Attr('equal_', (WS, '=', WS), default=' = '),
+                 after_last=True),
+        Child('value'))),
+    'Break': ('statement', (Token('break'),)),
+    'Continue': ('statement', (Token('continue'),)),
+    'Delete': ('statement', (
+        Attr('del', ('del', WS), default='del '),
+        Children('targets', COMMA))),
+    'Expr': ('statement', (Child('value'),)),
+    'Import': ('statement', (
+        Attr('open_import', ('import', WS), default='import '),
+        Children('names', Attr('alias_sep_', (WS, ',', WS), default=', ')))),
+    'Pass': ('statement', (Token('pass'),)),
+    'Return': ('statement', (Token('return'), Child('value'))),
+    'Yield': ('statement', (Token('yield'), Child('value'))),
+
+    # Expressions
+    'Attribute': ('expression', (
+        Child('value'),
+        Attr('dot', (WS, '.', WS), default='.'),
+        FieldToken('attr'))),
+    'BinOp': ('expression', (Child('left'), Child('op'), Child('right'))),
+    'IfExp': ('expression', (
+        Child('body'),
+        Attr('if', (WS, 'if', WS), default=' if '),
+        Child('test'),
+        Attr('else', (WS, 'else', WS), default=' else '),
+        Child('orelse'))),
+    'Lambda': ('expression', (
+        Attr('lambda_def', ('lambda', WS), default='lambda '),
+        Child('args'),
+        Attr('open_lambda', (WS, ':', WS), default=': '),
+        Child('body'))),
+    'List': ('expression', (
+        Attr('list_open', ('[', WS), default='['),
+        Children('elts', COMMA, extracomma=True),
+        Attr('list_close', (WS, ']'), default=']'))),
+    'Name': ('expression', (FieldToken('id'),)),
+    'Repr': ('expression', (
+        Attr('repr_open', ('repr', WS, '('), default='repr('),
+        Child('value'),
+        Attr('repr_close', (WS, ')'), default=')'))),
+    'Set': ('expression', (
+        Attr('set_open', ('{', WS), default='{'),
+        Children('elts', COMMA, extracomma=True),
+        Attr('set_close', (WS, '}'), default='}'))),
+    'Subscript': ('expression', (Child('value'), Child('slice'))),
+    'Tuple': ('expression', (Children('elts', COMMA, extracomma=True),)),
+    'UnaryOp': ('expression', (Child('op'), Child('operand'))),
+
+    # Operators and tokens
+    'Ellipsis': ('space_around', (Token('...'),)),
+    'IsNot': ('space_around', (
+        Attr('content', ('is', WS, 'not'), default='is not'),)),
+    'NotIn': ('space_around', (
+        Attr('content', ('not', WS, 'in'), default='not in'),)),
+
+    # Misc nodes
+    'arg': ('space_around', (
+        FieldToken('arg'),
+        Optional('annotation', (
+            Attr('annotation_prefix', (WS, ':', WS), default=': '),
+            Child('annotation'))))),
+    'keyword': ('space_around', (
+        FieldToken('arg'),
+        Attr('eq', (WS, '='), default='='),
+        Child('value'))),
+}
+
+# Operators which are a single token
+for _op in ('Add', 'Sub', 'Mult', 'Div', 'Mod', 'Pow', 'LShift', 'RShift',
+            'BitAnd', 'BitOr', 'BitXor', 'FloorDiv', 'Invert', 'Not', 'UAdd',
+            'USub', 'Eq', 'NotEq', 'Lt', 'LtE', 'Gt', 'GtE', 'Is', 'In'):
+  SYNTAX[_op] = ('space_around', (
+      Token(ast_constants.NODE_TYPE_TO_TOKENS[getattr(ast, _op)][0]),))
+del _op
+
+
+# Operations of a compiled visit function, each with an argument
+_CHILD = 0  # Visit the child node in a field, if it is set
+_TOKEN = 1  # A token with the given value
+_FIELD_TOKEN = 2  # A token whose value is in a field
+_CALL = 3  # Call a function (visitor, node)
+_VISIT = 4  # Run a visit function (visitor, node), which may yield children
+
+
+def compile_syntax(items, compile_attr):
+  """Compile the syntax of a node type into a function visiting such nodes.
+
+  Arguments:
+    items: (sequence) Syntax items, as described in the module docstring.
+    compile_attr: (function) Takes an Attr and an attribute name, and returns a
+      function (visitor, node) which handles the attribute on a node.
+
+  Returns:
+    A visit method: a function (visitor, node) which returns a generator of the
+    node's children, or None if the node has no children.
+  """
+  ops = tuple(_compile_item(item, compile_attr) for item in items)
+  if not any(op in (_CHILD, _VISIT) for op, _ in ops):
+    return _compile_leaf(ops)
+
+  def visit(self, node):
+    for op, arg in ops:
+      if op == _CHILD:
+        child = getattr(node, arg)
+        if child is not None:
+          yield child
+      elif op == _TOKEN:
+        self.token(arg)
+      elif op == _FIELD_TOKEN:
+        self.token(getattr(node, arg))
+      elif op == _CALL:
+        arg(self, node)
+      else:
+        yield arg(self, node)
+  return visit
+
+
+def _compile_leaf(ops):
+  """Compile the operations of a node without children into a function."""
+  if len(ops) == 1 and ops[0][0] == _FIELD_TOKEN:
+    field = ops[0][1]
+
+    def visit_field_token(self, node):
+      self.token(getattr(node, field))
+    return visit_field_token
+
+  if len(ops) == 1 and ops[0][0] == _TOKEN:
+    value = ops[0][1]
+
+    def visit_token(self, node):
+      self.token(value)
+    return visit_token
+
+  def visit(self, node):
+    for op, arg in ops:
+      if op == _TOKEN:
+        self.token(arg)
+      elif op == _FIELD_TOKEN:
+        self.token(getattr(node, arg))
+      else:
+        arg(self, node)
+  return visit
+
+
+def _compile_item(item, compile_attr):
+  """Compile a single syntax item into an operation and its argument."""
+  if isinstance(item, Token):
+    return _TOKEN, item.value
+  if isinstance(item, FieldToken):
+    return _FIELD_TOKEN, item.field
+  if isinstance(item, Child):
+    return _CHILD, item.field
+  if isinstance(item, Attr):
+    return _CALL, compile_attr(item, item.name)
+  if isinstance(item, Optional):
+    return _VISIT, _compile_optional(item, compile_attr)
+  if isinstance(item, Children):
+    return _VISIT, _compile_children(item, compile_attr)
+  raise TypeError('Unknown syntax item: %r' % (item,))
+
+
+def _compile_optional(item, compile_attr):
+  """Compile an Optional item into a visit function (visitor, node)."""
+  field = item.field
+  visit_items = compile_syntax(item.items, compile_attr)
+
+  def visit_optional(self, node):
+    if getattr(node, field):
+      yield visit_items(self, node)
+  return visit_optional
+
+
+def _compile_children(item, compile_attr):
+  """Compile a Children item into a visit function (visitor, node)."""
+  field = item.field
+  after_last = item.after_last
+  extracomma = item.extracomma
+  # Functions handling the separator after each index, compiled as needed. They
+  # are keyed by index, so that visitors in several threads which compile the
+  # same one store it under the same index.
+  seps = {}
+
+  def visit_children(self, node):
+    children = getattr(node, field)
+    last = len(children) - 1
+    for i, child in enumerate(children):
+      yield child
+      if i < last or after_last:
+        sep = seps.get(i)
+        if sep is None:
+          sep = seps.setdefault(
+              i, compile_attr(item.sep, '%s%d' % (item.sep.name, i)))
+        sep(self, node)
+    if extracomma and children:
+      self.optional_token(node, 'extracomma', ',')
+  return visit_children
@@ -0,0 +1,129 @@
+# coding=utf-8
+"""Tests for grammar."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+import threading
+import unittest
+
+import pasta
+from pasta.base import annotate
+from pasta.base import ast_utils
+from pasta.base import codegen
+from pasta.base import grammar
+from pasta.base import test_utils
+
+
+class _RecordingVisitor(annotate.BaseVisitor):
+  """Records the tokens and attrs a BaseVisitor accounts for."""
+
+  def __init__(self):
+    super(_RecordingVisitor, self).__init__()
+    self.calls = []
+
+  def token(self, token_val):
+    self.calls.append(token_val)
+
+  def attr(self, node, attr_name, attr_vals, deps=None, default=None):
+    if attr_name not in ('prefix', 'suffix'):
+      self.calls.append((attr_name, default))
+
+  def optional_token(self, node, attr_name, token_val):
+    self.calls.append(attr_name)
+
+  def check_is_elif(self, node):
+    return False
+
+  def check_is_continued_with(self, node):
+    return False
+
+
+annotate.install_syntax(_RecordingVisitor)
+
+
+class GrammarTest(test_utils.TestCase):
+
+  def test_compile_syntax(self):
+    visitor = _RecordingVisitor()
+    visitor.visit(ast.parse('x = y = [a.b, c]\nassert x\n').body[0])
+    self.assertEqual([
+        'x', ('equal_0', ' = '), 'y', ('equal_1', ' = '),
+        ('list_open', '['), 'a', ('dot', '.'), 'b', ('comma_0', ', '), 'c',
+        'extracomma', ('list_close', ']'),
+    ], visitor.calls)
+
+  def test_optional(self):
+    for src, expected in (('assert x\n', ['assert', 'x']),
+                          ('assert x, y\n', ['assert', 'x', ',', 'y'])):
+      visitor = _RecordingVisitor()
+      visitor.visit(ast.parse(src).body[0])
+      self.assertEqual(expected, visitor.calls)
+
+  def test_separators_compiled_in_threads(self):
+
+    class Visitor(_RecordingVisitor):
+      pass
+
+    annotate.install_syntax(Visitor)
+    node = ast.parse('[%s]\n' % ', '.join('a%d' % i for i in range(300)))
+    expected = ['comma_%d' % i for i in range(299)]
+    results = []
+
+    def visit():
+      visitor = Visitor()
+      visitor.visit(node.body[0])
+      results.append([call[0] for call in visitor.calls
+                      if isinstance(call, tuple) and call[0] != 'list_open'
+                      and call[0] != 'list_close'])
+
+    threads = [threading.Thread(target=visit) for _ in range(8)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual([expected] * 8, results)
+
+  def test_compiled_for_each_visitor(self):
+    for node_type in grammar.SYNTAX:
+      name = 'visit_' + node_type
+      self.assertIn(name, annotate.BaseVisitor.__dict__)
+      self.assertIn(name, codegen.Printer.__dict__)
+      if node_type != 'Ellipsis':
+        self.assertIn(name, annotate.AstAnnotator.__dict__)
+
+  def test_parse_and_print(self):
+    src = ('x = y = [a.b  ,c,]  # comment\n'
+           'import  os , sys\n'
+           'del x,  y\n'
+           'z = lambda a : (a if a is not b else -a), {b, c}\n')
+    t = pasta.parse(src)
+    self.assertEqual(src, pasta.dump(t))
+    self.assertEqual('  ', ast_utils.prop(t.body[0].value.elts[0], 'suffix'))
+    self.assertEqual(',', ast_utils.prop(t.body[0].value, 'comma_0'))
+    self.assertEqual('  ', ast_utils.prop(t.body[1], 'open_import')[6:])
+
+
+def suite():
+  result = unittest.TestSuite()
+  result.addTests(unittest.makeSuite(GrammarTest))
+  return result
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,209 @@
+# coding=utf-8
+"""Update an annotated syntax tree after an edit to its source.
+
+Editors change a few characters of a module at a time. Rather than parsing and
+annotating the whole source again, only the top-level statements around an
+edit are annotated again. The nodes of the other statements are kept, along
+with their formatting, which is moved to its new place in the source.
+"""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+
+from pasta.base import annotate
+from pasta.base import ast_utils
+from pasta.base import codegen
+from pasta.base import lazy
+from pasta.base import token_generator
+
+
+def reparse(tree, edit, tokenizer=None, budget=None):
+  """Update an annotated tree after an edit to the source it was parsed from.
+
+  The tree is updated in place, and ends up the same as parsing the edited
+  source with pasta.parse. The top-level statements which the edit touches are
+  annotated again, along with the statements either side of them, whose
+  formatting may include comments next to the edit. The nodes of all other
+  statements are kept.
+
+  The whole source is parsed and annotated again if the edited statements
+  cannot be parsed on their own, e.g. if the edit opens a string which closes
+  further on.
+
+  If the edit adds or removes lines, the line numbers of the nodes of the
+  statements after it are not updated straight away, which would take time in
+  proportion to the rest of the module, but by update_lines. Call it before
+  reading them.
+
+  Arguments:
+    tree: (ast.Module) Syntax tree parsed with pasta.parse, which was not
+      modified since (other than by reparse).
+    edit: (tuple) The edit to the source, as an (offset, length, replacement)
+      tuple such as a codegen.Edit: `length` characters at `offset` are
+      replaced with `replacement`.
+    tokenizer: (optional function) Tokenizer backend to annotate the source
+      with.
+    budget: (optional budget.Budget) Limit on the time and steps spent
+      annotating.
+  Returns:
+    The updated tree.
+  Raises:
+    ValueError: If the tree was not parsed from source.
+    SyntaxError: If the edited source is not valid python.
+    budget.BudgetExceeded: If the budget runs out. The tree is left as it
+      was, but the tokens kept for pasta.tokens are read again.
+  """
+  props = getattr(tree, ast_utils.PASTA_DICT, None)
+  src = getattr(props, 'source', None)
+  if src is None:
+    raise ValueError('The tree was not parsed from source code')
+  offset, length, replacement = edit
+  new_src = codegen.apply_edits(src, [edit])
+  token_generator.clear_module_tokens(tree)
+
+  body = tree.body
+  if not body or any(lazy.get_unannotated(stmt) is not None for stmt in body):
+    return _parse_all(tree, new_src, tokenizer, budget)
+  first, last = _statements_around(body, offset, offset + length)
+  at_end = last == len(body) - 1
+  start = _span(body[first - 1])[1] if first else 0
+  end = len(src) if at_end else _span(body[last])[1]
+  delta = len(replacement) - length
+  # The source starts with the lines before the first statement's first line
+  lineno = 1
+  if first:
+    lineno = (lazy.first_line(body[first]) + _source(body[first]).lines -
+              len(ast_utils.splitlines(ast_utils.prop(body[first], 'prefix'))))
+
+  flags = ast_utils.future_flags(tree)
+  try:
+    chunk = lazy.annotate_statements(new_src[start:end + delta], flags, lineno,
+                                     tokenizer, budget)
+  except (SyntaxError, annotate.AnnotationError):
+    return _parse_all(tree, new_src, tokenizer, budget)
+  if not chunk.body or any(_is_future_import(stmt)
+                           for stmt in body[first:last + 1] + chunk.body):
+    return _parse_all(tree, new_src, tokenizer, budget)
+
+  lines = (len(ast_utils.splitlines(new_src[start:end + delta])) -
+           len(ast_utils.splitlines(src[start:end])))
+  # The statements before the edit share the module's source, whose text is
+  # replaced without visiting them. Each statement after the edit has a source
+  # of its own, which is moved as a whole. Its line numbers are moved later.
+  props.ref.text = new_src
+  ast_utils.rebase(chunk, props.ref, start)
+  for stmt in body[last + 1:]:
+    source = _source(stmt)
+    source.offset += delta
+    source.lines += lines
+  if first:
+    lazy.join_statements(body[first - 1], chunk.body[0], new_src)
+  if ast_utils.is_tracked(tree):
+    for stmt in chunk.body:
+      ast_utils.track_changes(stmt, tree)
+  # Replace the statements in place, which is not recorded as a change
+  body[first:last + 1] = chunk.body
+  ast_utils.forget_changes(tree)
+
+  # The module's formatting after the edit is moved like the statements
+  end_node, end_shift = (chunk, 0) if at_end else (tree, delta)
+  span_end = _span(end_node)[1] + end_shift
+  _move_prop(tree, 'prefix', tree if first else chunk, 0)
+  _move_prop(tree, 'suffix', end_node, end_shift)
+  ast_utils.setprop_from_source(tree, 'span', new_src, 0, span_end)
+  return tree
+
+
+def update_lines(tree):
+  """Update the line numbers of the nodes of statements moved by reparse.
+
+  Arguments:
+    tree: (ast.Module) Syntax tree updated with reparse.
+  """
+  for stmt in tree.body:
+    source = _source(stmt)
+    if source is not None and source.lines:
+      _shift_lines(stmt, source.lines)
+      source.lines = 0
+
+
+def _statements_around(body, edit_start, edit_end):
+  """Get the first and last index of the statements to annotate again."""
+  first = 0
+  while first < len(body) - 1 and _span(body[first])[1] <= edit_start:
+    first += 1
+  last = first
+  while last < len(body) - 1 and _span(body[last + 1])[0] < edit_end:
+    last += 1
+  return max(first - 1, 0), min(last + 1, len(body) - 1)
+
+
+def _span(stmt):
+  return getattr(stmt, ast_utils.PASTA_DICT).source_range('span')
+
+
+def _source(stmt):
+  return getattr(stmt, ast_utils.PASTA_DICT).ref
+
+
+def _move_prop(tree, key, node, shift):
+  """Set a formatting value of a module to that of a node, moved by `shift`."""
+  props = getattr(node, ast_utils.PASTA_DICT)
+  value_range = props.source_range(key)
+  if value_range is None:
+    # Moving the value is not a change to the tree; see ast_utils.track_changes
+    getattr(tree, ast_utils.PASTA_DICT)[key] = props[key]
+  else:
+    start, end = value_range
+    ast_utils.setprop_from_source(tree, key, props.source, start + shift,
+                                  end + shift)
+
+
+def _shift_lines(tree, lines):
+  """Add a number of lines to the line numbers of the nodes of a tree."""
+  # Like ast.increment_lineno, but without the overhead of ast.walk
+  stack = [tree]
+  while stack:
+    node = stack.pop()
+    if 'lineno' in node._attributes:
+      node.lineno += lines
+      if getattr(node, 'end_lineno', None) is not None:
+        node.end_lineno += lines
+    for field in node._fields:
+      value = getattr(node, field, None)
+      if type(value) is list:
+        stack.extend(item for item in value if isinstance(item, ast.AST))
+      elif isinstance(value, ast.AST):
+        stack.append(value)
+
+
+def _is_future_import(stmt):
+  return isinstance(stmt, ast.ImportFrom) and stmt.module == '__future__'
+
+
+def _parse_all(tree, src, tokenizer, budget):
+  """Parse and annotate the whole source again, into the existing tree."""
+  t = ast_utils.parse(src)
+  annotate.AstAnnotator(src, tokenizer=tokenizer, budget=budget).visit(t)
+  tracked = ast_utils.is_tracked(tree)
+  tree.body[:] = t.body
+  setattr(tree, ast_utils.PASTA_DICT, getattr(t, ast_utils.PASTA_DICT))
+  if tracked:
+    ast_utils.track_changes(tree)
+  return tree
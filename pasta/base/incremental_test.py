@@ -0,0 +1,176 @@
+# coding=utf-8
+"""Tests for incremental."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+import copy
+import textwrap
+import unittest
+
+import pasta
+from pasta.base import ast_utils
+from pasta.base import codegen
+from pasta.base import incremental
+from pasta.base import test_utils
+
+
+class ReparseTest(test_utils.TestCase):
+
+  src = textwrap.dedent('''\
+      # Leading comment
+      import aaa.bbb
+
+      # Comment before foo
+      def foo(a,  b):
+        c = a  # Comment
+        return c + b
+        # Trailing comment
+
+
+      x = y
+      z = x
+      ''')
+
+  def reparse(self, old, new):
+    """Reparse the tree of self.src after replacing `old` with `new`."""
+    t = pasta.parse(self.src)
+    offset = self.src.index(old)
+    edit = codegen.Edit(offset, len(old), new)
+    return t, incremental.reparse(t, edit)
+
+  def assertParsedLike(self, src, t):
+    incremental.update_lines(t)
+    expected = pasta.parse(src)
+    for expected_node, node in zip(ast.walk(expected), ast.walk(t)):
+      self.assertIs(type(expected_node), type(node))
+      self.assertEqual(getattr(expected_node, 'lineno', None),
+                       getattr(node, 'lineno', None))
+      for key in ('prefix', 'suffix', 'span'):
+        self.assertEqual(ast_utils.prop(expected_node, key),
+                         ast_utils.prop(node, key))
+    self.assertEqual(len(list(ast.walk(expected))), len(list(ast.walk(t))))
+    self.assertMultiLineEqual(src, pasta.dump(t))
+
+  def test_edit_statement(self):
+    t = pasta.parse(self.src)
+    kept = t.body[0]
+    result = incremental.reparse(
+        t, codegen.Edit(self.src.index('x = y'), 1, 'w'))
+    self.assertIs(t, result)
+    self.assertIs(kept, t.body[0])
+    self.assertParsedLike(self.src.replace('x = y', 'w = y'), t)
+
+  def test_add_lines(self):
+    t, _ = self.reparse('  return c + b\n', '  d = c\n\n  return d + b\n')
+    # Line numbers after the edit are only updated on demand
+    self.assertEqual(12, t.body[3].lineno)
+    self.assertParsedLike(
+        self.src.replace('  return c + b\n', '  d = c\n\n  return d + b\n'), t)
+    self.assertEqual(13, t.body[2].lineno)
+    self.assertEqual(14, t.body[3].lineno)
+
+  def test_add_statement(self):
+    t, _ = self.reparse('x = y\n', 'x = y\nw = x\n')
+    self.assertEqual(5, len(t.body))
+    self.assertParsedLike(self.src.replace('x = y\n', 'x = y\nw = x\n'), t)
+
+  def test_remove_statement(self):
+    t, _ = self.reparse('x = y\n', '')
+    self.assertEqual(3, len(t.body))
+    self.assertParsedLike(self.src.replace('x = y\n', ''), t)
+
+  def test_successive_edits(self):
+    t = pasta.parse(self.src)
+    src = self.src
+    for old, new in (('x = y', 'x = y\n\nw = x'), ('c = a', 'e = a'),
+                     ('z = x', 'z = w'), ('import aaa.bbb\n', ''),
+                     ('w = x', 'v = x')):
+      offset = src.index(old)
+      incremental.reparse(t, codegen.Edit(offset, len(old), new))
+      src = src.replace(old, new)
+      self.assertMultiLineEqual(src, pasta.dump(t))
+    self.assertParsedLike(src, t)
+
+  def test_copy_unchanged(self):
+    t = pasta.parse(self.src)
+    backup = copy.deepcopy(t)
+    incremental.reparse(t, codegen.Edit(self.src.index('c = a'), 5, 'longer'))
+    self.assertMultiLineEqual(self.src, pasta.dump(backup))
+    self.assertParsedLike(self.src, backup)
+
+  def test_edit_comments(self):
+    for old, new in (('# Leading', '# First'),
+                     ('# Comment before', '  # Indented'),
+                     ('\n\nx = y', '\n  # Block comment\nx = y'),
+                     ('# Trailing comment\n', '')):
+      t, _ = self.reparse(old, new)
+      self.assertParsedLike(self.src.replace(old, new), t)
+
+  def test_edit_end(self):
+    t = pasta.parse(self.src)
+    incremental.reparse(t, codegen.Edit(len(self.src), 0, 'w = z\n'))
+    self.assertParsedLike(self.src + 'w = z\n', t)
+
+  def test_open_string(self):
+    # The string continues past the statements around the edit, so the whole
+    # source is parsed again
+    src = 'a = b\nc = d\ne = f\ng = h  # """\ni = j\n'
+    t = pasta.parse(src)
+    incremental.reparse(t, codegen.Edit(src.index('d'), 1, '"""'))
+    self.assertEqual(3, len(t.body))
+    self.assertParsedLike(src.replace('d', '"""'), t)
+
+  def test_syntax_error(self):
+    t = pasta.parse(self.src)
+    with self.assertRaises(SyntaxError):
+      incremental.reparse(t, codegen.Edit(self.src.index('x = y'), 0, ')'))
+    self.assertMultiLineEqual(self.src, pasta.dump(t))
+
+  def test_edits_after_reparse(self):
+    t, _ = self.reparse('x = y', 'w = y')
+    t.body[0].names[0].name = 'ccc.ddd'
+    self.assertEqual(
+        [codegen.Edit(self.src.index('aaa.bbb'), 7, 'ccc.ddd')],
+        pasta.edits(t))
+
+  def test_tokens_after_reparse(self):
+    t, _ = self.reparse('x = y', 'w = y')
+    self.assertIn('w', [token.src for token in pasta.tokens(t).tokens()])
+
+  def test_track_changes(self):
+    t = pasta.parse(self.src, track_changes=True)
+    incremental.reparse(t, codegen.Edit(self.src.index('x = y'), 1, 'w'))
+    self.assertEqual(set(), pasta.changed_nodes(t))
+    t.body[3].targets[0].id = 'v'
+    pasta.mark_changed(t.body[3].targets[0])
+    self.assertIn(t.body[3], pasta.changed_nodes(t))
+
+  def test_not_parsed_from_source(self):
+    with self.assertRaises(ValueError):
+      incremental.reparse(ast.parse('x\n'), codegen.Edit(0, 1, 'y'))
+
+
+def suite():
+  result = unittest.TestSuite()
+  result.addTests(unittest.makeSuite(ReparseTest))
+  return result
+
+
+if __name__ == '__main__':
+  unittest.main()
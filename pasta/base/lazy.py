@@ -0,0 +1,310 @@
+# coding=utf-8
+"""Defer annotating top-level statements until their formatting is needed.
+
+Annotating a module is much more expensive than parsing it, but most
+transformations only look at a few statements. A lazily parsed module records
+only the source text of each top-level statement. A statement is annotated the
+first time formatting is read or written on any node inside it, and statements
+which have not changed are printed back verbatim.
+"""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+
+from pasta.base import annotate
+from pasta.base import ast_utils
+
+
+class LazyFormatting(object):
+  """Placeholder formatting for every node of a statement not yet annotated.
+
+  Attributes:
+    stmt: (ast.stmt) The top-level statement.
+    src: (string) Source code of the statement, from the start of its first
+      line up to the start of the next statement. Comments and blank lines
+      after the statement are included and become part of its suffix when it
+      is annotated.
+    flags: (int) Compiler flags for the __future__ imports of the module.
+    offset: (int) Offset of the statement's source in the module's source.
+    module_source: (ast_utils.Source) Source of the whole module.
+    tokenizer: (optional function) Tokenizer backend to annotate it with.
+  """
+
+  def __init__(self, stmt, src, flags, offset=0, module_source=None,
+               tokenizer=None):
+    self.stmt = stmt
+    self.src = src
+    self.flags = flags
+    self.offset = offset
+    self.module_source = (ast_utils.Source(src) if module_source is None
+                          else module_source)
+    self.tokenizer = tokenizer
+    self.materialized = False
+
+  def parse(self):
+    """Parse the statement's source on its own."""
+    return ast_utils.normalize(compile(
+        ast_utils.sanitize_source(self.src), '<unknown>', 'exec',
+        ast.PyCF_ONLY_AST | self.flags, True))
+
+  def unchanged(self):
+    """Return True iff the statement's syntax tree matches its source."""
+    return ast_utils.nodes_equal(self.stmt, self.parse().body[0])
+
+  def materialize(self, budget=None):
+    """Annotate the statement and attach its formatting to its nodes.
+
+    The source is annotated on a fresh syntax tree, since the statement may
+    have been modified since it was parsed. The formatting is then copied to
+    the matching nodes of the statement, so any modified values are detected
+    when printing as usual.
+
+    Arguments:
+      budget: (optional budget.Budget) Limit on the time and steps spent
+        annotating. If it runs out, the statement is left unannotated.
+    """
+    if self.materialized:
+      return
+
+    stmt = self.parse().body[0]
+    annotator = annotate.AstAnnotator(self.src, tokenizer=self.tokenizer,
+                                      budget=budget)
+    annotator.visit(stmt)
+    self.materialized = True
+    # Whatever follows the statement's own suffix up to the next statement
+    ast_utils.appendprop(stmt, 'suffix', annotator.ws())
+    ast_utils.rebase(stmt, self.module_source, self.offset)
+    ast_utils.setprop_from_source(stmt, 'span', self.module_source, self.offset,
+                                  self.offset + len(self.src))
+    _copy_formatting(stmt, self.stmt, self)
+
+
+def parse(src, tokenizer=None, annotate_only=None, budget=None):
+  """Parse python source into a syntax tree whose annotation is deferred.
+
+  Falls back to annotating the whole module if its statements cannot be split
+  by line, e.g. if several statements share a line.
+
+  Arguments:
+    src: (string) Python source code.
+    tokenizer: (optional function) Tokenizer backend to annotate the source
+      with. See pasta.base.tokenizer.
+    annotate_only: (optional) Selects the top-level statements to annotate
+      straight away, as a node type, a tuple of node types or a function
+      taking a node. Each statement containing a selected node is annotated;
+      the others are deferred as usual.
+    budget: (optional budget.Budget) Limit on the time and steps spent
+      annotating the statements which are annotated straight away.
+  """
+  # Each statement is normalized as its placeholders are set
+  t = ast.parse(ast_utils.sanitize_source(src))
+  offsets = statement_offsets(t, src)
+  if offsets is None:
+    ast_utils.normalize(t)
+    annotator = annotate.AstAnnotator(src, tokenizer=tokenizer, budget=budget)
+    annotator.visit(t)
+    return t
+
+  flags = ast_utils.future_flags(t)
+  ast_utils.setprop(t, 'prefix', src[:offsets[0]])
+  ast_utils.setprop(t, 'suffix', '')
+  source = ast_utils.Source(src)
+  ast_utils.setprop_from_source(t, 'span', source, 0, len(src))
+  for stmt, start, end in zip(t.body, offsets, offsets[1:] + [len(src)]):
+    _set_placeholder(stmt,
+                     LazyFormatting(stmt, src[start:end], flags, start, source,
+                                    tokenizer))
+
+  if annotate_only is not None:
+    selected = _node_predicate(annotate_only)
+    for stmt in t.body:
+      if any(selected(node) for node in ast.walk(stmt)):
+        get_unannotated(stmt).materialize(budget)
+  return t
+
+
+def statement_offsets(tree, src):
+  """Get the offset in the source of the first line of each statement.
+
+  Arguments:
+    tree: (ast.Module) Syntax tree of the source.
+    src: (string) Python source code.
+  Returns:
+    A list with the offset of each top-level statement, including its
+    decorators, or None if the statements cannot be split by line, e.g. if
+    several statements share a line.
+  """
+  starts = [first_line(stmt) for stmt in tree.body]
+  if (not tree.body or any(stmt.col_offset != 0 for stmt in tree.body) or
+      any(a >= b for a, b in zip(starts, starts[1:]))):
+    return None
+  offsets = []
+  offset = 0
+  line = 1
+  for length in map(len, ast_utils.splitlines(src)):
+    if line == starts[len(offsets)]:
+      offsets.append(offset)
+      if len(offsets) == len(starts):
+        break
+    offset += length
+    line += 1
+  return offsets
+
+
+def annotate_statements(src, flags, lineno=1, tokenizer=None, budget=None):
+  """Annotate the source of consecutive top-level statements as a module.
+
+  Arguments:
+    src: (string) Source code of the statements, starting on the first line of
+      the first one.
+    flags: (int) Compiler flags for the __future__ imports of the module the
+      statements are in.
+    lineno: (int) Line of that module which the source starts on.
+    tokenizer: (optional function) Tokenizer backend to annotate the source
+      with.
+    budget: (optional budget.Budget) Limit on the time and steps spent
+      annotating.
+  Returns:
+    The annotated ast.Module, with the line numbers of the whole module.
+  """
+  tree = ast_utils.normalize(compile(
+      ast_utils.sanitize_source(src), '<unknown>', 'exec',
+      ast.PyCF_ONLY_AST | flags, True))
+  annotate.AstAnnotator(src, tokenizer=tokenizer, budget=budget).visit(tree)
+  ast.increment_lineno(tree, lineno - 1)
+  return tree
+
+
+def join_statements(previous, stmt, src):
+  """Join a statement annotated separately to the statement before it.
+
+  The comments and blank lines between two statements annotated separately
+  are not part of either one's formatting. Annotating them together puts these
+  in the prefix of the second statement, so they are added to it.
+
+  Arguments:
+    previous: (ast.stmt) The statement before `stmt`.
+    stmt: (ast.stmt) The first statement annotated separately.
+    src: (string) Source code of the module, which both statements' formatting
+      refers to.
+  """
+  _, end = getattr(previous, ast_utils.PASTA_DICT).source_range('span')
+  props = getattr(stmt, ast_utils.PASTA_DICT)
+  start, span_end = props.source_range('span')
+  prefix_end = start + len(props['prefix'])
+  ast_utils.setprop_from_source(stmt, 'prefix', src, end, prefix_end)
+  ast_utils.setprop_from_source(stmt, 'span', src, end, span_end)
+
+
+def get_unannotated(node):
+  """Get the LazyFormatting if `node` is a statement not yet annotated."""
+  props = getattr(node, ast_utils.PASTA_DICT, None)
+  if isinstance(props, LazyFormatting) and props.stmt is node:
+    return props
+  return None
+
+
+def _node_predicate(annotate_only):
+  """Get a function selecting nodes from a node type, types or function."""
+  if isinstance(annotate_only, (type, tuple)):
+    return lambda node: isinstance(node, annotate_only)
+  return annotate_only
+
+
+def _set_placeholder(stmt, placeholder):
+  """Normalize a statement and set the placeholder on all of its nodes."""
+  for node in ast_utils.walk_and_normalize(stmt):
+    if not isinstance(node, ast.expr_context):
+      setattr(node, ast_utils.PASTA_DICT, placeholder)
+
+
+def first_line(stmt):
+  """Get the line a statement starts on, including its decorators."""
+  return min([stmt.lineno] +
+             [d.lineno for d in getattr(stmt, 'decorator_list', ())])
+
+
+def _copy_formatting(src_node, dst_node, placeholder):
+  """Copy formatting between matching nodes of two similar syntax trees."""
+  stack = [(src_node, dst_node)]
+  while stack:
+    src_node, dst_node = stack.pop()
+    if not isinstance(dst_node, ast.AST):
+      continue
+    if type(src_node) is not type(dst_node):
+      _clear_placeholders(dst_node, placeholder)
+      continue
+    if getattr(dst_node, ast_utils.PASTA_DICT, placeholder) is placeholder:
+      props = getattr(src_node, ast_utils.PASTA_DICT, None)
+      if props is not None:
+        _remap_dependencies(props, dst_node)
+        setattr(dst_node, ast_utils.PASTA_DICT, props)
+      if hasattr(src_node, 'is_continued'):
+        dst_node.is_continued = src_node.is_continued
+    for field in src_node._fields:
+      src_val = getattr(src_node, field, None)
+      dst_val = getattr(dst_node, field, None)
+      if isinstance(src_val, ast.AST) and isinstance(dst_val, ast.AST):
+        stack.append((src_val, dst_val))
+      elif isinstance(src_val, list) and isinstance(dst_val, list):
+        pairs = _match_lists(src_val, dst_val)
+        matched = set(id(dst) for _, dst in pairs)
+        stack.extend(pairs)
+        for item in dst_val:
+          if isinstance(item, ast.AST) and id(item) not in matched:
+            _clear_placeholders(item, placeholder)
+      elif isinstance(dst_val, ast.AST):
+        _clear_placeholders(dst_val, placeholder)
+
+
+def _remap_dependencies(props, node):
+  """Point dependencies on child nodes at the corresponding child of `node`.
+
+  Dependencies are compared by identity when printing, so a recorded child
+  node must be the very node in the tree being printed.
+  """
+  for key, value in list(props.items()):
+    if key.endswith('__src') and isinstance(value, ast.AST):
+      current = getattr(node, key[:-len('__src')], None)
+      if type(current) is type(value):
+        props[key] = current
+
+
+def _match_lists(src_list, dst_list):
+  """Pair up the items of a list of nodes with the items they came from.
+
+  If items were added or removed, match them in order by their contents.
+  """
+  if len(src_list) == len(dst_list):
+    return list(zip(src_list, dst_list))
+  pairs = []
+  i = 0
+  for dst in dst_list:
+    for j in range(i, len(src_list)):
+      if ast_utils.nodes_equal(src_list[j], dst):
+        pairs.append((src_list[j], dst))
+        i = j + 1
+        break
+  return pairs
+
+
+def _clear_placeholders(node, placeholder):
+  for n in ast.walk(node):
+    if getattr(n, ast_utils.PASTA_DICT, None) is placeholder:
+      delattr(n, ast_utils.PASTA_DICT)
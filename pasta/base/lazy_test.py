@@ -0,0 +1,193 @@
+# coding=utf-8
+"""Tests for lazy."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+import os.path
+import textwrap
+import unittest
+
+from six import with_metaclass
+
+import pasta
+from pasta.augment import rename
+from pasta.base import annotate_test
+from pasta.base import ast_utils
+from pasta.base import lazy
+from pasta.base import test_utils
+
+
+class LazyTest(test_utils.TestCase):
+
+  src = textwrap.dedent('''\
+      # Leading comment
+      import aaa.bbb
+
+      # Comment before foo
+      def foo(a,  b):
+        c = a  # Comment
+        d = b
+        return c + d
+        # Trailing comment
+
+
+      x = 1
+      ''')
+
+  def test_unannotated_until_touched(self):
+    t = pasta.parse(self.src, lazy_annotation=True)
+    self.assertIsNotNone(lazy.get_unannotated(t.body[0]))
+    self.assertIsNotNone(lazy.get_unannotated(t.body[1]))
+
+    self.assertEqual('  # Comment',
+                     ast_utils.prop(t.body[1].body[0].value, 'suffix'))
+    self.assertIsNotNone(lazy.get_unannotated(t.body[0]))
+    self.assertIsNone(lazy.get_unannotated(t.body[1]))
+    self.assertIsNotNone(lazy.get_unannotated(t.body[2]))
+    self.assertEqual('# Leading comment\n', ast_utils.prop(t, 'prefix'))
+
+  def test_annotated_like_eager(self):
+    eager = pasta.parse(self.src)
+    t = pasta.parse(self.src, lazy_annotation=True)
+    ast_utils.prop(t.body[1], 'prefix')
+    for eager_node, lazy_node in zip(ast.walk(eager.body[1].body[0]),
+                                     ast.walk(t.body[1].body[0])):
+      self.assertEqual(getattr(eager_node, ast_utils.PASTA_DICT, None),
+                       getattr(lazy_node, ast_utils.PASTA_DICT, None))
+    # Blank lines before the next statement are part of the suffix
+    self.assertEqual(ast_utils.prop(eager.body[1], 'suffix') +
+                     ast_utils.prop(eager.body[2], 'prefix'),
+                     ast_utils.prop(t.body[1], 'suffix'))
+
+  def test_dump_untouched(self):
+    t = pasta.parse(self.src, lazy_annotation=True)
+    self.assertMultiLineEqual(self.src, pasta.dump(t))
+
+  def test_dump_touched(self):
+    t = pasta.parse(self.src, lazy_annotation=True)
+    for node in ast.walk(t):
+      ast_utils.prop(node, 'prefix')
+    self.assertMultiLineEqual(self.src, pasta.dump(t))
+
+  def test_modify_field(self):
+    t = pasta.parse(self.src, lazy_annotation=True)
+    t.body[1].name = 'bar'
+    t.body[1].body[1].targets[0].id = 'e'
+    self.assertMultiLineEqual(
+        self.src.replace('def foo', 'def bar').replace('d = b', 'e = b'),
+        pasta.dump(t))
+
+  def test_remove_child(self):
+    t = pasta.parse(self.src, lazy_annotation=True)
+    ast_utils.remove_child(t.body[1], t.body[1].body[1])
+    self.assertMultiLineEqual(self.src.replace('  d = b\n', ''), pasta.dump(t))
+
+  def test_rename_external(self):
+    eager = pasta.parse(self.src)
+    rename.rename_external(eager, 'aaa.bbb', 'ccc.ddd')
+    t = pasta.parse(self.src, lazy_annotation=True)
+    rename.rename_external(t, 'aaa.bbb', 'ccc.ddd')
+    self.assertMultiLineEqual(pasta.dump(eager), pasta.dump(t))
+    self.assertIsNotNone(lazy.get_unannotated(t.body[1]))
+
+  def test_future_imports(self):
+    src = 'from __future__ import print_function\nprint(1, end="")\n'
+    t = pasta.parse(src, lazy_annotation=True)
+    self.assertTrue(lazy.get_unannotated(t.body[1]).unchanged())
+
+  def test_no_statements(self):
+    src = '# Just a comment\n\n'
+    t = pasta.parse(src, lazy_annotation=True)
+    self.assertEqual(src, ast_utils.prop(t, 'prefix'))
+    self.assertEqual(src, pasta.dump(t))
+
+  def test_form_feed(self):
+    src = 'a = 1\n\x0c\nb = 2\n'
+    t = pasta.parse(src, lazy_annotation=True)
+    self.assertEqual('a = 1\n\x0c\n', lazy.get_unannotated(t.body[0]).src)
+    self.assertEqual(src, pasta.dump(t))
+
+  def test_annotate_only_types(self):
+    t = pasta.parse(self.src, annotate_only=(ast.Import, ast.ImportFrom))
+    self.assertIsNone(lazy.get_unannotated(t.body[0]))
+    self.assertIsNotNone(lazy.get_unannotated(t.body[1]))
+    self.assertIsNotNone(lazy.get_unannotated(t.body[2]))
+    self.assertMultiLineEqual(self.src, pasta.dump(t))
+
+    t.body[0].names[0].name = 'ccc.ddd'
+    self.assertMultiLineEqual(self.src.replace('aaa.bbb', 'ccc.ddd'),
+                              pasta.dump(t))
+
+  def test_annotate_only_function(self):
+    def uses_c(node):
+      return isinstance(node, ast.Name) and node.id == 'c'
+    t = pasta.parse(self.src, annotate_only=uses_c)
+    self.assertIsNotNone(lazy.get_unannotated(t.body[0]))
+    self.assertIsNone(lazy.get_unannotated(t.body[1]))
+    self.assertIsNotNone(lazy.get_unannotated(t.body[2]))
+    self.assertEqual('  # Comment',
+                     ast_utils.prop(t.body[1].body[0].value, 'suffix'))
+    self.assertMultiLineEqual(self.src, pasta.dump(t))
+
+  def test_annotate_only_nothing_selected(self):
+    t = pasta.parse(self.src, annotate_only=ast.ImportFrom)
+    for stmt in t.body:
+      self.assertIsNotNone(lazy.get_unannotated(stmt))
+    self.assertMultiLineEqual(self.src, pasta.dump(t))
+
+
+class SymmetricTestMeta(type):
+
+  def __new__(mcs, name, bases, inst_dict):
+    # Helper function to generate a test method
+    def symmetric_test_generator(filepath):
+      def test(self):
+        with open(filepath, 'r') as handle:
+          src = handle.read()
+        t = pasta.parse(src, lazy_annotation=True)
+        self.assertMultiLineEqual(src, pasta.dump(t))
+      return test
+
+    # Add a test method for each input file
+    test_method_prefix = 'test_symmetric_'
+    data_dir = os.path.join(annotate_test.TESTDATA_DIR, 'ast')
+    for dirpath, dirs, files in os.walk(data_dir):
+      for filename in files:
+        if filename.endswith('.in'):
+          full_path = os.path.join(dirpath, filename)
+          inst_dict[test_method_prefix + filename[:-3]] = unittest.skipIf(
+              not annotate_test._is_syntax_valid(full_path),
+              'Test contains syntax not supported by this version.',
+          )(symmetric_test_generator(full_path))
+    return type.__new__(mcs, name, bases, inst_dict)
+
+
+class SymmetricTest(with_metaclass(SymmetricTestMeta, test_utils.TestCase)):
+  """Validates the symmetry property for lazily annotated modules."""
+
+
+def suite():
+  result = unittest.TestSuite()
+  result.addTests(unittest.makeSuite(LazyTest))
+  result.addTests(unittest.makeSuite(SymmetricTest))
+  return result
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -22,62 +22,345 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import array
 import ast
+import bisect
 import collections
 import contextlib
+import copy
 import itertools
+import sys
 import tokenize
-from six import StringIO
+import weakref
 
 from pasta.base import ast_utils
+from pasta.base import tokenizer as tokenizers
 
 # Alias for extracting token names
 TOKENS = tokenize
 Token = collections.namedtuple('Token', ('type', 'src', 'start', 'end', 'line'))
 
+# Types of tokens read as part of whitespace, without and with newlines
+_COMMENT_TYPES = frozenset((TOKENS.COMMENT, TOKENS.INDENT, TOKENS.DEDENT))
+_SPACE_TYPES = _COMMENT_TYPES | frozenset((TOKENS.NL, TOKENS.NEWLINE))
+# Types of every token but names
+_NON_NAME_TYPES = frozenset(tokenize.tok_name) - frozenset((TOKENS.NAME,))
+
+# Number of tokens to build Token tuples for at a time, and number of such
+# blocks to keep
+_BLOCK_SIZE = 256
+_MAX_BLOCKS = 4
+# Number of tokens to read at a time, and to drop at a time at least, when
+# reading tokens in a window. This is a multiple of _BLOCK_SIZE.
+_WINDOW_CHUNK = 16 * _BLOCK_SIZE
+
+# Tokens of the source each module was annotated from, see set_module_tokens
+_module_tokens = weakref.WeakKeyDictionary()
+
 
 class TokenGenerator(object):
+  """Reads the tokens of python source code, and the formatting between them.
+
+  Tokens are stored as arrays of their fields rather than as a list of tuples,
+  which would take several objects per token. Token tuples are only built when
+  a token is read.
+
+  With a `window`, tokens are read from the tokenizer as they are needed and
+  only the last `window` tokens before the current one are kept, so memory
+  does not grow with the number of tokens of the source. Since the arrays of
+  token fields then only start at the first token kept, indexes into them are
+  only used until the next call to next or whitespace, which drop old tokens.
 
-  def __init__(self, source):
-    _token_generator = tokenize.generate_tokens(StringIO(source).readline)
-    self._tokens = list(Token(*tok) for tok in _token_generator)
+  Arguments:
+    source: (string) Python source code.
+    tokenizer: (optional function) Tokenizer backend to read the tokens of the
+      source with. See pasta.base.tokenizer. Defaults to tokenize.
+    tokens: (optional iterable) Tokens of the source already read, such as
+      those from tokenize.generate_tokens, to use instead of a tokenizer.
+    window: (optional int) Number of tokens before the current one to keep, and
+      so the furthest it can rewind. If None, all tokens are kept.
+  """
+
+  def __init__(self, source, tokenizer=None, tokens=None, window=None):
+    self._source = source
+    self._len_source = len(source)
+    # Offset of the start of each line, so that any location in the source can
+    # be found without splitting it into lines. Tokens after the last line
+    # start at the end of the source.
+    self._line_offsets = _line_offsets(source)
+    self._line_offsets.extend((self._len_source, self._len_source))
+    self._types = array.array('B')
+    self._start_rows = array.array('i')
+    self._start_cols = array.array('i')
+    self._end_rows = array.array('i')
+    self._end_cols = array.array('i')
+    self._start_offsets = array.array('i')
+    self._end_offsets = array.array('i')
+    # Source of the tokens whose text is not the source between their start
+    # and end, by index. Only tokens generated at the end of the source, such
+    # as a NEWLINE token with no newline character, have such text.
+    self._srcs = {}
+    # Source of the parenthesis tokens, by index
+    self._paren_srcs = {}
+    # Index of the first token from each index on which is not whitespace,
+    # without and with newlines, and of the next name
+    self._comment_ends = array.array('i', [0])
+    self._space_ends = array.array('i', [0])
+    self._next_names = array.array('i', [0])
+    # Nodes each node opening a scope could be in, see _scope_helper
+    self._scopes = {}
+    self._len = 0
+    self._window = window
+    # Number of tokens dropped from the start of the arrays
+    self._dropped = 0
+    # Index of the current token from which to drop old tokens
+    self._drop_at = sys.maxsize if window is None else window + _WINDOW_CHUNK
+    if tokens is None:
+      tokens = (tokenizer or tokenizers.tokenize_tokens)(source)
+    self._token_iter = iter(tokens)
+    self._exhausted = False
+    self._tokens = []
+    self._read_tokens(None if window is None else _WINDOW_CHUNK)
+    self._reset()
+
+  def _reset(self):
+    """Go back to the start of the source, with no scope open."""
     self._parens = []
     self._hints = 0
     self._scope_stack = []
-    self._lines = source.splitlines(True)
-    self._len = len(self._tokens)
+    # Token tuples are built a block at a time, and only the most recently
+    # used blocks are kept
+    self._tokens = [None] * self._len
+    self._blocks = []
     self._i = -1
     self._loc = self.loc_begin()
 
+  def fork(self):
+    """Get a TokenGenerator at the start of the same source.
+
+    The tokens are not read again: both generators share them, but each has
+    its own current location.
+
+    Raises:
+      ValueError: If tokens are read in a window, so some are not kept.
+    """
+    if self._window is not None:
+      raise ValueError('Cannot fork tokens read in a window')
+    result = copy.copy(self)
+    result._scopes = {}
+    result._reset()
+    return result
+
+  def tokens(self):
+    """Get all the tokens of the source, without moving the current location.
+
+    Returns:
+      An iterator of Token tuples.
+    Raises:
+      ValueError: If tokens are read in a window, so some are not kept.
+    """
+    if self._window is not None:
+      raise ValueError('Cannot list tokens read in a window')
+    return (self._token(i) for i in range(self._len))
+
+  def _read_tokens(self, count=None):
+    """Read more tokens from the tokenizer.
+
+    Arguments:
+      count: (optional int) Number of tokens to read. More are read, up to the
+        next token which is not whitespace, so that each whitespace run read
+        ends with a token read. If None, read all the tokens.
+    """
+    start_i = self._len
+    chunk = count or _WINDOW_CHUNK
+    while not self._exhausted:
+      tokens = list(itertools.islice(self._token_iter, chunk))
+      if len(tokens) < chunk:
+        self._exhausted = True
+      while (count is not None and not self._exhausted and
+             tokens[-1][0] in _SPACE_TYPES):
+        token = next(self._token_iter, None)
+        if token is None:
+          self._exhausted = True
+        else:
+          tokens.append(token)
+      self._add_tokens(tokens)
+      if count is not None:
+        break
+
+    self._tokens.extend([None] * (self._len - start_i))
+    _run_ends(self._types, _COMMENT_TYPES, self._comment_ends)
+    _run_ends(self._types, _SPACE_TYPES, self._space_ends)
+    _run_ends(self._types, _NON_NAME_TYPES, self._next_names)
+
+  def _add_tokens(self, tokens):
+    """Add the fields of a list of tokens to the arrays of token fields."""
+    if not tokens:
+      return
+    # The fields are added a column at a time, which is faster than a token at
+    # a time
+    types, srcs, starts, ends = list(zip(*tokens))[:4]
+    line_offsets = self._line_offsets
+    start_offsets = [line_offsets[row - 1] + col for row, col in starts]
+    end_offsets = [line_offsets[row - 1] + col for row, col in ends]
+    self._types.fromlist(list(types))
+    self._start_rows.fromlist([row for row, _ in starts])
+    self._start_cols.fromlist([col for _, col in starts])
+    self._end_rows.fromlist([row for row, _ in ends])
+    self._end_cols.fromlist([col for _, col in ends])
+    self._start_offsets.fromlist(start_offsets)
+    self._end_offsets.fromlist(end_offsets)
+    for i, src, start_offset, end_offset in zip(
+        itertools.count(self._len), srcs, start_offsets, end_offsets):
+      if len(src) != end_offset - start_offset:
+        self._srcs[i] = src
+      elif src == '(' or src == ')':
+        self._paren_srcs[i] = src
+    self._len += len(tokens)
+
+  def _ensure(self, i):
+    """Read tokens up to the one at an index, if there are that many."""
+    while i >= self._len and not self._exhausted:
+      self._read_tokens(_WINDOW_CHUNK)
+
+  def _drop_tokens(self):
+    """Drop the tokens read which are before the window of kept tokens."""
+    # Tuples are built for blocks starting at multiples of _BLOCK_SIZE, which
+    # must still be so
+    count = (self._i - self._window) // _BLOCK_SIZE * _BLOCK_SIZE
+    if count <= 0:
+      return
+    for tokens in (self._types, self._start_rows, self._start_cols,
+                   self._end_rows, self._end_cols, self._start_offsets,
+                   self._end_offsets):
+      del tokens[:count]
+    for ends in (self._comment_ends, self._space_ends, self._next_names):
+      ends[:] = array.array('i', [end - count for end in ends[count:]])
+    self._srcs = dict((i - count, src) for i, src in self._srcs.items()
+                      if i >= count)
+    self._paren_srcs = dict((i - count, src)
+                            for i, src in self._paren_srcs.items()
+                            if i >= count)
+    del self._tokens[:count]
+    self._blocks = [start - count for start in self._blocks if start >= count]
+    self._len -= count
+    self._i -= count
+    self._dropped += count
+    self._drop_at = self._i + _WINDOW_CHUNK
+
+  def _token(self, i):
+    """Get the Token tuple for the token at an index."""
+    token = self._tokens[i]
+    if token is None:
+      self._load_block(i - i % _BLOCK_SIZE)
+      token = self._tokens[i]
+    return token
+
+  def _load_block(self, start):
+    """Build the Token tuples for the block of tokens from an index."""
+    if len(self._blocks) >= _MAX_BLOCKS:
+      old_start = self._blocks.pop(0)
+      old_end = min(old_start + _BLOCK_SIZE, self._len)
+      self._tokens[old_start:old_end] = [None] * (old_end - old_start)
+    self._blocks.append(start)
+
+    end = min(start + _BLOCK_SIZE, self._len)
+    line_offsets = self._line_offsets
+    source = self._source
+    srcs = self._srcs
+    self._tokens[start:end] = [
+        Token(tok_type,
+              srcs[i] if i in srcs else source[start_offset:end_offset],
+              (start_row, start_col), (end_row, end_col),
+              source[line_offsets[start_row - 1]:line_offsets[end_row]])
+        for i, tok_type, start_row, start_col, end_row, end_col, start_offset,
+        end_offset in zip(
+            range(start, end), self._types[start:end],
+            self._start_rows[start:end], self._start_cols[start:end],
+            self._end_rows[start:end], self._end_cols[start:end],
+            self._start_offsets[start:end], self._end_offsets[start:end])]
+
+  def _offset_of(self, loc):
+    """Get the offset into the source of a (row, col) location."""
+    row, col = loc
+    try:
+      return min(self._line_offsets[row - 1] + col, self._len_source)
+    except IndexError:
+      return self._len_source
+
+  def _src(self, i):
+    """Get the source of the token at an index."""
+    src = self._srcs.get(i)
+    if src is None:
+      src = self._source[self._start_offsets[i]:self._end_offsets[i]]
+    return src
+
+  def _start_loc(self, i):
+    return (self._start_rows[i], self._start_cols[i])
+
+  def _end_loc(self, i):
+    return (self._end_rows[i], self._end_cols[i])
+
+  def _check_loc(self, i):
+    """Check that the current location is not past the token at an index."""
+    if i < self._len and self._loc > self._start_loc(i):
+      raise ValueError('prev_loc > token start', self._loc, self._start_loc(i))
+
   def loc_begin(self):
     """Get the start column of the current location parsed to."""
     if self._i < 0:
       return (1, 0)
-    return self._tokens[self._i].start
+    return self._token(self._i).start
 
   def loc_end(self):
     """Get the end column of the current location parsed to."""
     if self._i < 0:
       return (1, 0)
-    return self._tokens[self._i].end
+    return self._token(self._i).end
+
+  def source(self):
+    """Get the full source code being parsed."""
+    return self._source
+
+  def offset(self):
+    """Get the offset into the source of the current location parsed to."""
+    row, col = self._loc
+    try:
+      return min(self._line_offsets[row - 1] + col, self._len_source)
+    except IndexError:
+      return self._len_source
 
   def peek(self):
     """Get the next token without advancing."""
     if self._i + 1 >= self._len:
-      return None
-    return self._tokens[self._i + 1]
+      self._ensure(self._i + 1)
+      if self._i + 1 >= self._len:
+        return None
+    return self._tokens[self._i + 1] or self._token(self._i + 1)
 
   def next(self, advance=True):
     """Consume the next token and optionally advance the current location."""
+    if self._i >= self._drop_at:
+      self._drop_tokens()
     self._i += 1
     if self._i >= self._len:
-      return None
+      self._ensure(self._i)
+      if self._i >= self._len:
+        return None
+    token = self._tokens[self._i] or self._token(self._i)
     if advance:
-      self._loc = self._tokens[self._i].end
-    return self._tokens[self._i]
+      self._loc = token.end
+    return token
 
   def rewind(self, amount=1):
-    """Rewind the token iterator."""
+    """Rewind the token iterator.
+
+    Raises:
+      ValueError: If tokens are read in a window, and it would rewind to a
+        token no longer kept.
+    """
+    if self._dropped and self._i - amount < 0:
+      raise ValueError('Cannot rewind past the window of tokens kept')
     self._i -= amount
 
   def whitespace(self, max_lines=None):
@@ -93,120 +376,126 @@ class TokenGenerator(object):
     Post-condition:
       `_loc' is exactly at the character that was parsed to.
     """
-    def predicate(token):
-      return (token.type in (TOKENS.COMMENT, TOKENS.INDENT, TOKENS.DEDENT) or
-              max_lines is None and token.type in (TOKENS.NL, TOKENS.NEWLINE))
-    whitespace = list(self.takewhile(predicate, advance=False))
-    next_token = self.peek()
-
-    result = ''
-    for tok in itertools.chain(whitespace,
-                               ((next_token,) if next_token else ())):
-      result += self._space_between(self._loc, tok)
-      if tok != next_token:
-        result += tok.src
-        self._loc = tok.end
-      else:
-        self._loc = tok.start
-
-    # Eat a single newline character
-    if ((max_lines is None or max_lines > 0) and
-        next_token and next_token.type in (TOKENS.NL, TOKENS.NEWLINE)):
-      result += self.next().src
-
-    return result
+    if self._i >= self._drop_at:
+      self._drop_tokens()
+    i = self._i + 1
+    self._ensure(i)
+    self._check_loc(i)
+    start = self.offset()
+    if i < self._len:
+      ends = self._space_ends if max_lines is None else self._comment_ends
+      end_i = ends[i]
+      self._i = end_i - 1
+      if end_i < self._len:
+        self._loc = self._start_loc(end_i)
+      elif end_i > i:
+        self._loc = self._end_loc(end_i - 1)
+
+      # Eat a single newline character
+      if ((max_lines is None or max_lines > 0) and end_i < self._len and
+          self._types[end_i] in (TOKENS.NL, TOKENS.NEWLINE)):
+        self.next()
+
+    # Everything parsed is whitespace or comments, so it is a single slice of
+    # the source
+    return self._source[start:self.offset()]
 
   def block_whitespace(self, indent_level):
-    """Parses whitespace from the current _loc to the end of the block."""
-    # Get the normal suffix lines, but don't advance the token index unless
-    # there is no indentation to account for
-    start_i = self._i
-    full_whitespace = self.whitespace()
-    if not indent_level:
-      return full_whitespace
-    self._i = start_i
+    """Parses whitespace from the current _loc to the end of the block.
 
-    # Trim the full whitespace into only lines that match the indentation level
-    lines = full_whitespace.splitlines(True)
-    try:
-      last_line_idx = next(i for i, line in reversed(list(enumerate(lines)))
-                           if line.startswith(indent_level + '#'))
-    except StopIteration:
-      # No comment lines at the end of this block
-      self._loc = self._tokens[self._i].end
+    This is the whitespace up to and including the last comment line indented
+    at `indent_level`, if any. Any comments after it belong to the following
+    statement instead.
+    """
+    if not indent_level:
+      return self.whitespace()
+    start_i = self._i
+    i = start_i + 1
+    self._ensure(i)
+    self._check_loc(i)
+    start = self.offset()
+    end_i = self._space_ends[i] if i < self._len else i
+
+    # Find the last comment at the start of a line, after exactly the block's
+    # indentation
+    last_comment = None
+    for comment in range(i, end_i):
+      if self._types[comment] == TOKENS.COMMENT:
+        comment_start = self._start_offsets[comment]
+        line_start = max(
+            self._line_offsets[self._start_rows[comment] - 1], start)
+        if self._source[line_start:comment_start] == indent_level:
+          last_comment = comment
+    if last_comment is None:
+      self._loc = self.loc_end()
       return ''
-    lines = lines[:last_line_idx + 1]
 
-    # Advance the current location to the last token in the lines we've read
-    end_line = self._tokens[self._i].end[0] + 1 + len(lines)
-    list(self.takewhile(lambda tok: tok.start[0] < end_line))
-    self._loc = self._tokens[self._i].end
-    return ''.join(lines)
+    # Read up to the end of the comment's line, and the tokens before it
+    row = self._start_rows[last_comment]
+    if end_i < self._len:
+      end = self._start_offsets[end_i]
+    else:
+      end = self._end_offsets[end_i - 1]
+    end = min(self._line_offsets[row], end)
+    first_row = bisect.bisect_right(self._line_offsets, start)
+    end_row = self._end_rows[start_i] + 1 + row - first_row + 1
+    self._i = bisect.bisect_left(self._start_rows, end_row, i, self._len) - 1
+    self._loc = self.loc_end()
+    return self._source[start:end]
 
   def open_scope(self, node):
     """Open a parenthesized scope on the given node."""
-    prev_loc = self._loc
-
-    def predicate(token):
-      return (token.type in (TOKENS.NL, TOKENS.NEWLINE, TOKENS.COMMENT,
-                             TOKENS.INDENT) or token.src in '(')
-    whitespace = list(self.takewhile(predicate, advance=False))
-    next_token = self.next(advance=False)
-
-    result = ''
-    parens = []
-    last_paren_loc = None
-    for tok in whitespace:
-      result += self._space_between(prev_loc, tok)
-      result += tok.src
-      prev_loc = tok.end
-
-      if tok.src == '(':
-        last_paren_loc = prev_loc
-        parens.append(result)
-        result = ''
-
-    if parens:
-      parens[-1] += self._space_between(last_paren_loc, next_token)
-
-      for paren in parens:
-        self._parens.append(paren)
-        self._scope_stack.append(_scope_helper(node))
-      self._loc = next_token.start
-      self.rewind(1)
-    else:
-      self.rewind(len(whitespace) + 1)
+    # Whitespace and parentheses are contiguous in the source, so each
+    # parenthesis' formatting is a slice of it
+    i = self._i + 1
+    self._check_loc(i)
+    start = self.offset()
+    paren_ends = []
+    self._ensure(i)
+    while i < self._len:
+      i = self._space_ends[i]
+      if self._paren_srcs.get(i) == '(':
+        paren_ends.append(self._end_offsets[i])
+      elif i == self._len or self._src(i):
+        break
+      i += 1
+      self._ensure(i)
+    if not paren_ends:
+      return
+
+    scope = _scope_helper(node, self._scopes)
+    next_start = (self._start_offsets[i] if i < self._len
+                  else self._len_source)
+    for end in paren_ends[:-1] + [next_start]:
+      self._parens.append(self._source[start:end])
+      self._scope_stack.append(scope)
+      start = end
+    self._loc = self._start_loc(i)
+    self._i = i - 1
 
   def close_scope(self, node, prefix_attr='prefix', suffix_attr='suffix'):
     """Close a parenthesized scope on the given node, if one is open."""
     if not self._parens:
       return
-    prev_loc = self._loc
-
-    def predicate(token):
-      return (token.type in (TOKENS.NL, TOKENS.NEWLINE, TOKENS.COMMENT,
-                             TOKENS.INDENT, TOKENS.DEDENT) or token.src in ')')
-    whitespace = list(self.takewhile(predicate, advance=False))
-
-    count = 0
-    result = ''
-    for tok in whitespace:
-      count += 1
-      if not self._parens or node not in self._scope_stack[-1]:
-        continue
-
-      result += self._space_between(prev_loc, tok)
-      result += tok.src
-      prev_loc = tok.end
-
-      if tok.src == ')':
-        self._scope_stack.pop()
-        ast_utils.prependprop(node, prefix_attr, self._parens.pop())
-        ast_utils.appendprop(node, suffix_attr, result)
-        result = ''
-        count = 0
-        self._loc = tok.end
-    self.rewind(count)
+    i = self._i + 1
+    self._check_loc(i)
+    start = self.offset()
+    self._ensure(i)
+    while i < self._len:
+      i = self._space_ends[i]
+      if self._paren_srcs.get(i) == ')':
+        if self._parens and node in self._scope_stack[-1]:
+          self._scope_stack.pop()
+          end = self._end_offsets[i]
+          ast_utils.prependprop(node, prefix_attr, self._parens.pop())
+          ast_utils.appendprop(node, suffix_attr, self._source[start:end])
+          start = end
+          self._i = i
+          self._loc = self._end_loc(i)
+      elif i == self._len or self._src(i):
+        break
+      i += 1
+      self._ensure(i)
 
   def hint_open(self):
     """Indicates opening a group of parentheses or brackets."""
@@ -235,41 +524,29 @@ class TokenGenerator(object):
 
   def str(self):
     """Parse a full string literal from the input."""
-    def predicate(token):
-      return (token.type in (TOKENS.STRING, TOKENS.COMMENT) or
-              self.is_in_scope() and token.type in (TOKENS.NL, TOKENS.NEWLINE))
-
-    content = ''
-    prev_loc = self._loc
-    tok = None
-    for tok in self.takewhile(predicate, advance=False):
-      content += self._space_between(prev_loc, tok)
-      content += tok.src
-      prev_loc = tok.end
-
-    if tok:
-      self._loc = tok.end
-    return content
-
-  def _space_between(self, prev_loc, tok):
-    """Parse the space between a location and the next token"""
-    if prev_loc > tok.start:
-      raise ValueError('prev_loc > token start', prev_loc, tok.start)
-    if prev_loc[0] > len(self._lines):
+    types = (TOKENS.STRING, TOKENS.COMMENT)
+    if self.is_in_scope():
+      types += (TOKENS.NL, TOKENS.NEWLINE)
+    i = self._i + 1
+    self._check_loc(i)
+    start = self.offset()
+    self._ensure(i)
+    while i < self._len and self._types[i] in types:
+      i += 1
+      self._ensure(i)
+    if i == self._i + 1:
       return ''
-    return ast_utils.space_between(prev_loc, tok.start,
-                                   self._lines[prev_loc[0] - 1], self._lines)
+    self._i = i - 1
+    self._loc = self._end_loc(i - 1)
+    return self._source[start:self._end_offsets[i - 1]]
 
   def next_name(self):
     """Parse the next name token."""
-    last_i = self._i
-    def predicate(token):
-      return token.type != TOKENS.NAME
-
-    unused_tokens = list(self.takewhile(predicate, advance=False))
-    result = self.next(advance=False)
-    self._i = last_i
-    return result
+    i = self._next_names[min(self._i + 1, self._len)]
+    while i == self._len and not self._exhausted:
+      self._read_tokens(_WINDOW_CHUNK)
+      i = self._next_names[i]
+    return self._token(i) if i < self._len else None
 
   def next_of_type(self, token_type):
     """Parse a token of the given type and return it."""
@@ -277,7 +554,7 @@ class TokenGenerator(object):
     if token.type != token_type:
       raise ValueError("Expected %r but found %r\nline %d: %s" % (
           tokenize.tok_name[token_type], token.src, token.start[0],
-          self._lines[token.start[0] - 1]))
+          token.line))
     return token
 
   def takewhile(self, condition, advance=True):
@@ -289,7 +566,83 @@ class TokenGenerator(object):
     self.rewind()
 
 
-def _scope_helper(node):
+def set_module_tokens(tree, tokens):
+  """Keep the tokens a module was annotated from, to share with module_tokens.
+
+  Arguments:
+    tree: (ast.Module) The annotated module.
+    tokens: (TokenGenerator) Tokens of the whole source of the module. They
+      are not kept if they were read in a window.
+  """
+  if tokens._window is None:
+    _module_tokens[tree] = tokens.fork()
+
+
+def clear_module_tokens(tree):
+  """Forget the tokens kept for a module, e.g. once its source has changed."""
+  _module_tokens.pop(tree, None)
+
+
+def module_tokens(tree):
+  """Get the tokens of the source a module was parsed from.
+
+  The tokens read when the module was annotated are reused if they were kept
+  with set_module_tokens. Otherwise, e.g. if the module was annotated lazily or
+  loaded from a cache, the source is tokenized once and kept from then on.
+
+  Arguments:
+    tree: (ast.Module) A syntax tree parsed with pasta.parse.
+  Returns:
+    A TokenGenerator at the start of the source.
+  Raises:
+    ValueError: If the tree was not parsed from source.
+  """
+  tokens = _module_tokens.get(tree)
+  if tokens is None:
+    props = getattr(tree, ast_utils.PASTA_DICT, None)
+    source = getattr(props, 'source', None)
+    if source is None:
+      raise ValueError('The tree was not parsed from source code')
+    tokens = _module_tokens[tree] = TokenGenerator(source)
+  return tokens.fork()
+
+
+def _line_offsets(source):
+  """Get the offset of the start of each line, as counted by tokenize."""
+  offsets = array.array('i', [0])
+  i = source.find('\n')
+  while i != -1:
+    offsets.append(i + 1)
+    i = source.find('\n', i + 1)
+  return offsets
+
+
+def _run_ends(types, run_types, ends):
+  """Get the index of the next token not of the given types from each index.
+
+  Arguments:
+    types: (array) Types of the tokens.
+    run_types: (frozenset) Types of the tokens in runs.
+    ends: (array) Result for the tokens before the last ones added to `types`,
+      followed by the number of such tokens. It is extended to all the tokens
+      in place.
+  """
+  start = len(ends) - 1
+  new_ends = array.array('i', [len(types)]) * (len(types) - start + 1)
+  end = len(types)
+  for i in range(len(types) - 1, start - 1, -1):
+    if types[i] not in run_types:
+      end = i
+    new_ends[i - start] = end
+  # Runs which went on to the end of the tokens before go on in the new ones
+  i = start - 1
+  while i >= 0 and ends[i] == start:
+    ends[i] = new_ends[0]
+    i -= 1
+  ends[start:] = new_ends
+
+
+def _scope_helper(node, cache=None):
   """Get the closure of nodes that could begin a scope at this point.
 
   For instance, when encountering a `(` when parsing a BinOp node, this could
@@ -301,32 +654,79 @@ def _scope_helper(node):
 
   Arguments:
     node: (ast.AST) Node encountered when opening a scope.
+    cache: (optional dict) Results of previous calls, by node. Since the result
+      for a node includes the result for the first node inside it, this avoids
+      following the whole chain of first nodes again for each node.
 
   Returns:
-    A closure of nodes which that scope might apply to.
+    A _Scope holding the closure of nodes which that scope might apply to.
+  """
+  if cache is None:
+    cache = {}
+  start = node
+  chain = []
+  while node is not None and node not in cache:
+    chain.append(node)
+    node = _scope_first_node(node)
+  if node is None:
+    last, height = chain[-1], -1
+  else:
+    last, height = cache[node].last, cache[node].height
+  for node in reversed(chain):
+    height += 1
+    cache[node] = _Scope(last, height, cache)
+  return cache[start]
+
+
+class _Scope(object):
+  """Closure of nodes which a parenthesized scope might apply to.
+
+  The closure of a node is the chain of nodes from it to the first node inside
+  it, and so on. Rather than holding the whole chain, which would take time in
+  proportion to its length for each node, a scope holds the last node of the
+  chain and how far from it the scope's node is.
+
+  Attributes:
+    last: (ast.AST) Last node of the chain.
+    height: (int) Number of nodes between the scope's node and the last node.
   """
+  __slots__ = ('last', 'height', '_cache')
+
+  def __init__(self, last, height, cache):
+    self.last = last
+    self.height = height
+    self._cache = cache
+
+  def __contains__(self, node):
+    other = self._cache.get(node)
+    return (other is not None and other.last is self.last and
+            other.height <= self.height)
+
+
+def _scope_first_node(node):
+  """Get the node that the source of a node starts with, if it can be scoped."""
   if isinstance(node, ast.Attribute):
-    return (node,) + _scope_helper(node.value)
+    return node.value
   if isinstance(node, ast.Subscript):
-    return (node,) + _scope_helper(node.value)
+    return node.value
   if isinstance(node, ast.Assign):
-    return (node,) + _scope_helper(node.targets[0])
+    return node.targets[0]
   if isinstance(node, ast.AugAssign):
-    return (node,) + _scope_helper(node.target)
+    return node.target
   if isinstance(node, ast.Expr):
-    return (node,) + _scope_helper(node.value)
+    return node.value
   if isinstance(node, ast.Compare):
-    return (node,) + _scope_helper(node.left)
+    return node.left
   if isinstance(node, ast.BoolOp):
-    return (node,) + _scope_helper(node.values[0])
+    return node.values[0]
   if isinstance(node, ast.BinOp):
-    return (node,) + _scope_helper(node.left)
+    return node.left
   if isinstance(node, ast.Tuple) and node.elts:
-    return (node,) + _scope_helper(node.elts[0])
+    return node.elts[0]
   if isinstance(node, ast.Call):
-    return (node,) + _scope_helper(node.func)
+    return node.func
   if isinstance(node, ast.GeneratorExp):
-    return (node,) + _scope_helper(node.elt)
+    return node.elt
   if isinstance(node, ast.IfExp):
-    return (node,) + _scope_helper(node.body)
-  return (node,)
+    return node.body
+  return None
@@ -0,0 +1,230 @@
+# coding=utf-8
+"""Tests for token_generator."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import ast
+import tokenize
+import unittest
+
+from six import StringIO
+
+import pasta
+from pasta.base import ast_utils
+from pasta.base import test_utils
+from pasta.base import token_generator
+
+
+def _tokenize(src):
+  return [tok[:4] for tok in tokenize.generate_tokens(StringIO(src).readline)]
+
+
+class TokenGeneratorTest(test_utils.TestCase):
+
+  def assertTokensEqual(self, src):
+    tokens = token_generator.TokenGenerator(src)
+    result = []
+    while tokens.peek() is not None:
+      result.append(tuple(tokens.next()[:4]))
+    self.assertIsNone(tokens.next())
+    self.assertEqual(_tokenize(src), result)
+
+  def test_tokens(self):
+    self.assertTokensEqual('def f(a):\n  """Doc\n  string."""\n  return a\n')
+
+  def test_tokens_without_final_newline(self):
+    self.assertTokensEqual('if a:\n  b = 1  # comment')
+
+  def test_many_tokens(self):
+    self.assertTokensEqual('x = [\n' + 'a,\n' * 1000 + ']\n')
+
+  def test_whitespace(self):
+    src = 'a = 1  # one\n# two\n\n  # three\nb = 2\n'
+    tokens = token_generator.TokenGenerator(src)
+    for _ in range(3):
+      tokens.next()
+    self.assertEqual('  # one\n', tokens.whitespace(max_lines=1))
+    self.assertEqual('# two\n\n  # three\n', tokens.whitespace())
+    self.assertEqual('b', tokens.next().src)
+
+  def test_block_whitespace(self):
+    src = 'if a:\n  b\n\n  # one\n  # two\n# three\nc\n'
+    tokens = token_generator.TokenGenerator(src)
+    while tokens.next().src != '\n':
+      pass
+    while tokens.next().src != 'b':
+      pass
+    tokens.next()
+    self.assertEqual('\n  # one\n  # two\n', tokens.block_whitespace('  '))
+    self.assertEqual('# three\n', tokens.whitespace())
+    self.assertEqual('c', tokens.next().src)
+
+  def test_whitespace_without_newlines(self):
+    src = 'a  # one\nb\n'
+    tokens = token_generator.TokenGenerator(src)
+    tokens.next()
+    self.assertEqual('  # one', tokens.whitespace(max_lines=0))
+    self.assertEqual('\n', tokens.next().src)
+
+  def test_str(self):
+    src = 'x = ("a"  # one\n     \'b\')\n'
+    tokens = token_generator.TokenGenerator(src)
+    for _ in range(3):
+      tokens.next()
+    tokens.hint_open()
+    self.assertEqual('"a"  # one\n     \'b\'', tokens.str())
+    self.assertEqual(')', tokens.next().src)
+
+  def test_next_name(self):
+    src = 'if a:\n  pass\n# comment\nelif b:\n  pass\n'
+    tokens = token_generator.TokenGenerator(src)
+    while tokens.next().src != 'pass':
+      pass
+    self.assertEqual('elif', tokens.next_name().src)
+    self.assertEqual('\n', tokens.next().src)
+
+  def test_next_name_at_end(self):
+    tokens = token_generator.TokenGenerator('a\n')
+    while tokens.next() is not None:
+      pass
+    self.assertIsNone(tokens.next_name())
+
+  def test_scope_helper_cache(self):
+    node = ast.parse('a.b + c').body[0]
+    cache = {}
+    scope = token_generator._scope_helper(node, cache)
+    inner = token_generator._scope_helper(node.value.left, cache)
+    self.assertEqual(4, len(cache))
+    for n in (node, node.value, node.value.left, node.value.left.value):
+      self.assertIn(n, scope)
+    self.assertNotIn(node.value.right, scope)
+    self.assertNotIn(node.value, inner)
+    self.assertIn(node.value.left.value, inner)
+    self.assertIs(scope, token_generator._scope_helper(node, cache))
+
+  def test_fork(self):
+    tokens = token_generator.TokenGenerator('a = (1)\n')
+    tokens.next()
+    fork = tokens.fork()
+    self.assertEqual('a', fork.next().src)
+    self.assertEqual('=', tokens.next().src)
+    self.assertIs(tokens._types, fork._types)
+
+  def test_all_tokens(self):
+    src = 'def f(a):\n  return a\n'
+    tokens = token_generator.TokenGenerator(src)
+    tokens.next()
+    self.assertEqual(_tokenize(src), [tuple(t[:4]) for t in tokens.tokens()])
+    self.assertEqual('f', tokens.next().src)
+
+  def test_module_tokens(self):
+    src = 'a = 1  # one\nb = 2\n'
+    for lazy_annotation in (False, True):
+      t = pasta.parse(src, lazy_annotation=lazy_annotation)
+      self.assertNotIn(t, token_generator._module_tokens)
+      tokens = pasta.tokens(t)
+      self.assertEqual(_tokenize(src),
+                       [tuple(tok[:4]) for tok in tokens.tokens()])
+      self.assertEqual('a', tokens.next().src)
+      self.assertIs(tokens._types, pasta.tokens(t)._types)
+
+  def test_keep_tokens(self):
+    src = 'a = 1  # one\nb = 2\n'
+    t = pasta.parse(src, keep_tokens=True)
+    self.assertIn(t, token_generator._module_tokens)
+    self.assertEqual(_tokenize(src),
+                     [tuple(tok[:4]) for tok in pasta.tokens(t).tokens()])
+
+  def test_module_tokens_not_parsed(self):
+    with self.assertRaises(ValueError):
+      pasta.tokens(ast.parse('a\n'))
+
+  def test_window(self):
+    src = 'x = [\n' + 'a,  # comment\n' * 3000 + ']\n'
+    tokens = token_generator.TokenGenerator(src, window=2)
+    result = []
+    max_kept = 0
+    while tokens.peek() is not None:
+      result.append(tuple(tokens.next()[:4]))
+      max_kept = max(max_kept, len(tokens._types))
+    self.assertIsNone(tokens.next())
+    self.assertEqual(_tokenize(src), result)
+    self.assertLess(max_kept, 3 * token_generator._WINDOW_CHUNK)
+
+  def test_window_whitespace(self):
+    src = 'a = 1\n' + '# comment\n' * 10000 + 'b = 2\n'
+    tokens = token_generator.TokenGenerator(src, window=2)
+    for _ in range(4):
+      tokens.next()
+    self.assertEqual('b', tokens.next_name().src)
+    self.assertEqual(src[6:-6], tokens.whitespace())
+    self.assertEqual('b', tokens.next().src)
+
+  def test_window_rewind(self):
+    self.addCleanup(setattr, token_generator, '_WINDOW_CHUNK',
+                    token_generator._WINDOW_CHUNK)
+    token_generator._WINDOW_CHUNK = token_generator._BLOCK_SIZE
+    src = 'x = [\n' + 'a, ' * 1000 + ']\n'
+    expected = _tokenize(src)
+    window = 3
+    tokens = token_generator.TokenGenerator(src, window=window)
+    # Rewind as far as the window allows, on each side of the first tokens
+    # dropped
+    drop_at = window + token_generator._WINDOW_CHUNK
+    for i in range(drop_at - 2, drop_at + 3):
+      while tokens._dropped + tokens._i < i:
+        tokens.next()
+      tokens.rewind(window)
+      self.assertEqual(expected[i - window + 1], tuple(tokens.next()[:4]))
+      for _ in range(window - 1):
+        tokens.next()
+    self.assertEqual(token_generator._BLOCK_SIZE, tokens._dropped)
+    with self.assertRaises(ValueError):
+      tokens.rewind(tokens._i + 1)
+
+  def test_window_parse(self):
+    src = '\n'.join('def f%d(a):  # comment\n  return (a +\n          %d)\n' %
+                     (i, i) for i in range(1000))
+    t = pasta.parse(src, token_window=1)
+    expected = pasta.parse(src)
+    for node, expected_node in zip(ast.walk(t), ast.walk(expected)):
+      self.assertEqual(ast_utils.prop(expected_node, 'prefix'),
+                       ast_utils.prop(node, 'prefix'))
+      self.assertEqual(ast_utils.prop(expected_node, 'suffix'),
+                       ast_utils.prop(node, 'suffix'))
+    self.assertEqual(src, pasta.dump(t))
+
+  def test_rewind_to_earlier_tokens(self):
+    src = 'x = [\n' + 'a, ' * 1000 + ']\n'
+    tokens = token_generator.TokenGenerator(src)
+    first = tokens.next()
+    for _ in range(2000):
+      tokens.next()
+    tokens.rewind(2001)
+    self.assertEqual(first, tokens.next())
+    self.assertEqual((1, 1), tokens.loc_end())
+
+
+def suite():
+  result = unittest.TestSuite()
+  result.addTests(unittest.makeSuite(TokenGeneratorTest))
+  return result
+
+
+if __name__ == '__main__':
+  unittest.main()
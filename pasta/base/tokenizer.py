@@ -0,0 +1,231 @@
+# coding=utf-8
+"""Tokenizer backends for the TokenGenerator.
+
+A tokenizer is a function which takes python source code and returns an
+iterable of its tokens. Each token is a tuple whose first fields are those of
+the tokens generated by `tokenize.generate_tokens`: (type, src, start, end).
+Any further fields are ignored.
+"""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import re
+import string
+import tokenize
+from six import StringIO
+
+# Alias for extracting token names
+TOKENS = tokenize
+
+# The token patterns are those of the tokenize module, so that both backends
+# read the same tokens. Patterns for the end of strings are matched against the
+# rest of the source rather than a line at a time, so a backslash may escape a
+# newline. Python 2 only keeps the compiled patterns, in tokenize.endprogs.
+_PSEUDO_TOKEN = re.compile(tokenize.PseudoToken)
+_END_PATTERNS = dict(
+    (prefix, re.compile(getattr(pattern, 'pattern', pattern), re.DOTALL))
+    for prefix, pattern in (getattr(tokenize, 'endpats', None) or
+                            tokenize.endprogs).items()
+    if pattern is not None)
+# Whether a character starts a name, as checked by tokenize: python 2 only
+# allows ascii letters
+_is_name_start = getattr(str, 'isidentifier', None) or frozenset(
+    string.ascii_letters + '_').__contains__
+_INDENT = re.compile(r'[ \f\t]*')
+_NUMBER_CHARS = frozenset('0123456789')
+_NEWLINE_CHARS = frozenset('\r\n')
+# Last characters of the tokens which start strings
+_QUOTE_END_CHARS = frozenset('\'"\n')
+_OPEN_CHARS = frozenset('([{')
+_CLOSE_CHARS = frozenset(')]}')
+
+
+def _ends_with_newline_token(source):
+  """Whether tokenize ends the last line of the source with a NEWLINE token."""
+  tokens = list(tokenize.generate_tokens(StringIO(source).readline))
+  return tokens[-2][0] == tokenize.NEWLINE
+
+
+# Whether tokenize ends the last line with a NEWLINE token if the source does
+# not end with a newline, which older versions do not, and whether it does so
+# if that line is only a comment, which only some versions do
+_FINAL_NEWLINE = _ends_with_newline_token('x')
+_COMMENT_FINAL_NEWLINE = _ends_with_newline_token('x\n#')
+
+
+def tokenize_tokens(source):
+  """Get the tokens of python source from `tokenize.generate_tokens`."""
+  return tokenize.generate_tokens(StringIO(source).readline)
+
+
+def regex_tokens(source):
+  """Get the tokens of python source by scanning it with regular expressions.
+
+  This reads the same tokens as the pure python implementation of
+  `tokenize.generate_tokens`, using the same patterns. The source is scanned in
+  place rather than read a line at a time, and only the (type, src, start, end)
+  fields are built for each token. This is only faster under python 3: the
+  python 2 module builds plain tuples too.
+
+  Raises:
+    tokenize.TokenError: If the source ends inside a string or statement.
+    IndentationError: If a dedent does not match any outer indentation level.
+  """
+  pseudo_match = _PSEUDO_TOKEN.match
+  is_name_start = _is_name_start
+  single_quoted = tokenize.single_quoted
+  triple_quoted = tokenize.triple_quoted
+  len_source = len(source)
+  indents = [0]
+  paren_level = 0
+  continued = False
+  row = 0
+  line_start = 0
+  eol = 0
+  while True:
+    if eol == len_source:
+      # The source ends with a complete line, or is empty
+      last_line = source[line_start:]
+      if paren_level or continued:
+        raise tokenize.TokenError('EOF in multi-line statement', (row + 1, 0))
+      if (last_line and last_line[-1] not in _NEWLINE_CHARS and
+          (_COMMENT_FINAL_NEWLINE if last_line.lstrip().startswith('#')
+           else _FINAL_NEWLINE)):
+        yield (TOKENS.NEWLINE, '', (row, len(last_line)),
+               (row, len(last_line) + 1))
+      row += 1
+      break
+
+    row += 1
+    line_start = pos = eol
+    eol = source.find('\n', line_start) + 1 or len_source
+
+    if not paren_level and not continued:
+      pos = _INDENT.match(source, pos, eol).end()
+      if pos == eol:
+        # The source ends with a line of only indentation
+        break
+
+      initial = source[pos]
+      if initial == '#' or initial in _NEWLINE_CHARS:
+        if initial == '#':
+          comment_end = eol
+          while comment_end > pos and source[comment_end - 1] in _NEWLINE_CHARS:
+            comment_end -= 1
+          yield (TOKENS.COMMENT, source[pos:comment_end],
+                 (row, pos - line_start), (row, comment_end - line_start))
+          pos = comment_end
+        yield (TOKENS.NL, source[pos:eol], (row, pos - line_start),
+               (row, eol - line_start))
+        continue
+
+      column = _indent_column(source[line_start:pos])
+      if column > indents[-1]:
+        indents.append(column)
+        yield (TOKENS.INDENT, source[line_start:pos], (row, 0),
+               (row, pos - line_start))
+      while column < indents[-1]:
+        if column not in indents:
+          raise IndentationError(
+              'unindent does not match any outer indentation level',
+              ('<tokenize>', row, pos - line_start, source[line_start:eol]))
+        indents.pop()
+        yield (TOKENS.DEDENT, '', (row, pos - line_start),
+               (row, pos - line_start))
+    else:
+      continued = False
+
+    while pos < eol:
+      match = pseudo_match(source, pos, eol)
+      if not match:
+        yield (TOKENS.ERRORTOKEN, source[pos], (row, pos - line_start),
+               (row, pos + 1 - line_start))
+        pos += 1
+        continue
+
+      start, pos = match.span(1)
+      if start == pos:
+        continue
+      token = source[start:pos]
+      initial = token[0]
+      start_loc = (row, start - line_start)
+
+      if is_name_start(initial) and token[-1] not in _QUOTE_END_CHARS:
+        yield (TOKENS.NAME, token, start_loc, (row, pos - line_start))
+      elif (initial in _NUMBER_CHARS or
+            (initial == '.' and token != '.' and token != '...')):
+        yield (TOKENS.NUMBER, token, start_loc, (row, pos - line_start))
+      elif initial in _NEWLINE_CHARS:
+        yield (TOKENS.NL if paren_level else TOKENS.NEWLINE, token, start_loc,
+               (row, pos - line_start))
+      elif initial == '#':
+        yield (TOKENS.COMMENT, token, start_loc, (row, pos - line_start))
+      elif (token in triple_quoted or
+            ((initial in single_quoted or token[:2] in single_quoted or
+              token[:3] in single_quoted) and token[-1] == '\n')):
+        # A string which may continue past the end of the line. The end of a
+        # triple quoted string is searched for from the end of its opening
+        # quotes, and that of a continued string from the start of the next
+        # line.
+        if token in triple_quoted:
+          end_pattern = _END_PATTERNS[token]
+        else:
+          end_pattern = (_END_PATTERNS.get(initial) or
+                         _END_PATTERNS.get(token[1]) or
+                         _END_PATTERNS.get(token[2]))
+        match = end_pattern.match(source, pos)
+        if not match:
+          raise tokenize.TokenError('EOF in multi-line string', start_loc)
+        pos = match.end()
+        newlines = source.count('\n', start, pos)
+        if newlines:
+          row += newlines
+          line_start = source.rfind('\n', start, pos) + 1
+          eol = source.find('\n', pos) + 1 or len_source
+        yield (TOKENS.STRING, source[start:pos], start_loc,
+               (row, pos - line_start))
+      elif (initial in single_quoted or token[:2] in single_quoted or
+            token[:3] in single_quoted):
+        yield (TOKENS.STRING, token, start_loc, (row, pos - line_start))
+      elif initial == '\\':
+        continued = True
+      else:
+        if initial in _OPEN_CHARS:
+          paren_level += 1
+        elif initial in _CLOSE_CHARS:
+          paren_level -= 1
+        yield (TOKENS.OP, token, start_loc, (row, pos - line_start))
+
+  for _ in indents[1:]:
+    yield (TOKENS.DEDENT, '', (row, 0), (row, 0))
+  yield (TOKENS.ENDMARKER, '', (row, 0), (row, 0))
+
+
+def _indent_column(indent):
+  """Get the column an indentation string ends at, as counted by tokenize."""
+  if '\t' not in indent and '\f' not in indent:
+    return len(indent)
+  column = 0
+  for c in indent:
+    if c == ' ':
+      column += 1
+    elif c == '\t':
+      column = (column // tokenize.tabsize + 1) * tokenize.tabsize
+    else:
+      column = 0
+  return column
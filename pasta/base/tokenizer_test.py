@@ -0,0 +1,110 @@
+# coding=utf-8
+"""Tests for tokenizer."""
+# Copyright 2017 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import os
+import sys
+import tokenize
+import unittest
+
+import pasta
+from pasta.base import test_utils
+from pasta.base import tokenizer
+
+TESTDATA_DIR = os.path.realpath(
+    os.path.join(os.path.dirname(pasta.__file__), '../testdata'))
+
+
+def _tokenize(src):
+  return [tuple(tok[:4]) for tok in tokenizer.tokenize_tokens(src)]
+
+
+@unittest.skipIf(sys.version_info >= (3, 12),
+                 'tokenize no longer uses regular expressions.')
+class RegexTokensTest(test_utils.TestCase):
+
+  def assertTokensEqual(self, src):
+    self.assertEqual(_tokenize(src), list(tokenizer.regex_tokens(src)))
+
+  def test_testdata(self):
+    for path in glob.glob(os.path.join(TESTDATA_DIR, 'ast', '*.in')):
+      with open(path, 'r') as f:
+        src = f.read()
+      self.assertTokensEqual(src)
+
+  def test_empty(self):
+    self.assertTokensEqual('')
+
+  def test_without_final_newline(self):
+    self.assertTokensEqual('if a:\n  b = 1')
+    self.assertTokensEqual('if a:\n  b = 1  # comment')
+    self.assertTokensEqual('a\n# comment')
+
+  def test_final_indentation(self):
+    self.assertTokensEqual('if a:\n  b\n  ')
+    self.assertTokensEqual('  ')
+
+  def test_multi_line_strings(self):
+    self.assertTokensEqual('x = """a\\\nb\n"""  # comment\ny = 1\n')
+    self.assertTokensEqual("x = rb'''a\n''' + 'b\\\nc' + 1\n")
+
+  def test_continued_lines(self):
+    self.assertTokensEqual('x = (1,\n     # comment\n\n     2)\n')
+    self.assertTokensEqual('x = 1 + \\\n    2\n')
+
+  def test_indentation(self):
+    self.assertTokensEqual('if a:\n\tif b:\n\t\tc\n  \td\n')
+    self.assertTokensEqual('if a:\n\f  b\nc\n')
+
+  def test_line_endings(self):
+    self.assertTokensEqual('a = 1\r\nb = 2  # comment\r\n\r\n')
+
+  def test_numbers(self):
+    self.assertTokensEqual('x = 1.5 + .5 + 1e3 + 0x1f + a[...]\n')
+
+  def test_error_token(self):
+    self.assertTokensEqual('a = $b\n')
+
+  def test_eof_in_statement(self):
+    with self.assertRaises(tokenize.TokenError):
+      list(tokenizer.regex_tokens('x = (1,\n'))
+
+  def test_eof_in_string(self):
+    with self.assertRaises(tokenize.TokenError):
+      list(tokenizer.regex_tokens('x = """a\n'))
+
+  def test_parse(self):
+    src = 'def f(a):  # comment\n  """Doc."""\n  return (a +\n          1)\n'
+    t = pasta.parse(src, tokenizer=tokenizer.regex_tokens)
+    self.assertEqual(src, pasta.dump(t))
+    self.assertEqual(
+        pasta.dump(pasta.parse(src)),
+        pasta.dump(pasta.parse(src, lazy_annotation=True,
+                               tokenizer=tokenizer.regex_tokens)))
+
+
+def suite():
+  result = unittest.TestSuite()
+  result.addTests(unittest.makeSuite(RegexTokensTest))
+  return result
+
+
+if __name__ == '__main__':
+  unittest.main()